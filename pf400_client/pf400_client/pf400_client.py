@@ -8,8 +8,10 @@ from rclpy.executors import MultiThreadedExecutor, SingleThreadedExecutor
 from std_msgs.msg import String
 from std_srvs.srv import Empty
 
-from time import sleep
+from time import sleep, perf_counter
+from contextlib import contextmanager
 import json
+import os
 
 from threading import Thread
 
@@ -18,8 +20,14 @@ from wei_services.srv import WeiActions
 
 from pf400_driver.errors import ConnectionException, CommandException
 from pf400_driver.pf400_driver import PF400
+from pf400_driver.pf400_transport import TelnetTransport, RecordingTransport
+from pf400_driver.pf400_labware import load_labware
+from pf400_driver.pf400_prepositioner import Prepositioner
+from pf400_driver.pf400_journal import StepJournal
+from pf400_driver.pf400_kinematics import KINEMATICS
+from pf400_driver.pf400_workcell_map import default_map_file, workcell_fingerprint, load_workcell_map
 # from pf400_driver.errors import ConnectionException, CommandException
-from pf400_driver.pf400_camera_driver import PF400_CAMERA
+# PF400_CAMERA (OpenCV and the webcams) is imported on first use, see get_module_explorer
 
 class PF400Client(Node):
     '''
@@ -45,12 +53,36 @@ class PF400Client(Node):
         # Setting temporary default parameter values        
         self.declare_parameter("ip","127.0.0.1")
         self.declare_parameter("port",8085)
+        self.declare_parameter("status_port", 10000) # Status port of the robot, samples the rail during a continuous workcell sweep
+        self.declare_parameter("startup_budget", 10.0) # seconds
+        self.declare_parameter("record_file", "") # Records the command stream for replays, empty to disable
+        self.declare_parameter("lid_slots", "") # JSON list of the joint states of extra lid parking slots
+        self.declare_parameter("lid_buffer_file", os.path.join(os.path.expanduser("~"), ".pf400", "lid_buffer.json")) # Parked lids, empty to keep them in memory
+        self.declare_parameter("labware_file", "") # JSON file of extra plate types for the labware catalog
+        self.declare_parameter("preposition", True) # Moves the idle arm to the likely next source between jobs
+        self.declare_parameter("workcell_map_file", default_map_file) # Cached workcell map of explore_workcell
+        self.declare_parameter("command_timeout", 5.0) # seconds without a response before the robot connection is replaced
+        self.declare_parameter("journal_file", os.path.join(os.path.expanduser("~"), ".pf400", "transfer_journal.json")) # Steps of the running transfer, empty to keep them in memory
 
         # Receiving the real IP and PORT from the launch parameters
         self.ip =  self.get_parameter("ip").get_parameter_value().string_value
         self.port = self.get_parameter("port").get_parameter_value().integer_value
+        self.status_port = self.get_parameter("status_port").get_parameter_value().integer_value
+
+        self.startup_budget = self.get_parameter("startup_budget").get_parameter_value().double_value
+        self.record_file = self.get_parameter("record_file").get_parameter_value().string_value
+        self.lid_slots = json.loads(self.get_parameter("lid_slots").get_parameter_value().string_value or "[]")
+        self.lid_buffer_file = self.get_parameter("lid_buffer_file").get_parameter_value().string_value
+        self.workcell_map_file = self.get_parameter("workcell_map_file").get_parameter_value().string_value
+        self.labware_file = self.get_parameter("labware_file").get_parameter_value().string_value
+        self.preposition = self.get_parameter("preposition").get_parameter_value().bool_value
+        self.command_timeout = self.get_parameter("command_timeout").get_parameter_value().double_value
+        self.journal = StepJournal(self.get_parameter("journal_file").get_parameter_value().string_value or None)
 
         self.get_logger().info("Received IP: " + self.ip + " Port:" + str(self.port))
+
+        self.startup_times = {}
+        startup_start = perf_counter()
       
         self.state = "UNKNOWN"
         self.pf400_error_message = ""
@@ -59,10 +91,20 @@ class PF400Client(Node):
         self.movement_state = -1
         self.past_movement_state = -1
         self.state_refresher_timer = 0
-
-        self.connect_robot()
-        sleep(1) # Sleep till robot connection is established to start checking for state information 
-        self.stateRefresherCallback() 
+        self.module_explorer = None
+        self.status_connection = None
+        self.prepositioner = None
+        self.handled_errors = 0 # Error responses already given to the recovery engine
+        self.handled_reconnects = 0 # Reconnects after a command timeout that were already logged
+        self.description = {}
+
+        self.connect_robot() # Saves pf400_connection and initialize_robot durations into startup_times
+        with self.timed_phase("connection_settle"):
+            sleep(1) # Sleep till robot connection is established to start checking for state information 
+        with self.timed_phase("first_state_refresh"):
+            self.stateRefresherCallback() 
+        with self.timed_phase("workcell_map"):
+            self.load_workcell_map()
 
         action_cb_group = ReentrantCallbackGroup()
         description_cb_group = ReentrantCallbackGroup()
@@ -80,7 +122,126 @@ class PF400Client(Node):
         self.action_handler = self.create_service(WeiActions, node_name + "/action_handler", self.actionCallback, callback_group = action_cb_group)
         self.description_handler = self.create_service(WeiDescription, node_name + "/description_handler", self.descriptionCallback, callback_group = description_cb_group)
 
-        self.description={}
+        self.startup_times["total"] = perf_counter() - startup_start
+        self.report_startup_times()
+
+    @contextmanager
+    def timed_phase(self, phase):
+        """ Measures the duration of a startup phase and saves it into startup_times
+        """
+        phase_start = perf_counter()
+        try:
+            yield
+        finally:
+            self.startup_times[phase] = perf_counter() - phase_start
+
+    def report_startup_times(self):
+        """ Logs how the startup time is split between the phases and warns if the total is over the startup budget
+        """
+        total = self.startup_times["total"]
+        report = ", ".join("{}: {:.3f}s".format(phase, duration) for phase, duration in self.startup_times.items() if phase != "total")
+        message = "Startup took {:.3f}s of {:.1f}s budget ({})".format(total, self.startup_budget, report)
+
+        if total > self.startup_budget:
+            self.get_logger().warn(message)
+        else:
+            self.get_logger().info(message)
+
+    def claim_preposition(self, request):
+        """ Keeps the idle pre-positioning if the job starts at its station, otherwise cancels it right away
+        """
+        if self.prepositioner is None:
+            return
+
+        vars = json.loads(request.vars)
+        location = vars.get('source') if request.action_handle == "transfer" else vars.get('target')
+        if not isinstance(location, list) or len(location) != 6:
+            location = None
+
+        saved = self.prepositioner.claim(location)
+        if saved is not None:
+            self.get_logger().info("Pre-positioning saved {:.3f}s. Report: {}".format(saved, self.prepositioner.report()))
+
+    def start_preposition(self, vars, source, target):
+        """ Records the completed job and moves the idle arm towards the next source: the 'next_source' hint of the workflow,
+        or the source that usually follows this target
+        """
+        if self.prepositioner is None or self.state != "COMPLETED" or self.pf400.robot_warning.upper() not in ("CLEAR", ""):
+            return
+
+        self.prepositioner.record(source, target)
+        if self.prepositioner.start(vars.get('next_source')):
+            self.get_logger().info("Pre-positioning the arm for the next source: " + str(self.prepositioner.target))
+
+    def resume_interrupted_transfer(self):
+        """ Clears the fault of an interrupted transfer with the recovery policy of its error code and resumes the transfer from the journal.
+            Returns True if the transfer was completed.
+        """
+        # The journal is checked instead of robot_warning, which stateCallback clears
+        job = self.journal.pending()
+        if job is None or not job["interrupted"]:
+            return False
+
+        self.get_logger().warn("Transfer interrupted: " + str(job.get("reason")) + ". Recovering " + str(job.get("error_code")))
+        if self.pf400.recover_transfer():
+            self.get_logger().info("Transfer resumed. Recovery report: " + str(self.pf400.recovery.report()))
+            return True
+        self.get_logger().error("Transfer could not be recovered, call resume_transfer after fixing the robot")
+        return False
+
+    def recover_fault(self, error_code):
+        """ Runs the recovery policy of a fault found while the robot is idle. Faults of a journaled transfer are recovered by its action.
+        """
+        if self.action_flag != "READY" or self.journal.pending() is not None:
+            return
+        if self.pf400.recovery.recover(error_code):
+            self.get_logger().info("Recovered from " + str(error_code) + ". Recovery report: " + str(self.pf400.recovery.report()))
+
+    def load_workcell_map(self):
+        """ Loads the cached workcell map at startup, without OpenCV and the cameras, so that its module list and locations
+            are in the description before the first explore_workcell. The explorer loads the same file when it is created.
+        """
+        workcell_map = load_workcell_map(self.workcell_map_file, workcell_fingerprint(KINEMATICS()))
+        if workcell_map is None:
+            self.get_logger().info("No valid cached workcell map, explore_workcell runs a full exploration")
+            return
+        self.description["module_list"] = workcell_map["module_list"]
+        self.description["locations"] = workcell_map["locations"]
+        self.get_logger().info("Cached workcell map loaded: " + str(workcell_map["module_list"]))
+
+    def get_module_explorer(self):
+        """ Creates the workcell explorer on first use, so that OpenCV and the cameras are only loaded when explore_workcell is requested
+       
+         Parameters:
+        -----------
+            None
+
+        Returns
+        -------
+            PF400_CAMERA
+        """
+        if self.module_explorer is None:
+            from pf400_driver.pf400_camera_driver import PF400_CAMERA
+
+            start = perf_counter()
+            self.module_explorer = PF400_CAMERA(self.pf400, map_file = self.workcell_map_file, move_to_neutral = False)
+            self.get_logger().info("Camera support loaded in {:.3f}s".format(perf_counter() - start))
+
+        # Keep the explorer on the current connection after a reconnect
+        self.module_explorer.pf400 = self.pf400
+        return self.module_explorer
+
+    def get_status_connection(self):
+        """ Connects to the status port on first use, so that a continuous workcell sweep samples the rail without the command connection.
+            Returns None if the status port cannot be reached, the sweep then polls on the command connection.
+        """
+        if self.status_connection is None:
+            try:
+                self.status_connection = PF400(self.ip, self.status_port, initialize = False) # Read-only, the power stays as it is
+                self.status_connection.command_timeout = self.command_timeout
+            except Exception as err:
+                self.get_logger().warn("Status port " + str(self.status_port) + " is not available, the sweep polls on the command connection: " + str(err))
+        return self.status_connection
 
     def connect_robot(self):
         """ Connect to the robot by calling the PF400 object from the pf400_driver
@@ -94,10 +255,36 @@ class PF400Client(Node):
             None
         """
         
+        connect_start = perf_counter()
+
         try:
-            self.pf400 = PF400(self.ip, self.port)
+            transport = None
+            if self.record_file:
+                transport = RecordingTransport(TelnetTransport(self.ip, self.port), self.record_file)
+            self.pf400 = PF400(self.ip, self.port, transport = transport)
+            self.pf400.command_timeout = self.command_timeout
+            self.handled_reconnects = 0
+            for lid_slot in self.lid_slots:
+                self.pf400.lid_buffer.add_slot(lid_slot)
+            if self.lid_buffer_file:
+                self.pf400.lid_buffer.path = self.lid_buffer_file
+                if os.path.exists(self.lid_buffer_file):
+                    self.pf400.lid_buffer.load()
+                if self.pf400.lid_buffer.parked:
+                    self.get_logger().info("Parked lids from the last run: " + str(self.pf400.lid_buffer.status()["parked"]))
+            if self.labware_file:
+                load_labware(self.labware_file, self.pf400.labware_catalog)
+            if self.prepositioner is None:
+                self.prepositioner = Prepositioner(self.pf400)
+                self.prepositioner.enabled = self.preposition
+            else:
+                self.prepositioner.robot = self.pf400 # Keeps the job history after a reconnect
+            self.pf400.journal = self.journal
+            if self.journal.pending() is not None:
+                self.get_logger().warn("Interrupted transfer in the journal, call resume_transfer to finish it: " + str(self.journal.remaining_steps()))
+            self.startup_times["pf400_connection"] = perf_counter() - connect_start
             self.pf400.initialize_robot()
-            self.module_explorer = PF400_CAMERA(self.pf400)
+            self.startup_times["initialize_robot"] = perf_counter() - connect_start - self.startup_times["pf400_connection"]
 
         except ConnectionException as error_msg:
             self.state = "PF400 CONNECTION ERROR"
@@ -108,7 +295,7 @@ class PF400Client(Node):
             self.get_logger().error(str(err))
             
         else:
-            self.get_logger().info("PF400 online")
+            self.get_logger().info("PF400 online ({:.3f}s)".format(perf_counter() - connect_start))
 
 
     def stateRefresherCallback(self):
@@ -212,12 +399,16 @@ class PF400Client(Node):
                 self.get_logger().error(msg.data)
                 return
             
+        if self.pf400.reconnects != self.handled_reconnects:
+            self.handled_reconnects = self.pf400.reconnects
+            self.get_logger().warn("Robot connection lost or no response in " + str(self.pf400.command_timeout) + "s, connection replaced (" + str(self.pf400.reconnects) + " reconnects)")
+
         # Check if robot wasn't attached to the software after recovering from Power Off state
         if self.pf400.attach_state == "-1":
             self.state = "ERROR"
             self.get_logger().warn("Robot is not attached")
             err_flag = True
-            self.pf400.force_initialize_robot()
+            self.recover_fault("-1009")
 
         # Publishing robot warning messages if the job wasn't completed successfully
         if self.pf400.robot_warning.upper() != "CLEAR" and len(self.pf400.robot_warning)>0:
@@ -228,26 +419,30 @@ class PF400Client(Node):
             self.action_flag = "READY"
 
         # Checking real robot state parameters and publishing the current state
+        idle_move = self.prepositioner is not None and self.prepositioner.active() # Cancelled when a job arrives, so the robot is still ready
         if self.movement_state == 0:
             self.state = "POWER OFF"
             err_flag = True
-            self.pf400.force_initialize_robot()
+            self.recover_fault("-1046")
             self.action_flag = "READY"
 
         elif self.pf400.robot_state == "ERROR" or self.state == "ERROR":
             self.state = "ERROR"
             err_flag = True
             self.get_logger().error(self.pf400.robot_error_msg)
+            if self.pf400.command_errors != self.handled_errors:
+                self.handled_errors = self.pf400.command_errors
+                self.recover_fault(self.pf400.robot_error_code)
             self.action_flag = "READY"
             self.state = "UNKOWN"
 
         elif self.state == "COMPLETED" and self.action_flag == "BUSY":
             self.action_flag = "READY"
 
-        elif (self.movement_state >= 1 and self.action_flag == "BUSY") or self.movement_state >= 2:
+        elif (self.movement_state >= 1 and self.action_flag == "BUSY") or (self.movement_state >= 2 and not idle_move):
             self.state = "BUSY"
 
-        elif self.movement_state == 1 and self.action_flag == "READY":
+        elif (self.movement_state == 1 or idle_move) and self.action_flag == "READY":
             self.state = "READY"
 
         msg.data = 'State: %s' % self.state
@@ -305,11 +500,22 @@ class PF400Client(Node):
             response.action_msg= message
             return response
 
+        if request.action_handle == "cancel":
+            # Answered right away, the running job stops at its next command
+            self.pf400.cancel()
+            self.get_logger().warn("Running job cancelled, robot halted")
+            response.action_response = 0
+            response.action_msg = "Cancelled"
+            return response
+
+        self.claim_preposition(request)
+
         while self.state != "READY":
             self.get_logger().warn("Waiting for PF400 to switch READY state...")
             sleep(0.2)
 
         self.action_flag = "BUSY"    
+        self.pf400.cancelled.clear() # A cancel only stops the job that was running when it came
         self.get_logger().info('Received Action: ' + request.action_handle.upper())
         sleep(self.state_refresher_period + 0.1) #Before starting the action, wait for stateRefresherCallback function to cycle for at least once to avoid data loss.
 
@@ -323,11 +529,17 @@ class PF400Client(Node):
             vars = json.loads(request.vars)
             self.get_logger().info(vars)
 
-            module_list = self.module_explorer.explore_workcell()     #Recieve the module list
+            continuous = vars.get('continuous', False) # Sweep the rail once instead of stopping at each bay
+            incremental = vars.get('incremental', True) # Only re-scan the bays that changed since the cached workcell map
+            module_explorer = self.get_module_explorer()
+            status_connection = self.get_status_connection() if continuous else None
+            self.pf400.move_all_joints_neutral()
+            module_list = module_explorer.explore_workcell(continuous = continuous, status_connection = status_connection, incremental = incremental)     #Recieve the module list
             self.get_logger().info(str(module_list))
 
-            if module_list:
-                action_response = 0
+            action_response = 0 if module_list else -1
+            self.description["module_list"] = module_list
+            self.description["locations"] = module_explorer.locations
 
             response.action_response = action_response
             response.action_msg= str(module_list)
@@ -374,21 +586,35 @@ class PF400Client(Node):
             self.get_logger().info("Source location: " + str(source))
             target = vars.get('target')
             self.get_logger().info("Target location: "+ str(target))
+            labware = vars.get('labware', 'default') # Plate type of the labware catalog
+            self.get_logger().info("Labware: " + str(labware))
             
             try:
-                self.pf400.transfer(source, target, source_plate_rotation, target_plate_rotation)
+                refused = self.journal.pending() is not None # The driver refuses new transfers while one is unfinished
+                completed = self.pf400.transfer(source, target, source_plate_rotation, target_plate_rotation, labware)
+                if not completed and not refused:
+                    completed = self.resume_interrupted_transfer()
+                warning = self.pf400.robot_warning.upper()
 
             except Exception as err:
-                response.action_msg = "Transfer failed. Error:" + err
+                response.action_msg = "Transfer failed. Error:" + str(err)
                 response.action_response = -1
                 if self.pf400.robot_warning.upper() != "CLEAR":
                     response.action_msg = self.pf400.robot_warning.upper()
                 self.state = "ERROR"
 
             else:    
-                response.action_response = 0
-                response.action_msg = "PF400 succsessfully completed a transfer"
-                self.state = "COMPLETED"
+                if not completed or warning not in ("CLEAR", ""):
+                    # Refused, interrupted without a recovery or cancelled, the plate is not on the target
+                    response.action_response = -1
+                    response.action_msg = warning if warning not in ("CLEAR", "") else "Transfer failed"
+                    self.get_logger().error("Transfer failed: " + response.action_msg)
+                    self.state = "ERROR"
+                else:
+                    response.action_response = 0
+                    response.action_msg = "PF400 succsessfully completed a transfer"
+                    self.state = "COMPLETED"
+                    self.start_preposition(vars, source, target)
 
             finally:
                 self.get_logger().info('Finished Action: ' + request.action_handle)
@@ -425,19 +651,30 @@ class PF400Client(Node):
             target = vars.get('target')
             self.get_logger().info("Target location: " + str(target))
 
-            lid_height = vars.get('lid_height', 7.0)
-            self.get_logger().info("Lid hight: " + str(lid_height))
+            labware = vars.get('labware', 'default')
+            lid_height = vars.get('lid_height') # Lid height of the plate type if not provided
+            self.get_logger().info("Labware: " + str(labware) + " Lid hight: " + str(lid_height))
+            plate_id = vars.get('plate_id') # Finds the parked lid again in replace_lid
                 
             try:
-                self.pf400.remove_lid(target, lid_height, target_plate_rotation)
+                completed = self.pf400.remove_lid(target, lid_height, target_plate_rotation, plate_id, labware)
+                warning = self.pf400.robot_warning.upper()
             except Exception as err:
                 response.action_response = -1
-                response.action_msg= "Remove lid failed. Error:" + err
+                response.action_msg= "Remove lid failed. Error:" + str(err)
                 self.state = "ERROR"
             else:    
-                response.action_response = 0
-                response.action_msg= "Remove lid successfully completed"
-                self.state = "COMPLETED"
+                if not completed or warning not in ("CLEAR", ""):
+                    # Refused (lid buffer full, rotation deck occupied, unknown labware) or no lid found on the plate
+                    response.action_response = -1
+                    response.action_msg = warning if warning not in ("CLEAR", "") else "Remove lid failed"
+                    self.get_logger().error("Remove lid failed: " + response.action_msg)
+                    self.state = "ERROR"
+                else:
+                    response.action_response = 0
+                    response.action_msg= "Remove lid successfully completed"
+                    self.state = "COMPLETED"
+                    self.start_preposition(vars, target, target)
 
             finally:
                 self.get_logger().info('Finished Action: ' + request.action_handle)
@@ -472,31 +709,74 @@ class PF400Client(Node):
                 target_plate_rotation = str(vars.get('target_plate_rotation'))
             
 
+            labware = vars.get('labware', 'default')
+
             if 'lid_height' not in vars.keys():
-                self.get_logger().info('Using defult lid hight')
-                lid_height = 7.0
+                self.get_logger().info('Using the lid hight of the labware')
+                lid_height = None
 
             else:    
                 lid_height = vars.get('lid_height')
 
-            self.get_logger().info("Lid hight: " + str(lid_height))
+            self.get_logger().info("Labware: " + str(labware) + " Lid hight: " + str(lid_height))
+            plate_id = vars.get('plate_id')
 
             try:    
-                self.pf400.replace_lid(target, lid_height, target_plate_rotation)
+                completed = self.pf400.replace_lid(target, lid_height, target_plate_rotation, plate_id, labware)
+                warning = self.pf400.robot_warning.upper()
             except Exception as err:
                 response.action_response = -1
-                response.action_msg= "Replace lid failed. Error:" + err
+                response.action_msg= "Replace lid failed. Error:" + str(err)
                 self.state = "ERROR"
             else:    
+                if not completed or warning not in ("CLEAR", ""):
+                    # Refused (no parked lid, rotation deck occupied, unknown labware) or no lid found in the slot
+                    response.action_response = -1
+                    response.action_msg = warning if warning not in ("CLEAR", "") else "Replace lid failed"
+                    self.get_logger().error("Replace lid failed: " + response.action_msg)
+                    self.state = "ERROR"
+                else:
+                    response.action_response = 0
+                    response.action_msg= "Replace lid successfully completed"
+                    self.state = "COMPLETED"
+                    self.start_preposition(vars, target, target)
+            finally:
+                self.get_logger().info('Finished Action: ' + request.action_handle)
+                return response
+
+        elif request.action_handle == "resume_transfer":
+
+            discard = vars.get('discard', False) # Drops the interrupted transfer after a manual recovery
+
+            if self.journal.pending() is None:
                 response.action_response = 0
-                response.action_msg= "Replace lid successfully completed"
+                response.action_msg = "No interrupted transfer"
                 self.state = "COMPLETED"
+                return response
+
+            try:
+                self.pf400.resume_transfer(discard)
+                if not discard:
+                    self.resume_interrupted_transfer()
+            except Exception as err:
+                response.action_response = -1
+                response.action_msg = "Resume transfer failed. Error:" + str(err)
+                self.state = "ERROR"
+            else:
+                if self.pf400.robot_warning.upper() != "CLEAR":
+                    response.action_response = -1
+                    response.action_msg = self.pf400.robot_warning.upper()
+                    self.state = "ERROR"
+                else:
+                    response.action_response = 0
+                    response.action_msg = "Interrupted transfer discarded" if discard else "Interrupted transfer completed"
+                    self.state = "COMPLETED"
             finally:
                 self.get_logger().info('Finished Action: ' + request.action_handle)
                 return response
 
         else:
-            msg = "UNKOWN ACTION REQUEST! Available actions: explore_workcell, transfer, remove_lid, replace_lid"
+            msg = "UNKOWN ACTION REQUEST! Available actions: explore_workcell, transfer, remove_lid, replace_lid, resume_transfer, cancel"
             response.action_response = -1
             response.action_msg = msg
             self.get_logger().error('Error: ' + msg)
@@ -14,6 +14,7 @@ from sensor_msgs.msg import JointState
 from std_msgs.msg import Header
 
 from pf400_driver.pf400_driver import PF400
+from pf400_driver.pf400_telemetry import TelemetryRecorder
 
 class PF400DescriptionClient(Node):
 
@@ -23,10 +24,15 @@ class PF400DescriptionClient(Node):
         timer_period = 0.1  # seconds
         self.declare_parameter("ip","127.0.0.1")
         self.declare_parameter("port",8085)
+        self.declare_parameter("telemetry_rate", 0.0) # Hz, 0 disables the telemetry recorder
+        self.declare_parameter("telemetry_file", "") # Memory-mapped telemetry buffer, empty to keep it in memory
 
         # Receiving the real IP and PORT from the launch parameters
         self.ip =  self.get_parameter("ip").get_parameter_value().string_value
         self.port = self.get_parameter("port").get_parameter_value().integer_value
+        self.telemetry_rate = self.get_parameter("telemetry_rate").get_parameter_value().double_value
+        self.telemetry_file = self.get_parameter("telemetry_file").get_parameter_value().string_value or None
+        self.telemetry = None
 
         self.get_logger().info("Received IP: " + self.ip + " Port:" + str(self.port))
         self.state = "UNKNOWN"
@@ -45,6 +51,13 @@ class PF400DescriptionClient(Node):
         try:
             self.pf400 = PF400(self.ip, self.port)
 
+            if self.telemetry_rate > 0:
+                if self.telemetry:
+                    self.telemetry.stop()
+                # Ten minutes of samples
+                self.telemetry = TelemetryRecorder(self.pf400, self.telemetry_rate, int(self.telemetry_rate * 600), self.telemetry_file)
+                self.telemetry.start()
+
         except Exception as error_msg:
             self.state = "PF400 CONNECTION ERROR"
             self.get_logger().error("------- PF400 Error message: " + str(error_msg) +  (" -------"))
@@ -84,7 +97,12 @@ class PF400DescriptionClient(Node):
         if self.state == "PF400 CONNECTION ERROR":
             return
 
-        joint_states = self.pf400.refresh_joint_state()
+        if self.telemetry:
+            joint_states = self.telemetry.latest_joint_state()
+            if joint_states is None:
+                return
+        else:
+            joint_states = self.pf400.refresh_joint_state()
         pf400_joint_msg = JointState()
         pf400_joint_msg.header = Header()
         pf400_joint_msg.header.stamp = self.get_clock().now().to_msg()
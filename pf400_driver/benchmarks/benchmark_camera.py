@@ -0,0 +1,149 @@
+#!/usr/bin/env python3
+"""
+Benchmarks of the camera driver that run without the webcams or the robot.
+
+    - detection: Frames per second of the QR detection pipeline on a frame source
+    - explore: End-to-end workcell exploration time with synthetic QR codes and a simulated rail
+
+Usage: python3 benchmark_camera.py [detection|explore|all] [--source SOURCE] [--frames N] [--mode stop|sweep|both]
+"""
+
+import argparse
+import json
+import os
+import tempfile
+import time
+
+import cv2
+
+from pf400_driver.pf400_camera_driver import PF400_CAMERA
+from pf400_driver.pf400_frame_sources import open_frame_source, SyntheticQRSource
+from pf400_driver.pf400_kinematics import KINEMATICS
+from pf400_driver.pf400_motion_profiles import motion_profiles
+
+rail_full_speed = 750.0 # mm/sec at 100% speed, robot01.pac DI 2700
+
+left_layout = ["Sciclops", "OT2_Alpha", "Sealer", "Hidex"]
+right_layout = ["OT2_Betha", "Peeler", "Azenta", "Biometra"]
+
+
+class BenchmarkArm(KINEMATICS):
+    """
+    Description: Stand-in for the PF400 connection with a rail that moves at the profile speed and no arm motion.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.movement_state = 1
+        self.rail_start = 0.0
+        self.rail_target = 0.0
+        self.move_start = 0.0
+        self.move_duration = 0.0
+
+    def rail_position(self):
+        if self.move_duration == 0:
+            return self.rail_target
+        progress = min((time.time() - self.move_start) / self.move_duration, 1.0)
+        return self.rail_start + (self.rail_target - self.rail_start) * progress
+
+    def move_one_joint(self, joint_num, target, move_pofile):
+        speed = rail_full_speed * motion_profiles[move_pofile - 1]["speed"] / 100
+        self.rail_start = self.rail_position()
+        self.rail_target = target
+        self.move_start = time.time()
+        self.move_duration = abs(target - self.rail_start) / speed
+        return "0"
+
+    def get_robot_movement_state(self):
+        self.movement_state = 2 if time.time() - self.move_start < self.move_duration else 1
+
+    def refresh_joint_state(self):
+        return [0.0, 0.0, 0.0, 0.0, 0.0, 0.0, self.rail_position() * 0.001]
+
+    def get_cartesian_coordinates(self):
+        return [0.0, 0.0, 0.0, 0.0, 0.0, 0.0]
+
+    def move_all_joints_neutral(self, target_location = None):
+        pass
+
+
+def layout_source(arm, start_location, layout):
+    """
+    Description: Synthetic camera that shows the QR code of the bay in front of it.
+    """
+    def visible_module():
+        rail = arm.rail_position()
+        for bay, bay_rail in enumerate(start_location):
+            if abs(rail - bay_rail) < 150:
+                return layout[bay]
+        return ""
+    return SyntheticQRSource(visible_module)
+
+
+def benchmark_detection(source, frames):
+    scanner = open_frame_source(source)
+    detector = cv2.QRCodeDetector()
+
+    read_frames = 0
+    decoded = 0
+    start = time.perf_counter()
+    while read_frames < frames:
+        ret, frame = scanner.read()
+        if not ret:
+            break
+        read_frames += 1
+        data, points, straight_qrcode = detector.detectAndDecode(frame)
+        if data:
+            decoded += 1
+    duration = time.perf_counter() - start
+    scanner.release()
+
+    return {"source": str(source), "frames": read_frames, "decoded": decoded, "seconds": round(duration, 3), "fps": round(read_frames / duration, 1)}
+
+
+def benchmark_explore(mode):
+    arm = BenchmarkArm()
+    start_location = [- 990, -330, 400, 990]
+
+    with tempfile.TemporaryDirectory() as map_dir:
+        camera = PF400_CAMERA(arm, map_file = os.path.join(map_dir, "workcell_map.json"),
+                              left_source = layout_source(arm, start_location, left_layout),
+                              right_source = layout_source(arm, start_location, right_layout),
+                              move_to_neutral = False)
+
+        start = time.perf_counter()
+        module_list = camera.explore_workcell(continuous = mode == "sweep", status_connection = arm)
+        duration = time.perf_counter() - start
+
+    found = sorted(name for name in module_list.values() if name != "None")
+    return {"mode": mode, "seconds": round(duration, 2), "modules_found": len(found), "modules_expected": len(left_layout + right_layout), "module_list": module_list}
+
+
+def main():
+    parser = argparse.ArgumentParser(description = "PF400 camera driver benchmarks")
+    parser.add_argument("benchmark", nargs = "?", default = "all", choices = ["detection", "explore", "all"])
+    parser.add_argument("--source", default = "qr:" + ",".join(left_layout), help = "Frame source for the detection benchmark (see open_frame_source)")
+    parser.add_argument("--frames", type = int, default = 200, help = "Number of frames for the detection benchmark")
+    parser.add_argument("--mode", default = "both", choices = ["stop", "sweep", "both"], help = "Exploration mode for the explore benchmark")
+    parser.add_argument("--json", help = "Write the results into this file")
+    args = parser.parse_args()
+
+    results = {}
+    if args.benchmark in ("detection", "all"):
+        source = int(args.source) if args.source.isdigit() else args.source
+        results["detection"] = benchmark_detection(source, args.frames)
+        print("Detection: " + str(results["detection"]))
+
+    if args.benchmark in ("explore", "all"):
+        modes = ["stop", "sweep"] if args.mode == "both" else [args.mode]
+        results["explore"] = [benchmark_explore(mode) for mode in modes]
+        for result in results["explore"]:
+            print("Explore ({}): {} seconds, {}/{} modules found".format(result["mode"], result["seconds"], result["modules_found"], result["modules_expected"]))
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent = 4)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,242 @@
+#!/usr/bin/env python3
+"""
+Micro-benchmarks of the pure-Python hot paths of the driver, with a per-call budget.
+
+    - kinematics: forward_kinematics, inverse_kinematics, set_plate_rotation (without and with the PF400 kinematics cache)
+    - parsing: wherej/whereC response parsing, get_joint_states, get_cartesian_coordinates, refresh_joint_state
+    - commands: movej/MoveC command building, move_joint, tcp_driver.set_move_command
+
+Scalar cases measure one call. Batched cases measure a batch of BATCH inputs and report the time per item,
+with the vectorized implementation where one exists (forward_kinematics_batch, inverse_kinematics_batch, parse_joint_states_batch).
+Driver methods run on an in-process simulator, so their time includes the simulated round trips but no socket.
+
+Every case has a budget in microseconds per call (per item for batched cases) in the budgets table below.
+Budgets are about twice the time measured on a development machine (Python 3.11). --check exits with 1 if a case is over its budget.
+
+Usage: python3 benchmark_micro.py [kinematics|parsing|commands|all] [--batch N] [--check] [--json FILE]
+"""
+
+import argparse
+import json
+import random
+import sys
+import time
+
+from pf400_driver.pf400_driver import PF400
+from pf400_driver.pf400_kinematics import KINEMATICS
+from pf400_driver.pf400_protocol import (parse_joint_states, parse_cartesian_coordinates, parse_joint_states_batch,
+                                         move_joint_command, move_cartesian_command)
+from pf400_driver.pf400_simulator import SimulatorTransport
+
+# Budgets in microseconds per call, or per item for batched cases
+budgets = {
+    "forward_kinematics": 10.0,
+    "forward_kinematics_pf400": 160.0, # Includes the whereC round trip of KINEMATICS.forward_kinematics on PF400
+    "forward_kinematics_batch": 2.5,
+    "forward_kinematics_cached": 14.0,
+    "inverse_kinematics": 8.0,
+    "inverse_kinematics_batch": 1.0,
+    "set_plate_rotation": 200.0,
+    "set_plate_rotation_batch": 240.0,
+    "set_plate_rotation_cached": 15.0, # Repeated rotation of a fixed location, answered by the kinematics cache
+    "parse_joint_states": 5.0,
+    "parse_joint_states_batch": 2.5,
+    "parse_cartesian_coordinates": 5.0,
+    "get_joint_states": 150.0,
+    "get_cartesian_coordinates": 160.0,
+    "refresh_joint_state": 100.0,
+    "move_joint_command": 15.0,
+    "move_joint_command_batch": 15.0,
+    "move_cartesian_command": 8.0,
+    "move_joint": 350.0,
+    "set_move_command": 12.0,
+    "set_move_command_batch": 12.0,
+}
+
+
+# Workcell locations of the __main__ example of pf400_driver.py
+workcell_locations = [[222.0, -38.068, 335.876, 325.434, 79.923, 995.062],
+                      [201.128, -2.814, 264.373, 365.863, 79.144, 411.553],
+                      [225.521, -24.846, 244.836, 406.623, 80.967, 398.778],
+                      [163.230, -59.032, 270.965, 415.013, 129.982, -951.510],
+                      [247.999, -30.702, 275.835, 381.513, 124.830, -585.403],
+                      [161.481, 60.986, 88.774, 657.358, 124.091, -951.510],
+                      [247.0, 40.698, 38.294, 728.332, 123.077, 301.082]]
+
+
+class PureKinematics(KINEMATICS):
+    """
+    Description: KINEMATICS without a robot. Pitch and roll are fixed, so forward_kinematics has no round trip.
+    """
+
+    def get_cartesian_coordinates(self):
+        return [0.0, 0.0, 0.0, 0.0, 90.0, 180.0]
+
+
+def random_joint_states(count, seed = 0):
+    """
+    Description: Joint states within the PF400 limits that have a kinematics solution.
+    """
+    kinematics = PureKinematics()
+    generator = random.Random(seed)
+    joint_states = []
+    while len(joint_states) < count:
+        joints = [generator.uniform(2, 1160), generator.uniform(-93, 93), generator.uniform(10, 349.5),
+                  generator.uniform(-960, 960), 80.0, generator.uniform(-1000, 1000)]
+        try:
+            cartesian, phi, rail = kinematics.forward_kinematics(joints)
+            kinematics.inverse_kinematics(cartesian, phi, rail)
+        except (ValueError, UnboundLocalError):
+            continue
+        joint_states.append(joints)
+    return joint_states
+
+
+def measure(function, number, items = 1, repeat = 5):
+    """
+    Description: Best time of the repeats, in microseconds per item.
+    """
+    best = float("inf")
+    for i in range(repeat):
+        start = time.perf_counter()
+        for j in range(number):
+            function()
+        best = min(best, time.perf_counter() - start)
+    return best / (number * items) * 1e6
+
+
+def cycle(values):
+    """
+    Description: Function that returns the next value of the list on every call.
+    """
+    index = [0]
+    def next_value():
+        value = values[index[0] % len(values)]
+        index[0] += 1
+        return value
+    return next_value
+
+
+def benchmark_kinematics(robot, batch, number):
+    kinematics = PureKinematics()
+    joint_states = random_joint_states(batch)
+    solutions = [kinematics.forward_kinematics(joints) for joints in joint_states]
+    cartesian_batch, phi_batch, rail_batch = kinematics.forward_kinematics_batch(joint_states)
+    next_joints = cycle(joint_states)
+    next_solution = cycle(solutions)
+
+    # Rotations of the workcell locations that have a kinematics solution
+    rotations = []
+    for joints in workcell_locations:
+        for degree in (90, -90):
+            try:
+                robot.set_plate_rotation(list(joints), degree)
+            except ValueError:
+                continue
+            rotations.append((joints, degree))
+    next_rotation = cycle(rotations)
+
+    def set_plate_rotation():
+        joints, degree = next_rotation()
+        robot.set_plate_rotation(list(joints), degree)
+
+    def set_plate_rotation_batch():
+        for joints, degree in rotations:
+            robot.set_plate_rotation(list(joints), degree)
+
+    # Uncached cases calculate every call, the cached cases repeat the same locations
+    robot.kinematics_cache.enabled = False
+    results = {"forward_kinematics": measure(lambda: kinematics.forward_kinematics(next_joints()), number),
+               "forward_kinematics_pf400": measure(lambda: robot.forward_kinematics(next_joints()), number // 10),
+               "forward_kinematics_batch": measure(lambda: kinematics.forward_kinematics_batch(joint_states), 20, batch),
+               "inverse_kinematics": measure(lambda: kinematics.inverse_kinematics(*next_solution()), number),
+               "inverse_kinematics_batch": measure(lambda: kinematics.inverse_kinematics_batch(cartesian_batch, phi_batch, rail_batch), 20, batch),
+               "set_plate_rotation": measure(set_plate_rotation, number // 10),
+               "set_plate_rotation_batch": measure(set_plate_rotation_batch, 20, len(rotations))}
+
+    robot.kinematics_cache.enabled = True
+    next_location = cycle(workcell_locations)
+    results["forward_kinematics_cached"] = measure(lambda: robot.forward_kinematics(next_location()), number)
+    results["set_plate_rotation_cached"] = measure(set_plate_rotation, number)
+    return results
+
+
+def benchmark_parsing(robot, batch, number):
+    joint_states = random_joint_states(batch)
+    wherej_responses = ["0 " + " ".join("{:.3f}".format(joint) for joint in joints) for joints in joint_states]
+    wherec_response = robot.send_raw_command("whereC")
+    next_response = cycle(wherej_responses)
+
+    return {"parse_joint_states": measure(lambda: parse_joint_states(next_response()), number),
+            "parse_joint_states_batch": measure(lambda: parse_joint_states_batch(wherej_responses), 20, batch),
+            "parse_cartesian_coordinates": measure(lambda: parse_cartesian_coordinates(wherec_response), number),
+            "get_joint_states": measure(robot.get_joint_states, number // 10),
+            "get_cartesian_coordinates": measure(robot.get_cartesian_coordinates, number // 10),
+            "refresh_joint_state": measure(robot.refresh_joint_state, number // 10)}
+
+
+def benchmark_commands(robot, batch, number):
+    joint_states = random_joint_states(batch)
+    next_joints = cycle(joint_states)
+    cartesian = robot.get_cartesian_coordinates()
+
+    results = {"move_joint_command": measure(lambda: move_joint_command(2, next_joints()), number),
+               "move_joint_command_batch": measure(lambda: [move_joint_command(2, joints) for joints in joint_states], 20, batch),
+               "move_cartesian_command": measure(lambda: move_cartesian_command(1, cartesian), number),
+               "move_joint": measure(lambda: robot.move_joint(list(robot.neutral_joints), 2), number // 10)}
+
+    try:
+        from pf400_driver import tcp_driver
+    except (ImportError, OSError) as err:
+        # tcp_driver opens its log file in pf400_logs when it is imported
+        print("Skipping set_move_command: " + str(err))
+        return results
+
+    tcp_robot = tcp_driver.PF400.__new__(tcp_driver.PF400)
+    tcp_robot.location_dictionary = {"location_" + str(index): joints for index, joints in enumerate(joint_states)}
+    next_location = cycle(list(tcp_robot.location_dictionary))
+    results["set_move_command"] = measure(lambda: tcp_robot.set_move_command(next_location(), 2), number)
+    results["set_move_command_batch"] = measure(lambda: [tcp_robot.set_move_command(location, 2) for location in tcp_robot.location_dictionary], 20, batch)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description = "PF400 driver micro-benchmarks")
+    parser.add_argument("group", nargs = "?", default = "all", choices = ["kinematics", "parsing", "commands", "all"])
+    parser.add_argument("--batch", type = int, default = 1000, help = "Inputs per batch")
+    parser.add_argument("--number", type = int, default = 2000, help = "Calls per measurement of the scalar cases")
+    parser.add_argument("--check", action = "store_true", help = "Exit with 1 if a case is over its budget")
+    parser.add_argument("--json", help = "Write the results into this file")
+    args = parser.parse_args()
+
+    robot = PF400(transport = SimulatorTransport(), settle_scale = 0)
+
+    groups = {"kinematics": benchmark_kinematics, "parsing": benchmark_parsing, "commands": benchmark_commands}
+    selected = list(groups) if args.group == "all" else [args.group]
+
+    results = {}
+    for group in selected:
+        results.update(groups[group](robot, args.batch, args.number))
+    robot.disconnect()
+
+    over_budget = []
+    print("{:<30}{:>12}{:>12}".format("case", "us/call", "budget"))
+    for case, duration in results.items():
+        budget = budgets.get(case)
+        flag = ""
+        if budget is not None and duration > budget:
+            flag = "  OVER BUDGET"
+            over_budget.append(case)
+        print("{:<30}{:>12.3f}{:>12}{}".format(case, duration, budget if budget is not None else "-", flag))
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"results_us": results, "budgets_us": budgets, "batch": args.batch}, f, indent = 4)
+
+    if args.check and over_budget:
+        print("Over budget: " + ", ".join(over_budget))
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+"""
+Replays a recorded PF400 session to benchmark the driver without the robot.
+
+The recording is made with RecordingTransport, e.g. by starting pf400_client with the record_file parameter.
+The transfers are run through the real PF400 code paths and every command is answered from the recording,
+so the measured time is the driver's own overhead (plus the recorded round trips with --realtime).
+
+Usage: python3 benchmark_replay.py RECORDING [--transfers N] [--source J1,..,J6] [--target J1,..,J6] [--realtime] [--json FILE]
+"""
+
+import argparse
+import json
+import time
+
+from pf400_driver.pf400_driver import PF400
+from pf400_driver.pf400_transport import ReplayTransport
+
+# Locations of the __main__ example of pf400_driver.py
+sciclops = [222.0, -38.068, 335.876, 325.434, 79.923, 995.062]
+sealer = [201.128, -2.814, 264.373, 365.863, 79.144, 411.553]
+
+
+def parse_joints(text):
+    return [float(joint) for joint in text.split(",")]
+
+
+def benchmark_replay(recording, transfers, source, target, realtime = False):
+    transport = ReplayTransport(recording, realtime = realtime)
+
+    robot = PF400(transport = transport)
+    setup_round_trips = transport.round_trips
+    setup_counts = dict(transport.counts)
+
+    start = time.perf_counter()
+    cpu_start = time.process_time()
+    for i in range(transfers):
+        robot.transfer(source, target)
+    duration = time.perf_counter() - start
+    cpu = time.process_time() - cpu_start
+    robot.disconnect()
+
+    round_trips = transport.round_trips - setup_round_trips
+    counts = {verb: count - setup_counts.get(verb, 0) for verb, count in transport.counts.items()}
+    counts = {verb: round(count / transfers, 1) for verb, count in sorted(counts.items()) if count}
+
+    return {"recording": recording,
+            "realtime": realtime,
+            "transfers": transfers,
+            "seconds_per_transfer": round(duration / transfers, 6),
+            "cpu_seconds_per_transfer": round(cpu / transfers, 6),
+            "round_trips_per_transfer": round(round_trips / transfers, 1),
+            "commands_per_transfer": counts,
+            "replay_misses": transport.misses,
+            "replay_wraps": transport.wraps}
+
+
+def main():
+    parser = argparse.ArgumentParser(description = "Replay a recorded PF400 session through PF400.transfer")
+    parser.add_argument("recording", help = "JSON lines file written by RecordingTransport")
+    parser.add_argument("--transfers", type = int, default = 100, help = "Number of transfers")
+    parser.add_argument("--source", type = parse_joints, default = sciclops, help = "Source joint states, comma separated")
+    parser.add_argument("--target", type = parse_joints, default = sealer, help = "Target joint states, comma separated")
+    parser.add_argument("--realtime", action = "store_true", help = "Delay every response by its recorded round trip")
+    parser.add_argument("--json", help = "Write the results into this file")
+    args = parser.parse_args()
+
+    result = benchmark_replay(args.recording, args.transfers, args.source, args.target, args.realtime)
+    for key, value in result.items():
+        print("{}: {}".format(key, value))
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(result, f, indent = 4)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,266 @@
+#!/usr/bin/env python3
+"""
+End-to-end throughput benchmarks of the PF400 driver against the controller simulator.
+
+    - transfer: PF400.transfer between two locations
+    - rotation: PF400.transfer with a narrow to wide plate rotation on the deck
+    - lid: PF400.remove_lid followed by PF400.replace_lid
+    - client: PF400Client transfer action requests (needs rclpy and wei_services)
+
+Every scenario reports plates per hour, controller round trips per action, p50/p99 action latency and CPU time per action.
+Plates per hour are estimated at the real robot speed: the driver time measured here plus the simulated motion time.
+
+Results can be saved as a baseline and later runs compared against it:
+
+    python3 benchmark_transfer.py --save-baseline baseline.json
+    python3 benchmark_transfer.py --baseline baseline.json   # exits with 1 on a regression
+
+Usage: python3 benchmark_transfer.py [transfer|rotation|lid|client|all] [--actions N] [--transport telnet|socket|inprocess] [--time-scale S]
+"""
+
+import argparse
+import json
+import platform
+import sys
+import threading
+import time
+
+from pf400_driver.pf400_driver import PF400
+from pf400_driver.pf400_simulator import PF400Simulator, SimulatorServer, SimulatorTransport
+from pf400_driver.pf400_transport import SocketTransport, TelnetTransport
+
+# Locations of the __main__ example of pf400_driver.py
+sciclops = [222.0, -38.068, 335.876, 325.434, 79.923, 995.062]
+sealer = [201.128, -2.814, 264.373, 365.863, 79.144, 411.553]
+
+warmup_actions = 3
+
+# Metric name: True if a larger value is worse
+compared_metrics = {"p50_ms": True, "p99_ms": True, "cpu_ms_per_action": True, "round_trips_per_action": True, "plates_per_hour": False}
+
+
+def percentile(values, percent):
+    values = sorted(values)
+    index = min(max(int(percent / 100 * len(values) + 0.5) - 1, 0), len(values) - 1)
+    return values[index]
+
+
+def start_simulator(transport, time_scale):
+    """
+    Description: Creates the simulator and the PF400 transport to it.
+    Return: simulator, transport, server (None in process)
+    """
+    simulator = PF400Simulator(time_scale = time_scale, seed = 0)
+    if transport == "inprocess":
+        return simulator, SimulatorTransport(simulator), None
+
+    server = SimulatorServer(simulator, port = 0)
+    server.start()
+    host, port = server.server_address
+    if transport == "socket":
+        return simulator, SocketTransport(host, port), server
+    return simulator, TelnetTransport(host, port), server
+
+
+def scenario_actions(robot, scenario):
+    """
+    Description: Returns a function that runs one action of the scenario.
+    """
+    if scenario == "transfer":
+        return lambda: robot.transfer(sciclops, sealer)
+    if scenario == "rotation":
+        return lambda: robot.transfer(sciclops, sealer, "narrow", "wide")
+    if scenario == "lid":
+        def lid_cycle():
+            robot.remove_lid(sealer)
+            robot.replace_lid(sealer)
+        return lid_cycle
+    raise ValueError("Unknown scenario " + scenario)
+
+
+def summarize(scenario, latencies, cpu, round_trips, counts, motion_time, time_scale):
+    actions = len(latencies)
+    mean = sum(latencies) / actions
+    motion = motion_time / actions
+    # Latency without the scaled motion is the driver time, the real robot adds the full motion time
+    driver_time = max(mean - motion * time_scale, 0.0)
+    return {"scenario": scenario,
+            "actions": actions,
+            "p50_ms": round(percentile(latencies, 50) * 1000, 3),
+            "p99_ms": round(percentile(latencies, 99) * 1000, 3),
+            "mean_ms": round(mean * 1000, 3),
+            "cpu_ms_per_action": round(cpu / actions * 1000, 3),
+            "round_trips_per_action": round(round_trips / actions, 1),
+            "commands_per_action": {verb: round(count / actions, 1) for verb, count in sorted(counts.items()) if count},
+            "motion_seconds_per_action": round(motion, 2),
+            "plates_per_hour": round(3600 / (driver_time + motion), 1) if driver_time + motion > 0 else 0.0,
+            "wall_plates_per_hour": round(3600 / mean, 1)}
+
+
+def benchmark_driver(scenario, actions, transport, time_scale):
+    simulator, robot_transport, server = start_simulator(transport, time_scale)
+    robot = PF400(transport = robot_transport, settle_scale = 0)
+    run_action = scenario_actions(robot, scenario)
+
+    for i in range(warmup_actions):
+        run_action()
+
+    round_trips = robot_transport.round_trips
+    counts = dict(robot_transport.counts)
+    motion_time = simulator.motion_time
+    latencies = []
+
+    cpu_start = time.process_time()
+    for i in range(actions):
+        start = time.perf_counter()
+        run_action()
+        latencies.append(time.perf_counter() - start)
+    cpu = time.process_time() - cpu_start
+
+    counts = {verb: count - counts.get(verb, 0) for verb, count in robot_transport.counts.items()}
+    result = summarize(scenario, latencies, cpu, robot_transport.round_trips - round_trips, counts, simulator.motion_time - motion_time, time_scale)
+
+    robot.disconnect()
+    if server:
+        server.shutdown()
+        server.server_close()
+    return result
+
+
+def benchmark_client(actions, time_scale):
+    """
+    Description: Sends transfer action requests to a PF400Client connected to the simulator over telnet.
+                 The client waits a state refresh period before every action, which is part of the measured latency.
+    """
+    try:
+        import rclpy
+        from rclpy.executors import MultiThreadedExecutor
+        from wei_services.srv import WeiActions
+        from pf400_client.pf400_client import PF400Client
+    except ImportError as err:
+        return {"scenario": "client", "skipped": str(err)}
+
+    simulator = PF400Simulator(time_scale = time_scale, seed = 0)
+    server = SimulatorServer(simulator, port = 0)
+    server.start()
+    host, port = server.server_address
+
+    rclpy.init(args = ["--ros-args", "-p", "ip:=" + host, "-p", "port:=" + str(port), "-p", "startup_budget:=60.0"])
+    try:
+        client = PF400Client()
+        client.pf400.settle_scale = 0
+        executor = MultiThreadedExecutor()
+        executor.add_node(client)
+        spinner = threading.Thread(target = executor.spin, daemon = True)
+        spinner.start()
+
+        transport = client.pf400.transport
+        request = WeiActions.Request()
+        request.action_handle = "transfer"
+        request.vars = json.dumps({"source": sciclops, "target": sealer})
+
+        round_trips = transport.round_trips
+        counts = dict(transport.counts)
+        motion_time = simulator.motion_time
+        latencies = []
+        failed = 0
+
+        cpu_start = time.process_time()
+        for i in range(actions):
+            start = time.perf_counter()
+            response = client.actionCallback(request, WeiActions.Response())
+            latencies.append(time.perf_counter() - start)
+            if response.action_response != 0:
+                failed += 1
+        cpu = time.process_time() - cpu_start
+
+        counts = {verb: count - counts.get(verb, 0) for verb, count in transport.counts.items()}
+        result = summarize("client", latencies, cpu, transport.round_trips - round_trips, counts, simulator.motion_time - motion_time, time_scale)
+        result["failed"] = failed
+
+        executor.shutdown()
+        client.destroy_node()
+    finally:
+        rclpy.shutdown()
+        server.shutdown()
+        server.server_close()
+    return result
+
+
+def compare_baseline(results, baseline, tolerance):
+    """
+    Description: Compares the results with a saved baseline.
+    Return: List of regression messages
+    """
+    regressions = []
+    baseline_results = {result["scenario"]: result for result in baseline["results"]}
+    for result in results:
+        previous = baseline_results.get(result["scenario"])
+        if previous is None or "skipped" in result or "skipped" in previous:
+            continue
+        for metric, larger_is_worse in compared_metrics.items():
+            old, new = previous[metric], result[metric]
+            if old == 0:
+                continue
+            change = (new - old) / old
+            print("{:<10}{:<26}{:>12}{:>12}{:>+9.1f}%".format(result["scenario"], metric, old, new, change * 100))
+            if (change > tolerance) if larger_is_worse else (change < -tolerance):
+                regressions.append("{} {}: {} -> {} ({:+.1f}%)".format(result["scenario"], metric, old, new, change * 100))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description = "PF400 transfer throughput benchmarks against the controller simulator")
+    parser.add_argument("scenario", nargs = "?", default = "all", choices = ["transfer", "rotation", "lid", "client", "all"])
+    parser.add_argument("--actions", type = int, default = 200, help = "Measured actions per scenario")
+    parser.add_argument("--transport", default = "telnet", choices = ["telnet", "socket", "inprocess"], help = "Connection to the simulator")
+    parser.add_argument("--time-scale", type = float, default = 0.0, help = "Simulated motion time scale, 0 for instant motion")
+    parser.add_argument("--save-baseline", help = "Save the results as a baseline file")
+    parser.add_argument("--baseline", help = "Compare the results with a baseline file")
+    parser.add_argument("--tolerance", type = float, default = 0.10, help = "Relative change that counts as a regression")
+    parser.add_argument("--json", help = "Write the results into this file")
+    args = parser.parse_args()
+
+    scenarios = ["transfer", "rotation", "lid", "client"] if args.scenario == "all" else [args.scenario]
+    results = []
+    for scenario in scenarios:
+        if scenario == "client":
+            result = benchmark_client(min(args.actions, 20), args.time_scale)
+        else:
+            result = benchmark_driver(scenario, args.actions, args.transport, args.time_scale)
+        results.append(result)
+
+        if "skipped" in result:
+            print("{}: skipped ({})".format(scenario, result["skipped"]))
+        else:
+            print("{}: {} plates/hour, {} round trips/action, p50 {} ms, p99 {} ms, CPU {} ms/action".format(
+                scenario, result["plates_per_hour"], result["round_trips_per_action"], result["p50_ms"], result["p99_ms"], result["cpu_ms_per_action"]))
+
+    report = {"created": time.strftime("%Y-%m-%d %H:%M:%S"),
+              "python": platform.python_version(),
+              "machine": platform.node(),
+              "transport": args.transport,
+              "time_scale": args.time_scale,
+              "results": results}
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent = 4)
+
+    if args.save_baseline:
+        with open(args.save_baseline, "w") as f:
+            json.dump(report, f, indent = 4)
+        print("Baseline saved to " + args.save_baseline)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = compare_baseline(results, baseline, args.tolerance)
+        if regressions:
+            print("Regressions:\n  " + "\n  ".join(regressions))
+            sys.exit(1)
+        print("No regressions against " + args.baseline)
+
+
+if __name__ == "__main__":
+    main()
@@ -10,6 +10,10 @@ class CommandException(Exception):
             "Invalid command! Check if communication is open. Error type: " + err_message
         )
 
+class TimeoutException(TimeoutError):
+    def __init__(self, err_message = "error"):
+        super(TimeoutException, self).__init__("Command timed out! Check if the robot link is alive. Error type: " + err_message)
+
 class ErrorResponse(Exception):
     """Error during command execution.."""
 
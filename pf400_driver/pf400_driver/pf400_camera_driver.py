@@ -1,18 +1,36 @@
 import cv2
 
-from time import sleep
+import copy
+import math
+
+from time import sleep, time
+from bisect import bisect_left
 
 from threading import Thread
 
+from pf400_driver.pf400_frame_sources import open_frame_source
+from pf400_driver.pf400_trace import traced
+from pf400_driver.pf400_workcell_map import (default_locations, default_start_location, default_robot_reach, default_module_lenght,
+                                             default_map_file, workcell_fingerprint, save_workcell_map, load_workcell_map)
+
 class PF400_CAMERA():
 
-    def __init__(self, robot_connection):
+    def __init__(self, robot_connection, map_file:str = None, left_source = 2, right_source = 0, move_to_neutral:bool = True):
+        """
+        Description: Workcell explorer that locates the modules with the QR codes seen by two cameras.
+        Parameters:
+            - robot_connection: PF400 connection
+            - map_file: Path of the cached workcell map
+            - left_source, right_source: Frame sources of the cameras (see open_frame_source). 
+                                         V4L device index by default, a recorded video/image directory or synthetic QR codes for replay.
+            - move_to_neutral: If True, moves the arm to neutral position on startup
+        """
 
         self.pf400 = robot_connection
-        self.scanner_1 = cv2.VideoCapture(2)
+        self.scanner_1 = open_frame_source(left_source)
         # self.scanner_1.open("usb-046d_HD_Pro_Webcam_C920_806F6D8F-video-index0")
         self.detector_1 = cv2.QRCodeDetector()
-        self.scanner_2 = cv2.VideoCapture(0)
+        self.scanner_2 = open_frame_source(right_source)
         # self.scanner_2.open("usb-046d_HD_Pro_Webcam_C920_B11F1D8F-video-index0")
         self.detector_2 = cv2.QRCodeDetector()
         
@@ -21,27 +39,30 @@ class PF400_CAMERA():
         self.cam_left_qr_name = None
         self.cam_right_qr_name = None
 
+        # Decoded frames and wherej samples of the last continuous sweep
+        self.sweep_detections = []
+        self.rail_samples = []
+
         # Store joint angles
         # Make sure linear axis lenght is removed from the x axis 
 
-        self.locations = {"Sciclops": [222.0, -38.068, 335.876, 325.434, 79.923, 995.062], 
-                          "OT2_Alpha": [243.034, -31.484, 276.021, 383.640, 124.807, -585.407],
-                          "OT2_Betha": [163.230, -59.032, 270.965, 415.013, 129.982, -951.510],
-                          "Sealer": [201.128, -2.814, 264.373, 365.863, 79.144, 411.553],
-                          "Peeler": [262.550, 20.608, 119.290, 662.570, 0.0, 0],
-                          "Azenta": [201.128, -2.814, 264.373, 365.863, 79.144, 411.553],
-                          "Hidex": [262.550, 20.608, 119.290, 662.570, 0.0, 0],
-                          "Biometra": [247.0, 40.698, 38.294, 728.332, 123.077, 301.082]}
+        self.locations = copy.deepcopy(default_locations) # See pf400_workcell_map
 
         self.module_list = {1:"None",2:"None",3:"None",3:"None",4:"None",5:"None",6:"None",7:"None",8:"None"}
-        self.robot_reach = 753.0
-        self.module_lenght = 685.8      
+        self.robot_reach = default_robot_reach
+        self.module_lenght = default_module_lenght
 
         # TODO: TABLE LENGHT IS MORE THAN ARM REACH. FIND THE FURTHEST REACH AND ADD THE RAIL LENGHT ON TOP TO FILL THE GAP 685.8
         # self.start_location = self.neutral_joints 
-        self.pf400.move_all_joints_neutral()
+        if move_to_neutral:
+            self.pf400.move_all_joints_neutral()
 
-        self.start_location = [- 990, -330, 400, 990]
+        self.start_location = list(default_start_location)
+
+        # Cached workcell map. Default locations are kept to rebuild the derived locations of re-scanned bays
+        self.default_locations = copy.deepcopy(self.locations)
+        self.map_file = default_map_file if map_file is None else map_file
+        self.map_loaded = self.load_workcell_map()
 
     def scan_qr_code(self):  
         i =0
@@ -66,7 +87,24 @@ class PF400_CAMERA():
     
 
 
-    def explore_workcell(self):
+    @property
+    def trace(self):
+        """
+        Description: Trace recorder of the robot, so that explorations are recorded with its transfers.
+        """
+        return getattr(self.pf400, "trace", None)
+
+    @traced("explore_workcell", action = True)
+    def explore_workcell(self, continuous:bool = False, status_connection = None, incremental:bool = False):
+        """
+        Description: Discovers the modules in the workcell and updates their locations.
+        Parameters:
+            - continuous: If True, sweeps the rail once while both cameras stream (see sweep_workcell).
+                          If False, stops at each start_location to scan.
+            - status_connection: PF400 connection on the status port that is used to sample the rail position during a continuous sweep.
+            - incremental: If True and a cached workcell map was loaded, only the bays that disagree with the cache are re-scanned.
+        Return: module_list
+        """
 
         # TODO: Make sure that robot stops are always at the module origins
         # TODO: Find the target locations with respect to the origin locations
@@ -75,69 +113,312 @@ class PF400_CAMERA():
         # TODO: Find module lenght and update it in the code
         # TODO: Figure out how to deal with rotation offset on the -180 rotation
 
-        left_cam_data = self.cam_left_qr_name
-        right_cam_data = self.cam_right_qr_name
+        if incremental and self.map_loaded:
+            return self.update_workcell_map()
+
+        self.reset_workcell_map()
 
-        for i in range(4):
+        if continuous:
+            return self.sweep_workcell(status_connection)
+
+        for i in range(len(self.start_location)):
 
             self.scan_next_row(self.start_location[i])         
-            if self.cam_left_qr_name not in self.module_list.values() and self.cam_left_qr_name in self.locations.keys():
-                self.locations[self.cam_left_qr_name][5] = self.start_location[i]
-                self.module_list[i+1] = self.cam_left_qr_name # Add the module into module list
-                left_cam_data = self.cam_left_qr_name
-                print(self.locations[self.cam_left_qr_name])
-
-            if self.cam_right_qr_name not in self.module_list.values() and self.cam_right_qr_name in self.locations.keys():
-                #TODO:Change this to a function (def reverse_module_location)
-
-                cartesian,phi,rail = self.pf400.forward_kinematics(self.locations[self.cam_right_qr_name])
-                        # print(cartesian)
-                        # print(cartesian[0] - rail)
-                if self.start_location == -990:
-                    # TODO: Need to calculate the new location considering the rail location will be at the middle of the module cart. Meaning rail cannot move.
-                    pass
-                elif self.start_location == 990:
-                    # Robot rail at the maximum reach, therefore keep the rail at the same location and calculate the new location with the robot arm only
-                    target_on_x_without_rail = cartesian[0] - rail
-                    reverse_target_on_x_axis = self.module_lenght - target_on_x_without_rail
-
-                            # print(reverse_target_on_x_axis)
-                    cartesian[0] = reverse_target_on_x_axis + self.start_location[i] 
-                    cartesian[1] = -cartesian[1] #Switch arm from left to right on y axis
-                    cartesian[3] -= 180 
-                            # print(cartesian[2])
-                            # print(self.start_location[5])
-                            # print(cartesian)
-                    self.locations[self.cam_right_qr_name] = self.pf400.inverse_kinematics(cartesian_coordinates = cartesian, phi = phi, rail = self.start_location[i])
-                    pass
-                else:
-                    target_on_x_without_rail = cartesian[0] - rail
-                    reverse_target_on_x_axis = self.module_lenght - target_on_x_without_rail
-                    rail_travel = reverse_target_on_x_axis - target_on_x_without_rail # Find the lenght in between new target location and old target location
-                    #Only the rail location will change to move the new target location. Isolated rail location at origin is considered 0. Robot can move to new location by only changing rail location.
-                    total_rail_travel = rail_travel + self.start_location[i] 
-
-                            # print(reverse_target_on_x_axis)
-                    cartesian[0] = target_on_x_without_rail + total_rail_travel # Keeping the same x axis value while setting a new value to rail to move to the new location.
-                    cartesian[1] = -cartesian[1] #Switch arm from left to right on y axis
-                    cartesian[3] -= 180 
-                            # print(cartesian[2])
-                            # print(self.start_location[5])
-                            # print(cartesian)
-                    self.locations[self.cam_right_qr_name] = self.pf400.inverse_kinematics(cartesian_coordinates = cartesian, phi = phi, rail = total_rail_travel)
-                    
-                        # print(self.locations[self.cam_right_qr_name][0])
-
-                self.locations[self.cam_right_qr_name][5] = self.start_location[i]
-                self.module_list[i+5] = self.cam_right_qr_name # Add the module into module list
-                right_cam_data = self.cam_right_qr_name
-                print(self.locations[self.cam_right_qr_name])
-            
+            self.register_module(i, "left", self.cam_left_qr_name)
+            self.register_module(i, "right", self.cam_right_qr_name)
 
         print("Workcell exploration completed")
+        self.save_workcell_map()
+
+        return self.module_list
+
+    def register_module(self, bay:int, side:str, module_name):
+        """
+        Description: Adds a discovered module into the module list and moves its location to the rail position of the bay.
+        Parameters:
+            - bay: Index of the bay in start_location
+            - side: "left" or "right", the camera that has seen the module
+            - module_name: QR code name of the module
+        Return: True if the module was added, False if the module is unknown or already in the module list
+        """
+        if module_name in self.module_list.values() or module_name not in self.locations.keys():
+            return False
+
+        rail_loc = self.start_location[bay]
+
+        if side == "left":
+            self.locations[module_name][5] = rail_loc
+            self.module_list[bay+1] = module_name # Add the module into module list
+            print(self.locations[module_name])
+            return True
+
+        self.locations[module_name] = self.pf400.reverse_module_location(self.locations[module_name], rail_loc, self.module_lenght)
+        self.module_list[bay+5] = module_name # Add the module into module list
+        print(self.locations[module_name])
+        return True
+
+    def stream_qr_codes(self, scanner, detector, side:str):
+        """
+        Description: Reads frames from one camera until the sweep is over and stores every decoded QR code with the frame timestamp.
+        Parameters:
+            - scanner: Camera to read the frames from
+            - detector: QR code detector of the camera
+            - side: "left" or "right"
+        """
+        while not self.stop_camera:
+            ret, frame = scanner.read()
+            frame_time = time()
+            if not ret:
+                continue
+            data, points, straight_qrcode = detector.detectAndDecode(frame)
+            if data:
+                self.sweep_detections.append([frame_time, side, data])
+
+    def sample_rail_position(self, status_connection):
+        """
+        Description: Samples the rail position with wherej and returns the sample.
+        Parameters:
+            - status_connection: PF400 connection used for the query
+        Return: [timestamp, rail position in mm]
+        """
+        joint_states = status_connection.refresh_joint_state()
+        return [time(), joint_states[6] * 1000] # refresh_joint_state returns the rail in meters
+
+    def interpolate_rail_position(self, frame_time):
+        """
+        Description: Finds the rail position at the given time by interpolating between the wherej samples of the sweep.
+        Parameters:
+            - frame_time: Timestamp of the frame
+        Return: Rail position in mm
+        """
+        samples = self.rail_samples
+        sample_times = [sample[0] for sample in samples]
+        index = bisect_left(sample_times, frame_time)
+
+        if index == 0:
+            return samples[0][1]
+        elif index == len(samples):
+            return samples[-1][1]
+
+        t0, rail0 = samples[index - 1]
+        t1, rail1 = samples[index]
+        if t1 == t0:
+            return rail1
+        return rail0 + (rail1 - rail0) * (frame_time - t0) / (t1 - t0)
+
+    def nearest_bay(self, rail_loc):
+        """
+        Description: Finds the index of the start_location closest to the given rail position.
+        """
+        return min(range(len(self.start_location)), key = lambda i: abs(self.start_location[i] - rail_loc))
+
+    @traced("sweep_workcell", fields = ("profile",))
+    def sweep_workcell(self, status_connection = None, profile:int = 1, timeout:float = 60.0):
+        """
+        Description: Explores the workcell with a single rail traverse. The rail is moved continuously with moveoneaxis while both cameras stream.
+                     Every decoded frame is tagged with the rail position interpolated from the wherej samples and assigned to the nearest bay.
+                     A traverse that ends with an error response, a power off or the timeout is halted and its detections are dropped.
+        Parameters:
+            - status_connection: PF400 connection on the status port to sample wherej. If not given, the command connection is used.
+            - profile: Motion profile of the rail traverse. Slow profile gives more frames per bay.
+            - timeout: Maximum duration of the traverse in seconds
+        Return: module_list
+        """
+        if status_connection is None:
+            status_connection = self.pf400
+
+        rail_start = self.start_location[0]
+        rail_end = self.start_location[-1]
+
+        # Move to the first bay before the cameras start streaming
+        self.pf400.move_one_joint(6, rail_start, 2)
+        self.pf400.get_robot_movement_state()
+        while self.pf400.movement_state > 1:
+            self.pf400.get_robot_movement_state()
+
+        self.sweep_detections = []
+        self.rail_samples = []
+        self.stop_camera = False
+
+        camera_threads = [Thread(target = self.stream_qr_codes, args = (self.scanner_1, self.detector_1, "left"), daemon = True),
+                          Thread(target = self.stream_qr_codes, args = (self.scanner_2, self.detector_2, "right"), daemon = True)]
+        for camera_thread in camera_threads:
+            camera_thread.start()
+
+        # Start the traverse. Motion commands reply as soon as the motion starts, so the rail can be sampled until it stops.
+        sweep_start = time()
+        failure = None
+        status_connection.robot_error_msg = ""
+        self.pf400.move_one_joint(6, rail_end, profile)
+        if self.pf400.robot_state == "ERROR":
+            failure = "error " + str(self.pf400.robot_error_code)
+
+        while failure is None:
+            if time() - sweep_start > timeout:
+                failure = "timeout"
+                break
+            self.rail_samples.append(self.sample_rail_position(status_connection))
+            status_connection.get_robot_movement_state()
+
+            if status_connection.robot_error_msg:
+                failure = "error " + str(status_connection.robot_error_code)
+            elif status_connection.movement_state == 0:
+                failure = "power off"
+            elif status_connection.movement_state <= 1:
+                # The rail sample was taken before the state, sample the stopped rail once more
+                self.rail_samples.append(self.sample_rail_position(status_connection))
+                if abs(self.rail_samples[-1][1] - rail_end) >= 1.0:
+                    failure = "rail stopped before the last bay"
+                break
+
+        self.stop_camera = True
+        for camera_thread in camera_threads:
+            camera_thread.join()
+
+        if failure is not None:
+            if failure == "timeout":
+                self.pf400.halt()
+            self.pf400.robot_warning = "WORKCELL SWEEP FAILED"
+            print("Workcell sweep stopped (" + failure + "), the saved workcell map was not changed")
+            return self.module_list
+
+        # Vote for the module names seen on each bay and side
+        votes = {}
+        for frame_time, side, module_name in self.sweep_detections:
+            bay = self.nearest_bay(self.interpolate_rail_position(frame_time))
+            bay_votes = votes.setdefault((bay, side), {})
+            bay_votes[module_name] = bay_votes.get(module_name, 0) + 1
+
+        for (bay, side), bay_votes in sorted(votes.items()):
+            module_name = max(bay_votes, key = bay_votes.get)
+            if side == "left":
+                self.cam_left_qr_name = module_name
+            else:
+                self.cam_right_qr_name = module_name
+            self.register_module(bay, side, module_name)
+
+        print("Workcell sweep completed in " + str(round(time() - sweep_start, 2)) + " seconds with " + str(len(self.sweep_detections)) + " tagged frames")
+        self.save_workcell_map()
+
+        return self.module_list
+
+    def workcell_fingerprint(self):
+        """
+        Description: Fingerprint of the workcell of the explorer, see pf400_workcell_map.workcell_fingerprint.
+        """
+        return workcell_fingerprint(self.pf400, self.start_location, self.module_lenght, self.robot_reach, self.default_locations)
+
+    def save_workcell_map(self):
+        """
+        Description: Saves the module list and the derived locations with the workcell fingerprint.
+        """
+        save_workcell_map(self.map_file, self.workcell_fingerprint(), self.module_list, self.locations)
+
+    def load_workcell_map(self):
+        """
+        Description: Loads the cached workcell map if it exists and it was saved with the current fingerprint.
+        Return: True if the cached map was loaded, False otherwise
+        """
+        workcell_map = load_workcell_map(self.map_file, self.workcell_fingerprint())
+        if workcell_map is None:
+            return False
+
+        self.module_list = workcell_map["module_list"]
+        self.locations = workcell_map["locations"]
+        print("Cached workcell map loaded: " + str(self.module_list))
+        return True
+
+    def reset_workcell_map(self):
+        """
+        Description: Clears the module list and restores the default locations before a full exploration.
+        """
+        self.module_list = {bay: "None" for bay in range(1, 2 * len(self.start_location) + 1)}
+        self.locations = copy.deepcopy(self.default_locations)
+        self.cam_left_qr_name = None
+        self.cam_right_qr_name = None
+
+    def check_cached_pose(self, module_name):
+        """
+        Description: Pose sanity check of a cached location. The location has to be within the arm reach of its rail position.
+        """
+        if module_name == "None":
+            return True
+        if module_name not in self.locations:
+            return False
+        location = self.locations[module_name]
+        cartesian, phi, rail = self.pf400.forward_kinematics(location)
+        return math.hypot(cartesian[0] - rail, cartesian[1]) <= self.robot_reach
+
+    def cached_qr_name(self, module_name):
+        """
+        Description: Returns the QR code name a camera is expected to decode for a cached module list entry.
+        """
+        if module_name == "None":
+            return ""
+        return module_name
+
+    @traced("glance_bay", fields = ("bay",))
+    def glance_bay(self, bay:int):
+        """
+        Description: Moves the rail to the bay and decodes a single frame from each camera.
+        Return: QR code names seen by the left and right cameras. Empty string if nothing was decoded.
+        """
+        self.pf400.move_one_joint(6, self.start_location[bay], 2)
+        self.pf400.get_robot_movement_state()
+        while self.pf400.movement_state > 1:
+            self.pf400.get_robot_movement_state()
+
+        # Drop the frame buffered while the rail was moving
+        self.scanner_1.grab()
+        self.scanner_2.grab()
+        ret_1, frame_1 = self.scanner_1.read()
+        ret_2, frame_2 = self.scanner_2.read()
+
+        left_data = self.detector_1.detectAndDecode(frame_1)[0] if ret_1 else ""
+        right_data = self.detector_2.detectAndDecode(frame_2)[0] if ret_2 else ""
+        return left_data, right_data
+
+    def update_workcell_map(self):
+        """
+        Description: Incremental re-exploration. Every bay of the cached map gets a cheap change check (pose sanity check and a single QR glance)
+                     and only the bays that disagree with the cache are scanned again.
+        Return: module_list
+        """
+        changed_bays = []
+        seen_modules = []
+
+        for i in range(len(self.start_location)):
+            cached_left = self.module_list.get(i+1, "None")
+            cached_right = self.module_list.get(i+5, "None")
+
+            if self.check_cached_pose(cached_left) and self.check_cached_pose(cached_right):
+                left_data, right_data = self.glance_bay(i)
+                if left_data == self.cached_qr_name(cached_left) and right_data == self.cached_qr_name(cached_right):
+                    continue
+                seen_modules += [left_data, right_data]
+
+            changed_bays.append(i)
+
+        # Forget the changed bays and the modules that moved, so they can be registered again
+        for bay, module_name in list(self.module_list.items()):
+            if (bay - 1) % len(self.start_location) in changed_bays or module_name in seen_modules:
+                if module_name in self.default_locations:
+                    self.locations[module_name] = copy.deepcopy(self.default_locations[module_name])
+                self.module_list[bay] = "None"
+
+        for i in changed_bays:
+            self.cam_left_qr_name = None
+            self.cam_right_qr_name = None
+            self.scan_next_row(self.start_location[i])
+            self.register_module(i, "left", self.cam_left_qr_name)
+            self.register_module(i, "right", self.cam_right_qr_name)
+
+        print("Workcell map updated. Re-scanned bays: " + str([bay + 1 for bay in changed_bays]))
+        self.save_workcell_map()
 
         return self.module_list
 
+    @traced("scan_next_row", fields = ("rail_loc",))
     def scan_next_row(self, rail_loc=0.0):
 
         # Move to next row
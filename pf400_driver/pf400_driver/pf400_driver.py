@@ -1,23 +1,36 @@
 #!/usr/bin/env python3
 
-import telnetlib
-import threading
 import copy
 
 import math
 from operator import add
-from time import sleep
+from threading import Event, RLock
+from time import sleep, perf_counter, monotonic
 
 from pf400_driver.pf400_motion_profiles import motion_profiles
 from pf400_driver.pf400_error_codes import error_codes
-from pf400_driver.errors import ConnectionException, CommandException, ErrorResponse
+from pf400_driver.errors import CommandException, ConnectionException, ErrorResponse, TimeoutException
 from pf400_driver.pf400_output_codes import output_codes
 from pf400_driver.pf400_kinematics import KINEMATICS
+from pf400_driver.pf400_kinematics_cache import KinematicsCache
+from pf400_driver.pf400_motion_model import MotionModel
+from pf400_driver.pf400_lid_buffer import LidBuffer
+from pf400_driver.pf400_labware import labware_types, get_labware
+from pf400_driver.pf400_journal import StepJournal
+from pf400_driver.pf400_recovery import RecoveryEngine
+from pf400_driver.pf400_readiness import ReadinessCache
+from pf400_driver.pf400_io_actor import IOActor
+from pf400_driver.pf400_transport import TelnetTransport
+from pf400_driver.pf400_protocol import parse_joint_states, parse_cartesian_coordinates, move_joint_command, move_cartesian_command
+from pf400_driver.pf400_instrumentation import Instrumentation, instrumented
+from pf400_driver.pf400_trace import TraceRecorder, traced
 
 class PF400(KINEMATICS):
-	commandLock = threading.Lock()
 
-	def __init__(self, host= "146.137.240.35", port = 10100, mode = 0):
+	# Commands that start a robot motion. The controller replies when the motion starts.
+	motion_commands = ("movej", "movec", "moveoneaxis", "moveextraaxis", "graspplate", "releaseplate", "gripper", "home")
+
+	def __init__(self, host= "146.137.240.35", port = 10100, mode = 0, transport = None, settle_scale:float = 1.0, initialize:bool = True):
 		
 		"""
         Description: 
@@ -26,6 +39,13 @@ class PF400(KINEMATICS):
 			- Programs are sent to the 10x00 port (first robot port: 10100). 
 			- A program sent to robot will be executed immediately unless there is a prior operation running on the robot. 
 			- If a second motion command is sent while the referenced robot is moving, the second command is blocked and will not reply until the first motion is complete.
+			- transport: Optional transport of the commands (see pf400_transport). A telnet connection to host and port is used by default.
+			- settle_scale: Scale of the fixed waits for the robot to settle (power, attach, home). 0 skips them with a simulator.
+			- initialize: If False the robot is not powered, attached or homed and the gripper positions are not written,
+			  for a read-only status connection next to the command connection.
+			- Every command has a deadline. A response that does not arrive within command_timeout reconnects the robot and raises TimeoutException.
+			  A motion that is still running after its expected duration (motion_model) times motion_timeout_scale plus command_timeout is halted.
+			  cancel() halts the robot and makes the running job raise CommandException.
 
         """
 		super().__init__() # PF400 kinematics
@@ -35,6 +55,30 @@ class PF400(KINEMATICS):
 		self.port = port
 		self.mode = mode
 		self.connection = None
+		self.transport = transport
+		self.settle_scale = settle_scale
+		self.io = None # I/O actor that owns the connection
+		self.metrics = Instrumentation() # Disabled until metrics.enabled is set
+		self.trace = TraceRecorder() # Stopped until trace.start(path) is called
+		self.kinematics_cache = KinematicsCache() # Kinematics of the fixed locations, see kinematics_cache.stats()
+		self.readiness = ReadinessCache() # Known-good robot state, skips the state queries of force_initialize_robot
+
+		# Command deadlines
+		self.command_timeout = 5.0 # Seconds to wait for a response, a longer wait is a dead link
+		self.motion_timeout_scale = 2.0 # Allowed motion time over the expected one
+		self.default_motion_time = 30.0 # Allowed motion time when the expected one is unknown (first move, gripper, home)
+		self.motion_model = MotionModel(motion_profiles) # Expected move durations of the motion deadlines
+		self.motion_target = None # Target of the last joint move, None after any other motion
+		self.motion_deadline = None # Time (monotonic) by which the running motion must end
+		self.link_lost = False # Set by a timeout, the next command reconnects first if the reconnect failed
+		self.reconnecting = False
+		self.reconnects = 0
+		self.command_timeouts = 0
+		self.link_errors = 0 # Connections lost without a timeout (closed, reset, broken pipe)
+		self.cancelled = Event() # Set by cancel(), cleared by the next job
+		# Held by send_command from the idle check to the response, so that two threads (job, pre-positioner, state refresher)
+		# cannot both find the robot idle and send a motion. The I/O actor only keeps each command and response together.
+		self.motion_lock = RLock()
 
 		# Error code list of the PF400
 		self.error_codes = error_codes
@@ -54,23 +98,28 @@ class PF400(KINEMATICS):
 		# Initialize robot 
 		self.connect()
 		self.init_connection_mode()
-		if port == 10100:
+		if port == 10100 and initialize:
 			self.force_initialize_robot()
 		elif port == 10000:
-			self.status_port_initilization()
+			self.status_port_initilization(initialize)
 
-		sleep(2)
+		if initialize:
+			self.settle(2)
 		self.movement_state = self.get_robot_movement_state()
 		self.robot_state = "Normal"	
 		self.robot_error_msg = ""
+		self.robot_error_code = ""
 		self.robot_warning = ""
+		self.command_errors = 0 # Error responses of send_command, used to find the failed transfer step
+		self.recovery = RecoveryEngine(self) # Recovery policies per error code, see recovery.report()
 
 		# Gripper variables
 		self.gripper_open_state = 130.0
 		self.gripper_closed_state = 77.0
 		self.gripper_safe_height = 10.0
-		self.set_gripper_open()
-		self.set_gripper_close()
+		if initialize:
+			self.set_gripper_open()
+			self.set_gripper_close()
 		self.gripper_state = self.get_gripper_state()
 
 		# Arm variables
@@ -87,52 +136,206 @@ class PF400(KINEMATICS):
 		# Plate variables
 		self.plate_state = 0
 		self.plate_width = 123
+		self.labware_catalog = dict(labware_types) # Add plate types with pf400_labware.load_labware
+		self.labware = get_labware("default", self.labware_catalog)
 		self.plate_source_rotation = 0 # 90 to rotate 90 degrees
 		self.plate_target_rotation = 0 # 90 to rotate 90 degrees
 		self.plate_ratation_deck = [144.5, -26.352, 114.149, 629.002, 82.081, 995.105]
 		self.plate_lid_deck = [144.5, -26.352, 114.149, 629.002, 82.081, 995.105] 
 		self.plate_camera_deck = [90.597,26.416, 66.422, 714.811, 81.916, 995.074] 
 		self.trash_bin = [218.457, -2.408, 38.829, 683.518, 89.109, 995.074]
+		self.direct_rotation = True # Places a rotated plate with a rotated grasp when the target allows it, instead of the rotation deck
+		self.rotation_counts = {"direct": 0, "deck": 0}
+		# Lid parking slots. A lid parked on the rotation deck blocks the rotations, add slots with lid_buffer.add_slot
+		self.lid_buffer = LidBuffer([self.plate_lid_deck], blocked = [self.plate_ratation_deck])
+		# Steps of the running transfer, replace with StepJournal(path) to resume after a restart
+		self.journal = StepJournal()
  	 	
 	def connect(self):
 		"""
 		Decription: Create a streaming socket to send string commands to the robot. 
 		"""   
-		try:
-			self.connection = telnetlib.Telnet(self.host, self.port, 5)
-		except TimeoutError:
-			raise ConnectionException(err_message="Timed out error")
+		if self.transport is None:
+			self.transport = TelnetTransport(self.host, self.port, 5)
+		self.transport.connect()
+		self.connection = self.transport
+		self.readiness.invalidate("connect")
+
+		if self.io:
+			self.io.stop(wait = False, discard = True) # The old actor may still be blocked on the previous connection
+		self.io = IOActor(self.connection, "pf400_io_" + str(self.port), self.metrics)
 
 	def disconnect(self):
 		"""
         """
 		self.connection.close()
+		if self.io:
+			self.io.stop()
+			self.io = None
+
+	def settle(self, seconds:float):
+		"""
+		Decription: Waits for the robot to settle. The wait is scaled by settle_scale.
+		"""
+		if self.settle_scale > 0:
+			sleep(seconds * self.settle_scale)
+
+	def reconnect(self):
+		"""
+		Decription: Replaces the connection after a command timeout or a lost link. A half-open link never answers again, so the commands are sent on a new one.
+		"""
+		if self.reconnecting:
+			return
+		self.reconnecting = True
+		self.link_lost = True
+		try:
+			print("Robot connection lost, reconnecting...")
+			self.reconnects += 1
+			self.motion_deadline = None
+			self.motion_target = None
+			self.connection.close()
+			self.connect()
+			self.init_connection_mode()
+			self.link_lost = False
+		finally:
+			self.reconnecting = False
+
+	def check_link(self):
+		"""
+		Decription: Reconnects before the next command if the reconnect after a timeout failed
+		"""
+		if self.link_lost and not self.reconnecting:
+			self.reconnect()
+
+	def link_error(self, err):
+		"""
+		Decription: Counts a command timeout or a lost link and replaces the connection. Raises err again during a reconnect.
+		"""
+		if isinstance(err, TimeoutException):
+			self.command_timeouts += 1
+		else:
+			self.link_errors += 1
+		self.link_lost = True
+		if self.reconnecting:
+			raise err
+		self.reconnect()
+
+	def send_raw_command(self, command, timeout:float = None):
+		"""
+		Decription: Sends the command through the I/O actor without waiting for the robot motion to end
+        Parameters: 
+                - command: Command itself in string format
+                - timeout: Seconds to wait for the response, command_timeout if not given
+		Return: Response of the robot. Raises TimeoutException or ConnectionException after a reconnect if there is no response in time
+				or the link is lost, a read-only query is sent once more on the new connection.
+        """
+		timeout = self.command_timeout if timeout is None else timeout
+		self.check_link()
+		try:
+			return self.io.request(command, timeout)
+		except (TimeoutException, ConnectionException, OSError, EOFError) as err:
+			self.link_error(err)
+			if command.strip().lower() not in IOActor.coalesced_commands:
+				raise # The command may have reached the robot, sending it again is not safe
+			return self.io.request(command, timeout)
+
+	def send_raw_queries(self, commands):
+		"""
+		Decription: Queues read-only queries at once and waits for all the responses. They are sent once more on a new connection
+					after a timeout or a lost link.
+		Return: List of the responses
+		"""
+		self.check_link()
+		try:
+			requests = [self.io.submit(command, self.command_timeout) for command in commands]
+			return [self.io.wait(request, self.command_timeout) for request in requests]
+		except (TimeoutException, ConnectionException, OSError, EOFError) as err:
+			self.link_error(err)
+			requests = [self.io.submit(command, self.command_timeout) for command in commands]
+			return [self.io.wait(request, self.command_timeout) for request in requests]
+
+	def cancel(self):
+		"""
+		Decription: Stops the running job. The robot is halted and the next motion command of the job raises CommandException,
+					queries still run. A cancelled transfer is closed in the journal. The job stays cancelled until cancelled.clear() is called.
+		"""
+		self.cancelled.set()
+		self.motion_deadline = None
+		self.motion_target = None
+		try:
+			self.halt()
+		except TimeoutException:
+			self.halt() # Sent on the new connection
+
+	def check_cancelled(self, motion:bool = True):
+		if motion and self.cancelled.is_set():
+			raise CommandException(err_message="Cancelled")
+
+	def check_motion_deadline(self):
+		"""
+		Decription: Halts the robot if the running motion did not end by its deadline.
+		"""
+		if self.motion_deadline is not None and monotonic() > self.motion_deadline:
+			self.motion_deadline = None
+			self.motion_target = None
+			self.halt()
+			raise TimeoutException(err_message="Motion did not end by its deadline, robot halted")
 
-	def send_command(self, command):
+	def send_command(self, command, motion_time:float = None):
 		"""
 		Decription: Sends the commands to the robot over the socket client
         Parameters: 
                 - command: Command itself in string format
+                - motion_time: Expected duration of the motion in seconds, sets the motion deadline. default_motion_time if not given.
         """
 
-		self.commandLock.acquire()
-		
+		self.motion_lock.acquire()
+
 		try:
 			if not self.connection:
 				self.connect()	
 
+			verb = command.strip().split(" ", 1)[0].lower()
+			motion = verb in self.motion_commands
+			self.check_cancelled(motion)
+
+			tracing = self.trace.current() is not None
+			if tracing:
+				wait_start = perf_counter()
+
 			self.get_robot_movement_state()
+			state_polls = 1
 			if self.movement_state > 1:
 				# print("Waiting for robot movement to end before sending the new command")
 				while self.movement_state > 1:
+					self.check_cancelled(motion)
+					self.check_motion_deadline()
 					self.get_robot_movement_state()
+					state_polls += 1
+			self.motion_deadline = None
+
+			if self.metrics.enabled:
+				self.metrics.observe("state_polls_per_command", state_polls, bucket_scale = 1)
+				self.metrics.count("state_polls", state_polls)
+			if tracing:
+				self.trace.add_wait(perf_counter() - wait_start)
 
 			# print(">> " + command)
-			self.connection.write((command.encode("ascii") + b"\n"))
-			response = self.connection.read_until(b"\r\n").rstrip().decode("ascii")
+			self.check_cancelled(motion)
+			if motion:
+				if verb != "movej":
+					self.motion_target = None # Unknown start pose of the next joint move
+				motion_time = self.default_motion_time if motion_time is None else motion_time * self.motion_timeout_scale
+				response = self.send_raw_command(command, motion_time + self.command_timeout)
+				if response == "0":
+					self.motion_deadline = monotonic() + motion_time + self.command_timeout
+			else:
+				response = self.send_raw_command(command)
 			
 			if response != "" and response in self.error_codes:
 				self.robot_state = "ERROR"
+				self.command_errors += 1
+				self.motion_target = None
 				self.handle_error_output(response)
 				return self.robot_error_msg
 			else:
@@ -153,7 +356,7 @@ class PF400(KINEMATICS):
 			raise CommandException(err_message="Attribute Error")
 
 		finally:
-			self.commandLock.release()
+			self.motion_lock.release()
 
 	def init_connection_mode(self):
 		"""
@@ -183,6 +386,17 @@ class PF400(KINEMATICS):
 		response = ErrorResponse.from_error_code(output)
 		print(response)
 		self.robot_error_msg = response
+		self.robot_error_code = output
+		self.readiness.invalidate("error " + str(output))
+
+	def check_response(self, response, command:str):
+		"""
+		Decription: Raises CommandException for the error response of a command whose response is parsed. send_command returns
+					the ErrorResponse instead of the response string, and has already counted the error.
+		"""
+		if isinstance(response, ErrorResponse):
+			raise CommandException(err_message=command + " failed: " + str(response))
+		return response
 
 	def check_robot_state(self, wait:int = 0.1):
 		"""
@@ -200,6 +414,7 @@ class PF400(KINEMATICS):
 		Decription: Enables the power on the robot
 		"""
 
+		self.readiness.invalidate("power")
 		out_msg = self.send_command('hp 1')
 		return out_msg
 
@@ -207,6 +422,7 @@ class PF400(KINEMATICS):
 		"""
 		Decription: Disables the power on the robot
 		"""
+		self.readiness.invalidate("power")
 		out_msg = self.send_command('hp 0')
 		return out_msg
 
@@ -217,6 +433,7 @@ class PF400(KINEMATICS):
 		Parameters: 
 				- robot_id: ID number of the robot
 		"""
+		self.readiness.invalidate("attach")
 		out_msg = self.send_command("attach " + robot_id)
 		return out_msg
 
@@ -227,11 +444,18 @@ class PF400(KINEMATICS):
 		"""
 		cmd = 'home'
 
+		self.readiness.invalidate("home")
 		out_msg = self.send_command(cmd)
-		sleep(10)
+		self.settle(10)
 
 		return out_msg
 
+	def halt(self):
+		"""
+		Decription: Stops the robot motion right away, without waiting for the current motion to end. The power stays on.
+		"""
+		return self.send_raw_command("halt")
+
 
 	def initialize_robot(self):
 		"""
@@ -243,15 +467,15 @@ class PF400(KINEMATICS):
 
 		if self.power_state == "-1":
 			self.power_state = self.enable_power()
-			sleep(6)
+			self.settle(6)
 
 		if self.attach_state == "-1":
 			self.attach_state = self.attach_robot()
-			sleep(6) 
+			self.settle(6) 
 		
 		if self.home_state == "-1":
 			self.home_robot()
-			sleep(6)
+			self.settle(6)
 
 		profile = self.set_profile()
 		# self.set_gripper_open()
@@ -262,20 +486,29 @@ class PF400(KINEMATICS):
 		else:
 			print("Robot initialization failed")
 
+	@traced("force_initialize_robot")
 	def force_initialize_robot(self):
 		"""
 		Decription: Repeats the initilzation until there are no errors and the robot is initilzed.
+					Returns right away while the readiness cache holds a known-good state.
 		"""
+		if self.readiness.valid():
+			self.trace.count("readiness_cache_hits")
+			return
+
 		# Check robot state & initilize
 		if self.get_overall_state() == -1:
 			print("Robot is not intilized! Intilizing now...")
 			self.initialize_robot()
 			self.force_initialize_robot()
 
-	def status_port_initilization(self):
-
+	def status_port_initilization(self, enable_power:bool = True):
+		"""
+		Decription: Selects the robot of the status port queries. Enables the power unless the connection is read-only.
+		"""
 		self.send_command("selectRobot 1")
-		self.enable_power()
+		if enable_power:
+			self.enable_power()
 
 	def refresh_joint_state(self):
 		"""
@@ -283,24 +516,29 @@ class PF400(KINEMATICS):
         """
 
 		try:
-			self.connection.write(("wherej".encode("ascii") + b"\n"))
-			joint_array = self.connection.read_until(b"\r\n").rstrip().decode("ascii")
+			joint_array = self.send_raw_command("wherej")
 		except AttributeError:
 			raise CommandException(err_message="Attribute Error")
 		
 		if joint_array != "" and joint_array in self.error_codes:
 			self.handle_error_output(joint_array)
 
-		joint_array = joint_array.split(' ')
-		self.joint_state_position[0] = float(joint_array[1]) * 0.001 # J1, Tower
-		self.joint_state_position[1] = float(joint_array[2]) * math.pi / 180	# J2, shoulder
-		self.joint_state_position[2] = float(joint_array[3]) * math.pi / 180	# J3, elbow
-		self.joint_state_position[3] = float(joint_array[4]) * math.pi / 180	# J4, wrist
-		self.joint_state_position[4] = float(joint_array[5]) * 0.0005 # J5, gripper (urdf is 1/2 scale)
-		self.joint_state_position[5] = float(joint_array[5]) * 0.0005 # J5, gripper (urdf is 1/2 scale)
-		self.joint_state_position[6] = float(joint_array[6]) * 0.001 # J6, rail
+		joint_array = parse_joint_states(joint_array)
+		self.joint_state_position[:] = self.joint_state_to_ros(joint_array)
 		return self.joint_state_position
 
+	def joint_state_to_ros(self, joint_array):
+		"""
+        Description: Converts the six joint states of wherej (mm or deg) to the seven URDF joint states (m or rad)
+        """
+		return [joint_array[0] * 0.001, # J1, Tower
+				joint_array[1] * math.pi / 180,	# J2, shoulder
+				joint_array[2] * math.pi / 180,	# J3, elbow
+				joint_array[3] * math.pi / 180,	# J4, wrist
+				joint_array[4] * 0.0005, # J5, gripper (urdf is 1/2 scale)
+				joint_array[4] * 0.0005, # J5, gripper (urdf is 1/2 scale)
+				joint_array[5] * 0.001] # J6, rail
+
 
 	# GET COMMANDS
 
@@ -312,8 +550,7 @@ class PF400(KINEMATICS):
 				3 = Decelaration	
 		"""
 		try:
-			self.connection.write(("state".encode("ascii") + b"\n"))
-			movement_state = self.connection.read_until(b"\r\n").rstrip().decode("ascii")
+			movement_state = self.send_raw_command("state")
 		except AttributeError:
 			raise CommandException(err_message="Attribute Error")
 
@@ -322,6 +559,8 @@ class PF400(KINEMATICS):
 				self.handle_error_output(movement_state)
 			else:
 				self.movement_state = int(float(movement_state.split(" ")[1]))
+				if self.movement_state == 0:
+					self.readiness.invalidate("power off")
 		except UnboundLocalError:
 			raise CommandException(err_message="UnboundLocalError")
 
@@ -330,17 +569,9 @@ class PF400(KINEMATICS):
 			Decription: Checks general state
 			"""
 
-			self.connection.write(("hp".encode("ascii") + b"\n"))
-			power_msg = self.connection.read_until(b"\r\n").rstrip().decode("ascii").split(" ")
-
-			self.connection.write(("attach".encode("ascii") + b"\n"))
-			attach_msg = self.connection.read_until(b"\r\n").rstrip().decode("ascii").split(" ")
-
-			self.connection.write(("pd 2800".encode("ascii") + b"\n"))
-			home_msg = self.connection.read_until(b"\r\n").rstrip().decode("ascii").split(" ")
-
-			self.connection.write(("sysState".encode("ascii") + b"\n"))
-			state_msg = self.connection.read_until(b"\r\n").rstrip().decode("ascii").split(" ")
+			# Queue all four queries at once and wait for the responses
+			responses = self.send_raw_queries(("hp", "attach", "pd 2800", "sysState"))
+			power_msg, attach_msg, home_msg, state_msg = [response.split(" ") for response in responses]
 
 			if len(power_msg) == 1 or power_msg[0].find("-") != -1 or power_msg[1] == "0":
 				self.power_state = "-1"
@@ -365,28 +596,26 @@ class PF400(KINEMATICS):
 			# print("Power: " + self.power_state + " Attach: " + self.attach_state + " Home: " + self.home_state + " Robot State: " + self.initialization_state)
 
 			if self.power_state == "-1" or self.attach_state == "-1" or self.home_state == "-1" or self.initialization_state == "-1":
+				self.readiness.invalidate("not ready")
 				return -1
 			else: 
+				self.readiness.confirm()
 				return 0
 
 	def get_joint_states(self):
 		"""
         Description: Locates the robot and returns the joint locations for all 6 joints.
         """
-		states = self.send_command("wherej")
-		joints = states.split(' ')
-		joints = joints[1:] 
-		return [float(x) for x in joints]
+		states = self.check_response(self.send_command("wherej"), "wherej")
+		return parse_joint_states(states)
 
 	def get_cartesian_coordinates(self):
 		"""
         Description: This function finds the current cartesian coordinates and angles of the robot.
 		Return: A float array with x/y/z yaw/pich/roll
         """
-		coordinates = self.send_command("whereC")
-		coordinates_list = coordinates.split(' ')
-		coordinates_list = coordinates_list[1:-1]
-		return [float(x) for x in coordinates_list]
+		coordinates = self.check_response(self.send_command("whereC"), "whereC")
+		return parse_cartesian_coordinates(coordinates)
 
 	def get_gripper_lenght(self):
 		joint_angles = self.get_joint_states()
@@ -444,14 +673,44 @@ class PF400(KINEMATICS):
 	def set_gripper_close(self):
 		self.send_command("GripClosePos " + str(self.gripper_closed_state))
 
+	def kinematics_geometry(self):
+		"""
+		Description: Link lengths of the arm. Part of the kinematics cache keys, so a geometry change never returns a stale result.
+		"""
+		return (self.shoulder_length, self.elbow_length, self.end_effector_length)
+
+	def forward_kinematics(self, joint_states:list):
+		"""
+		Description: KINEMATICS.forward_kinematics through the kinematics cache. 
+					 Pitch and roll of a cached pose are the ones read from the robot on the first calculation.
+		"""
+		key = self.kinematics_cache.key("forward_kinematics", self.kinematics_geometry(), joint_states)
+		cartesian_coordinates, phi, rail = self.kinematics_cache.get(key, lambda: KINEMATICS.forward_kinematics(self, joint_states))
+		return list(cartesian_coordinates), phi, rail
+
+	def inverse_kinematics(self, cartesian_coordinates:list, phi:float, rail:float = 0.0, get_gripper_length:float = 123.0, reference_joints:list = None):
+		"""
+		Description: KINEMATICS.inverse_kinematics through the kinematics cache.
+		"""
+		reference = tuple(round(joint, 3) for joint in reference_joints) if reference_joints is not None else None
+		key = self.kinematics_cache.key("inverse_kinematics", self.kinematics_geometry(), cartesian_coordinates[:4], phi, rail, get_gripper_length, reference)
+		return list(self.kinematics_cache.get(key, lambda: KINEMATICS.inverse_kinematics(self, cartesian_coordinates, phi, rail, get_gripper_length, reference_joints)))
+
 	def set_plate_rotation(self, joint_states, rotation_degree = 0):
+		"""
+		Description: Joint states to grab the plate at the location with the gripper rotated by rotation_degree. Cached per location and rotation.
+		"""
+		key = self.kinematics_cache.key("plate_rotation", self.kinematics_geometry(), joint_states, rotation_degree)
+		return list(self.kinematics_cache.get(key, lambda: self.calculate_plate_rotation(joint_states, rotation_degree)))
+
+	def calculate_plate_rotation(self, joint_states, rotation_degree = 0):
 		"""
 		Description:
 		Parameters:
 			- joint_states:
 			- rotation_degree: 
-		Note: If the rotation requires changing the "Quadrant" on the coordinate plane, 
-				inverse kinematics calculation will be calculated wrong!
+		Note: The inverse kinematics solution closest to joint_states is used, so the elbow branch and the wrist wrap are chosen
+			  for the shortest move instead of the quadrant of the location.
 		"""
 		cartesian_coordinates, phi_angle, rail_pos = self.forward_kinematics(joint_states)
 		# print(cartesian_coordinates)
@@ -478,11 +737,18 @@ class PF400(KINEMATICS):
 		# elif (cartesian_coordinates[1] > 0 and joint_states[1] < 0) or (cartesian_coordinates[1] < 0 and joint_states[1] < 0):
 		# 	cartesian_coordinates[3] -= rotation_degree
 
-		new_joint_angles = self.inverse_kinematics(cartesian_coordinates, phi_angle, rail_pos)
+		new_joint_angles = self.inverse_kinematics(cartesian_coordinates, phi_angle, rail_pos, reference_joints = joint_states)
 
 		return new_joint_angles
 		
 	def check_incorrect_plate_orientation(self, goal_location, goal_rotation):
+		"""
+		Description: Cached calculate_plate_orientation. Returns a new list, so the caller can change the goal location.
+		"""
+		key = self.kinematics_cache.key("plate_orientation", self.kinematics_geometry(), goal_location, goal_rotation)
+		return list(self.kinematics_cache.get(key, lambda: list(self.calculate_plate_orientation(goal_location, goal_rotation))))
+
+	def calculate_plate_orientation(self, goal_location, goal_rotation):
 		"""
 		Description: Fixes plate rotation on the goal location if it was recorded with an incorrect orientation.
 		Parameters: - goal_location
@@ -500,6 +766,7 @@ class PF400(KINEMATICS):
 		return goal_location	
 
 	# MOVE COMMANDS
+	@traced("move_joint", fields = ("target_joint_angles", "profile"))
 	def move_joint(self, target_joint_angles, profile:int = 1, gripper_close: bool = False, gripper_open: bool = False):
 		"""
 		Description: Creates the movement commands with the given robot_location, profile, gripper closed and gripper open info
@@ -524,13 +791,18 @@ class PF400(KINEMATICS):
 		else:
 			target_joint_angles[4] = self.get_gripper_lenght()
 
-		move_command = "movej" + " " + str(profile) + " " + " ".join(map(str, target_joint_angles))
+		move_command = move_joint_command(profile, target_joint_angles)
+
+		motion_time = None
+		if self.motion_target is not None:
+			motion_time = self.motion_model.move_time(self.motion_target, target_joint_angles, profile)
+		self.motion_target = list(target_joint_angles)
 
-		return self.send_command(move_command)		
+		return self.send_command(move_command, motion_time)		
 
 	def move_cartesian(self, target_cartesian_coordinates, profile:int =2):
 
-		move_command = "MoveC"+ " " + str(profile) + " " + " ".join(map(str, target_cartesian_coordinates))
+		move_command = move_cartesian_command(profile, target_cartesian_coordinates)
 
 		return self.send_command(move_command)
 	
@@ -564,6 +836,7 @@ class PF400(KINEMATICS):
 
 		pass
 
+	@traced("move_in_one_axis", fields = ("profile", "axis_x", "axis_y", "axis_z"))
 	def move_in_one_axis(self,profile:int = 1, axis_x:int= 0, axis_y:int= 0, axis_z:int= 0):
 		"""
 		Desciption: Moves the end effector on single axis with a goal movement in milimeters. 
@@ -581,10 +854,11 @@ class PF400(KINEMATICS):
 		cartesian_coordinates[1] += axis_y
 		cartesian_coordinates[2] += axis_z
 
-		move_command = "MoveC"+ " " + str(profile) + " " + " ".join(map(str, cartesian_coordinates))
+		move_command = move_cartesian_command(profile, cartesian_coordinates)
 		return self.send_command(move_command)
 
-	def grab_plate(self, width: int = 123, speed:int = 100, force: int = 10):
+	@traced("grab_plate", fields = ("width", "force"))
+	def grab_plate(self, width: int = 123, speed:int = 100, force: int = 10, min_width:int = 80):
 		""" 
 		Description: 
 			Grabs the plate by appling additional force
@@ -594,11 +868,14 @@ class PF400(KINEMATICS):
 			- Force: Maximum gripper squeeze force, in Nt. 
 					 A positive value indicates the fingers must close to grasp.  
 					 A negative value indicates the fingers must open to grasp.
+			- min_width: Smallest width tried if the plate is not found. Equal to width to grasp once without a search.
 		Returns:
 			- 1: Plate grabed
 			- 0: Plate is not grabed
+			Raises CommandException on an error response.
 		"""
-		grab_plate_status = self.send_command("GraspPlate " + str(width)+ " " + str(speed) + " " + str(force)).split(" ")
+		self.trace.count("grasp_attempts")
+		grab_plate_status = self.check_response(self.send_command("GraspPlate " + str(width)+ " " + str(speed) + " " + str(force)), "GraspPlate").split(" ")
 		
 		if len(grab_plate_status) < 2:
 			return
@@ -609,12 +886,12 @@ class PF400(KINEMATICS):
 			# self.gripper_closed_state = width
 			# self.set_gripper_close()
 
-		elif grab_plate_status[1] == "0" and width > 80: # Do not try smaller width 
+		elif grab_plate_status[1] == "0" and width > min_width: # Do not try smaller width 
 			# print("No plate") 
 			width -= 1
-			self.grab_plate(width,speed,force)
+			self.grab_plate(width,speed,force,min_width)
 
-		elif width <= 80:
+		elif width <= min_width:
 			print("PLATE WAS NOT FOUND!")
 			self.robot_warning = "Missing Plate"
 			# TODO: Stop robot transfer here
@@ -622,6 +899,7 @@ class PF400(KINEMATICS):
 
 		return grab_plate_status
 
+	@traced("release_plate")
 	def release_plate(self, width: int = 130, speed:int = 100):
 		""" 
 		Description: 
@@ -632,9 +910,10 @@ class PF400(KINEMATICS):
 		Returns:
 			- release_plate_status == "0" -> Plate released
 			- release_plate_status == "1" -> Plate is not released
+			Raises CommandException on an error response.
 		"""
 
-		release_plate_status = self.send_command("ReleasePlate " + str(width)+ " " + str(speed)).split(" ")
+		release_plate_status = self.check_response(self.send_command("ReleasePlate " + str(width)+ " " + str(speed)), "ReleasePlate").split(" ")
 
 		if release_plate_status[0] == "1":
 			print("Plate is not released")
@@ -644,6 +923,7 @@ class PF400(KINEMATICS):
 
 		return release_plate_status
 
+	@traced("gripper_open")
 	def gripper_open(self):
 		""" Opens the gripper
 		"""
@@ -698,6 +978,35 @@ class PF400(KINEMATICS):
 		self.move_joint(gripper_neutral,1)
 
 
+	def set_labware(self, labware:str = "default"):
+		"""
+		Description: Selects the plate type of the next grasps, releases, lid moves and approach heights
+		Parameters:
+			- labware: Plate type of the labware catalog
+		Return: True if the plate type is in the catalog
+		"""
+		selected = get_labware(labware, self.labware_catalog)
+		if selected is None:
+			self.robot_warning = "UNKNOWN LABWARE"
+			print("Plate type " + str(labware) + " is not in the labware catalog!")
+			return False
+
+		self.labware = selected
+		self.plate_width = selected["grasp_width"]
+		self.sample_above_height = selected["above_height"]
+		self.above = [self.sample_above_height,0,0,0,0,0]
+		return True
+
+	def grasp_labware(self, width:float = None):
+		"""
+		Description: Grabs the plate with the width, speed and force of the selected plate type
+		Parameters:
+			- width: Grasp width, the plate width of the plate type if not given (e.g. the lid width)
+		"""
+		if width is None:
+			width = self.plate_width
+		return self.grab_plate(width, self.labware["grasp_speed"], self.labware["grasp_force"], width - self.labware["grasp_tolerance"])
+
 	def move_arm_neutral(self):
 		"""
         Description: Move arm to neutral position
@@ -725,6 +1034,7 @@ class PF400(KINEMATICS):
 
 		self.move_joint(self.neutral_joints,2)
 
+	@traced("move_all_joints_neutral")
 	def move_all_joints_neutral(self, target_location = None):
 		"""
         Description: Move all joints to neutral position
@@ -738,12 +1048,27 @@ class PF400(KINEMATICS):
 		# Setting the target location's linear rail position for pf400_neutral 
 		self.move_rails_neutral(target_location[0],target_location[5])
 
-	def remove_lid(self, target_loc, lid_height:float = 7.0, target_plate_rotation:str = ""):
-		"""Remove the lid from the plate"""
-		# TODO: TAKE PLATE TYPE AS A VARAIBLE TO CALCULATE LID HIGHT
+	@instrumented("remove_lid")
+	@traced("remove_lid", action = True)
+	def remove_lid(self, target_loc, lid_height:float = None, target_plate_rotation:str = "", plate_id = None, labware:str = None):
+		"""
+		Description: Removes the lid from the plate and parks it on the nearest free slot of the lid buffer
+		Parameters:
+			- target_loc: Location of the plate
+			- lid_height: Height of the lid grasp above the plate grasp, the lid height of the plate type if not given
+			- target_plate_rotation: narrow or wide
+			- plate_id: ID of the plate, used by replace_lid to find the lid. Optional if a single lid is parked at a time.
+			- labware: Plate type of the labware catalog, the selected plate type if not given
+		Return: True if the lid was parked. False otherwise, robot_warning tells why.
+		"""
 		target = copy.deepcopy(target_loc)
 		self.robot_warning = "CLEAR"
 
+		if labware and not self.set_labware(labware):
+			return False # Stopping job here
+		if lid_height is None:
+			lid_height = self.labware["lid_height"]
+
 		self.force_initialize_robot()
 
 		if target_plate_rotation.lower() == "wide":
@@ -754,25 +1079,54 @@ class PF400(KINEMATICS):
 		
 		target = self.check_incorrect_plate_orientation(target, self.plate_target_rotation)
 		target[0] += lid_height
-		self.pick_plate(target)
+
+		if self.plate_target_rotation == 90 and self.lid_buffer.blocks(self.plate_ratation_deck):
+			self.robot_warning = "ROTATION DECK OCCUPIED"
+			print("Remove Lid cannot be completed, a lid is parked on the rotation deck!")
+			return False # Stopping job here
+
+		lid_slot = self.lid_buffer.allocate(plate_id, target[5])
+		if lid_slot is None:
+			self.robot_warning = "LID BUFFER FULL"
+			print("Remove Lid cannot be completed, no free lid slot!")
+			return False # Stopping job here
+
+		self.pick_plate(target, self.labware["lid_width"])
 
 		if self.plate_state == -1: 
+			self.lid_buffer.release(plate_id)
 			self.robot_warning = "MISSING PLATE"
 			print("Remove Lid cannot be completed, missing plate!")
-			return # Stopping job here
+			return False # Stopping job here
 
 		if self.plate_target_rotation == 90:
 			# Need a transition from 90 degree to 0 degree
-			self.rotate_plate_on_deck(-self.plate_target_rotation)
+			self.rotate_plate_on_deck(-self.plate_target_rotation, self.labware["lid_width"])
 
-		self.place_plate(self.plate_lid_deck)
+		self.place_plate(lid_slot)
+		return True
 
-	def replace_lid(self, target_loc, lid_height:float = 7.0, target_plate_rotation:str = ""):
-		"""Replace the lid on the plate"""
-		# TODO: TAKE PLATE TYPE AS A VARAIBLE TO CALCULATE LID HIGHT
+	@instrumented("replace_lid")
+	@traced("replace_lid", action = True)
+	def replace_lid(self, target_loc, lid_height:float = None, target_plate_rotation:str = "", plate_id = None, labware:str = None):
+		"""
+		Description: Picks the parked lid of the plate from the lid buffer and puts it back on the plate
+		Parameters:
+			- target_loc: Location of the plate
+			- lid_height: Height of the lid grasp above the plate grasp, the lid height of the plate type if not given
+			- target_plate_rotation: narrow or wide
+			- plate_id: ID of the plate given to remove_lid
+			- labware: Plate type of the labware catalog, the selected plate type if not given
+		Return: True if the lid was put back on the plate. False otherwise, robot_warning tells why.
+		"""
 		target = copy.deepcopy(target_loc)
 		self.robot_warning = "CLEAR"
 
+		if labware and not self.set_labware(labware):
+			return False # Stopping job here
+		if lid_height is None:
+			lid_height = self.labware["lid_height"]
+
 		self.force_initialize_robot()
 
 		if target_plate_rotation.lower() == "wide":
@@ -781,31 +1135,54 @@ class PF400(KINEMATICS):
 		elif target_plate_rotation.lower() == "narrow" or target_plate_rotation == "":
 			self.plate_target_rotation = 0
 
-		self.pick_plate(self.plate_lid_deck)
+		lid_slot = self.lid_buffer.lookup(plate_id)
+		if lid_slot is None:
+			self.robot_warning = "MISSING LID"
+			print("Replace Lid cannot be completed, no parked lid for plate " + str(plate_id))
+			return False # Stopping job here
+
+		plate_id = self.lid_buffer.resolve(plate_id)
+		if self.plate_target_rotation == 90 and self.lid_buffer.blocks(self.plate_ratation_deck, ignore = (plate_id,)):
+			self.robot_warning = "ROTATION DECK OCCUPIED"
+			print("Replace Lid cannot be completed, a lid is parked on the rotation deck!")
+			return False # Stopping job here
+
+		self.pick_plate(lid_slot, self.labware["lid_width"])
 
 		if self.plate_state == -1: 
 			self.robot_warning = "MISSING PLATE"
 			print("Replace Lid cannot be completed, missing plate!")
-			return # Stopping job here
+			return False # Stopping job here
+		self.lid_buffer.release(plate_id)
 
 		if self.plate_target_rotation == 90:
 			# Need a transition from 90 degree to 0 degree
-			self.rotate_plate_on_deck(self.plate_target_rotation)
+			self.rotate_plate_on_deck(self.plate_target_rotation, self.labware["lid_width"])
 
 		target = self.check_incorrect_plate_orientation(target, self.plate_target_rotation)
 		target[0] += lid_height
 		self.place_plate(target)
+		return True
 
-	def rotate_plate_on_deck(self, rotation_degree:int):
+	@instrumented("rotate_plate_on_deck")
+	@traced("rotate_plate_on_deck", fields = ("rotation_degree",))
+	def rotate_plate_on_deck(self, rotation_degree:int, grasp_width:float = None):
 		"""
 		Description: Uses the rotation deck to rotate the plate between two transfers
 		Parameters: - rotation_degree: Rotation degree.
+					- grasp_width: Width of the grasp, the plate width of the plate type if not given
+		"""
+		self.place_plate_on_deck(rotation_degree)
+		self.pick_plate_from_deck(rotation_degree, grasp_width)
+
+	def place_plate_on_deck(self, rotation_degree:int):
 		"""
-		target = self.plate_ratation_deck
+		Description: First half of rotate_plate_on_deck. Leaves the plate on the rotation deck and opens the gripper above it.
+		"""
+		target = self.deck_rotation_poses(rotation_degree)[0]
 		
 		# Fixing the offset on the z axis
 		if rotation_degree == -90:
-			target = self.set_plate_rotation(target, -rotation_degree)
 			target[0] += 5 #Setting vertical rail 5 mm higher
 
 		abovePos = list(map(add, target, self.above))
@@ -813,31 +1190,83 @@ class PF400(KINEMATICS):
 		self.move_all_joints_neutral(target)
 		self.move_joint(abovePos, 1)
 		self.move_joint(target, 1)
-		self.release_plate()
+		self.release_plate(self.labware["release_width"])
 		self.move_in_one_axis(profile = 1, axis_x = 0, axis_y = 0, axis_z = self.sample_above_height)
 		self.gripper_open()
 
-		# Fixing the offset on the z axis for OT2
-		if rotation_degree == -90 :	
-			target[0] -= 5 #Setting vertical rail 5 mm lower
-
+	def pick_plate_from_deck(self, rotation_degree:int, grasp_width:float = None):
+		"""
+		Description: Second half of rotate_plate_on_deck. Grabs the plate on the rotation deck with the rotated gripper.
+		"""
 		# Rotating gripper to grab the plate from other rotation
-		target = self.set_plate_rotation(target, rotation_degree)
-		# print(target)
+		target = self.deck_rotation_poses(rotation_degree)[1]
 		abovePos = list(map(add, target, self.above))
 		self.move_joint(abovePos, 1)
 		self.move_joint(target, 1, False, True)
-		self.grab_plate(self.plate_width,100,10)
+		self.grasp_labware(grasp_width)
 		if self.plate_state == -1: 
 			self.robot_warning = "MISSING PLATE"
 			print("Rotation cannot be completed, missing plate!")
 		self.move_in_one_axis(profile = 1, axis_x = 0, axis_y = 0, axis_z = self.sample_above_height)
 		self.move_all_joints_neutral(target)
 
+	def deck_rotation_poses(self, rotation_degree:int):
+		"""
+		Description: Place and grasp poses of rotate_plate_on_deck on the rotation deck.
+		Return: place pose, grasp pose
+		"""
+		if rotation_degree == -90:
+			place = self.set_plate_rotation(self.plate_ratation_deck, -rotation_degree)
+			return place, self.set_plate_rotation(place, rotation_degree)
+		return list(self.plate_ratation_deck), self.set_plate_rotation(self.plate_ratation_deck, rotation_degree)
 
-	def pick_plate(self, source_location):
+	def plan_direct_rotation(self, target_location:list, rotation_degree:int):
 		"""
-        Description: 
+		Description: Plans a place on the target with the gripper rotated, so that the plate ends up with the same rotation 
+					 as after rotate_plate_on_deck(rotation_degree), without the detour to the rotation deck.
+		Parameters:
+			- target_location: Joint states of the target
+			- rotation_degree: Rotation that the deck would give (90 or -90)
+		Return: Joint states of the rotated target, None if there is no valid pose within the joint limits
+		"""
+		try:
+			deck_place, deck_grasp = self.deck_rotation_poses(rotation_degree)
+			# Yaw change of the gripper relative to the plate on the deck
+			grasp_change = self.forward_kinematics(deck_grasp)[0][3] - self.forward_kinematics(deck_place)[0][3]
+			grasp_change = (grasp_change + 180) % 360 - 180
+			if abs(abs(grasp_change) - 90) > 1:
+				return None
+
+			cartesian, phi, rail = self.forward_kinematics(target_location)
+			# set_plate_rotation adds the degree to the yaw on the right side of the robot and substracts it on the left side
+			degree = -round(grasp_change) if cartesian[1] < 0 else round(grasp_change)
+			rotated = self.set_plate_rotation(target_location, degree)
+			rotated_cartesian = self.forward_kinematics(rotated)[0]
+		except (ValueError, ZeroDivisionError, UnboundLocalError):
+			return None
+
+		# The plate turns with the gripper, so the gripper has to turn against the change of the deck
+		yaw_error = (rotated_cartesian[3] - cartesian[3] + grasp_change + 180) % 360 - 180
+		above = list(map(add, rotated, self.above))
+		if abs(yaw_error) > 1 or not self.within_joint_limits(rotated) or not self.within_joint_limits(above):
+			return None
+		return rotated
+
+	def rotation_report(self):
+		"""
+		Description: Number of rotations placed directly and on the rotation deck, and the share of avoided deck detours.
+		"""
+		total = self.rotation_counts["direct"] + self.rotation_counts["deck"]
+		return dict(self.rotation_counts, avoided = self.rotation_counts["direct"] / total if total else 0.0)
+
+	@instrumented("pick_plate")
+	@traced("pick_plate", fields = ("source_location",))
+	def pick_plate(self, source_location, grasp_width:float = None):
+		"""
+        Description: Picks the plate with the grasp of the selected plate type
+		Parameters:
+			- source_location: Location of the plate
+			- grasp_width: Width of the grasp, the plate width of the plate type if not given (e.g. the lid width)
         """
 		slow_profile = 1
 		fast_profile = 2
@@ -847,7 +1276,7 @@ class PF400(KINEMATICS):
 		self.move_all_joints_neutral(source_location)
 		self.move_joint(abovePos, fast_profile)
 		self.move_joint(source_location, fast_profile, False, True)
-		self.grab_plate(self.plate_width,100,10)
+		self.grasp_labware(grasp_width)
 		self.move_in_one_axis(profile = 1, axis_x = 0, axis_y = 0, axis_z = self.sample_above_height)
 		self.move_all_joints_neutral(source_location)
 
@@ -855,6 +1284,8 @@ class PF400(KINEMATICS):
 		# self.move_in_one_axis_from_target(target_location, profile = 2, axis_x = 60, axis_y = 0, axis_z = 60)
 		# self.move_in_one_axis_from_target(target_location, profile = 1, axis_x = 0, axis_y = 0, axis_z = 60)
 
+	@instrumented("place_plate")
+	@traced("place_plate", fields = ("target_location",))
 	def place_plate(self, target_location):
 		"""
         Description: 
@@ -867,11 +1298,13 @@ class PF400(KINEMATICS):
 		self.move_all_joints_neutral(target_location)
 		self.move_joint(abovePos, slow_profile)
 		self.move_joint(target_location, slow_profile)
-		self.release_plate()
+		self.release_plate(self.labware["release_width"])
 		self.move_in_one_axis(profile = 1, axis_x = 0, axis_y = 0, axis_z = self.sample_above_height)
 		self.move_all_joints_neutral(target_location)
 
-	def transfer(self, source_loc:list, target_loc:list, source_plate_rotation:str = "", target_plate_rotation:str= ""):
+	@instrumented("transfer")
+	@traced("transfer", action = True)
+	def transfer(self, source_loc:list, target_loc:list, source_plate_rotation:str = "", target_plate_rotation:str= "", labware:str = None):
 		"""
         Description: Plate transfer function that performs series of movements to pick and place the plates
 		Parameters: 
@@ -879,6 +1312,8 @@ class PF400(KINEMATICS):
 			- target: Target location
 			- source_plate_rotation: narrow or wide
 			- target_plate_rotation: narrow or wide 
+			- labware: Plate type of the labware catalog, the selected plate type if not given
+		Return: True if the plate was placed on the target. False if the transfer was refused, interrupted or cancelled, robot_warning tells why.
 
 		Note: Plate rotation defines the rotation of the plate on the deck, not the grabing angle.
 		
@@ -888,6 +1323,8 @@ class PF400(KINEMATICS):
 
 		self.robot_warning = "CLEAR"
 
+		if labware and not self.set_labware(labware):
+			return False # Stopping transfer here
 
 		if source_plate_rotation.lower() == "wide":
 			plate_source_rotation = 90
@@ -904,25 +1341,191 @@ class PF400(KINEMATICS):
 		source = self.check_incorrect_plate_orientation(source, plate_source_rotation)
 		target = self.check_incorrect_plate_orientation(target, plate_target_rotation)
 
-		self.force_initialize_robot()
-		self.pick_plate(source)
-
-		if self.plate_state == -1: 
-			self.robot_warning = "MISSING PLATE"
-			print("Transfer cannot be completed, missing plate!")
-			self.move_all_joints_neutral()
-			sleep(5)
-			return # Stopping transfer here
-
+		rotation = 0
 		if plate_source_rotation == 90 and plate_target_rotation == 0:
 			# Need a transition from 90 degree to 0 degree
-			self.rotate_plate_on_deck(-plate_source_rotation)
+			rotation = -plate_source_rotation
 
 		elif plate_source_rotation == 0 and plate_target_rotation == 90:
 			# Need a transition from 0 degree to 90 degree
-			self.rotate_plate_on_deck(plate_target_rotation)
+			rotation = plate_target_rotation
+
+		direct_target = None
+		if rotation and self.direct_rotation:
+			direct_target = self.plan_direct_rotation(target, rotation)
+
+		if rotation and direct_target is None and self.lid_buffer.blocks(self.plate_ratation_deck):
+			self.robot_warning = "ROTATION DECK OCCUPIED"
+			print("Transfer cannot be completed, a lid is parked on the rotation deck!")
+			return False # Stopping transfer here
+
+		if self.journal.pending() is not None:
+			self.robot_warning = "UNFINISHED TRANSFER"
+			print("Transfer cannot be started, resume or discard the interrupted transfer first!")
+			return False # Stopping transfer here
+
+		steps = [["pick", source]]
+		if direct_target is not None:
+			# The rotated grasp on the target replaces the rotation deck
+			target = direct_target
+		elif rotation:
+			deck_place, deck_grasp = self.deck_rotation_poses(rotation)
+			steps += [["deck_place", deck_place], ["deck_pick", deck_grasp]]
+		steps.append(["place", target])
 
-		self.place_plate(target)
+		self.force_initialize_robot()
+		self.journal.begin("transfer", {"rotation": rotation, "direct": direct_target is not None, "labware": self.labware["name"]}, steps)
+		return self.run_transfer_steps()
+
+	# Plate state after each transfer step
+	transfer_step_plate = {"pick": "gripper", "deck_place": "deck", "deck_pick": "gripper", "place": "target"}
+
+	def run_transfer_step(self, step:str, location:list, rotation:int):
+		if step == "pick":
+			self.pick_plate(location)
+		elif step == "deck_place":
+			self.place_plate_on_deck(rotation)
+		elif step == "deck_pick":
+			self.pick_plate_from_deck(rotation)
+		elif step == "place":
+			self.place_plate(location)
+
+	def run_transfer_steps(self):
+		"""
+		Description: Runs the remaining steps of the journaled transfer. Every step is saved as completed before the next one starts.
+					 A step with an error response or a power off stops the transfer and leaves it in the journal for resume_transfer.
+		Return: True if the transfer was completed
+		"""
+		parameters = self.journal.pending()["parameters"]
+
+		for step, location in self.journal.remaining_steps():
+			self.journal.start_step(step)
+			command_errors = self.command_errors
+			failure = None
+			try:
+				self.run_transfer_step(step, location, parameters["rotation"])
+			except (CommandException, ConnectionException, OSError) as err:
+				failure = err
+
+			if self.cancelled.is_set():
+				self.close_cancelled_transfer(step)
+				return False # Stopping transfer here
+
+			if failure or self.command_errors != command_errors or self.movement_state == 0:
+				error_code = None
+				if isinstance(failure, TimeoutException):
+					error_code = "timeout"
+				elif self.command_errors != command_errors:
+					error_code = self.robot_error_code
+				elif self.movement_state == 0:
+					error_code = "-1046" # Power off without an error response
+				self.journal.interrupt(str(failure or self.robot_error_msg), error_code)
+				self.robot_warning = "TRANSFER INTERRUPTED"
+				print("Transfer interrupted at the " + step + " step, it can be resumed after the robot is initialized.")
+				return False # Stopping transfer here
+
+			if self.plate_state == -1: 
+				self.journal.finish(completed = False)
+				self.robot_warning = "MISSING PLATE"
+				print("Transfer cannot be completed, missing plate!")
+				self.move_all_joints_neutral()
+				self.settle(5)
+				return False # Stopping transfer here
+
+			self.journal.complete_step(step, self.transfer_step_plate[step])
+
+		if parameters["direct"]:
+			self.rotation_counts["direct"] += 1
+			self.trace.count("deck_detours_avoided")
+		elif parameters["rotation"]:
+			self.rotation_counts["deck"] += 1
+
+		recovery_time = self.journal.finish()
+		if recovery_time is not None:
+			print("Interrupted transfer completed, recovery took {:.1f}s".format(recovery_time))
+		return True
+
+	def close_cancelled_transfer(self, step:str):
+		"""
+		Description: Removes a cancelled transfer from the journal, so that it does not block the next jobs. The arm is not moved after a cancel,
+					 it stays halted where it stopped. The plate state is read from the gripper and reported with the joint states.
+		"""
+		self.journal.finish(completed = False)
+		self.robot_warning = "TRANSFER CANCELLED"
+		try:
+			self.plate_state = 1 if self.holding_plate() else 0
+			print("Transfer cancelled at the " + step + " step. Plate in the gripper: " + str(self.plate_state == 1) + ", arm halted at " + str(self.get_joint_states()))
+		except (CommandException, ConnectionException, OSError) as err:
+			print("Transfer cancelled at the " + step + " step, the arm state could not be read: " + str(err))
+
+	def holding_plate(self):
+		"""
+		Description: Checks from the gripper position if it holds a plate: closed on a plate, but neither fully closed nor open.
+		"""
+		gripper = self.get_gripper_lenght()
+		return self.gripper_closed_state + 2.0 < gripper < min(self.gripper_open_state, self.labware["release_width"]) - 2.0
+
+	def retreat(self, location:list):
+		"""
+		Description: Lifts the gripper straight up to the approach height if it stopped below it at the location, so that the neutral moves are safe.
+		"""
+		current = self.get_joint_states()
+		lift = location[0] + self.sample_above_height - current[0]
+		at_location = abs(current[5] - location[5]) < 5.0 and abs(current[1] - location[1]) < 5.0 and abs(current[2] - location[2]) < 5.0
+		if at_location and lift > 1.0:
+			self.move_in_one_axis(profile = 1, axis_x = 0, axis_y = 0, axis_z = lift)
+
+	def recover_transfer(self):
+		"""
+		Description: Clears the fault that interrupted the journaled transfer with the recovery policy of its error code (see pf400_recovery),
+					 then resumes the transfer. The time to recovery is counted from the interruption.
+		Return: True if the transfer was completed, None if there was no interrupted transfer
+		"""
+		job = self.journal.pending()
+		if job is None or not job["interrupted"]:
+			return None
+		return self.recovery.recover(job.get("error_code"), self.resume_transfer, job["interrupted"])
+
+	@instrumented("resume_transfer")
+	@traced("resume_transfer", action = True)
+	def resume_transfer(self, discard:bool = False):
+		"""
+		Description: Resumes the interrupted transfer of the journal after the robot is initialized again.
+					 The plate state is read from the gripper: the interrupted step is repeated if it did not take place (e.g. no plate in the gripper
+					 after a pick), or skipped after lifting the gripper if it did. The remaining steps then run as in transfer.
+		Parameters:
+			- discard: Removes the interrupted transfer from the journal without moving the robot (after a manual recovery)
+		Return: True if the transfer was completed, False if it failed again, None if there was no transfer to resume
+		"""
+		job = self.journal.pending()
+		if job is None or job["action"] != "transfer":
+			return None
+		self.robot_warning = "CLEAR"
+
+		if discard:
+			self.journal.finish(completed = False)
+			return None
+
+		self.force_initialize_robot()
+		if not self.set_labware(job["parameters"]["labware"]):
+			return False # Stopping transfer here
+
+		remaining_steps = self.journal.remaining_steps()
+		if remaining_steps:
+			step, location = remaining_steps[0]
+			holding = self.holding_plate()
+			self.plate_state = 1 if holding else 0
+			self.retreat(location)
+
+			if holding == (step in ("pick", "deck_pick")):
+				# The step was done before the interruption
+				if step == "deck_place":
+					self.gripper_open()
+				self.journal.complete_step(step, self.transfer_step_plate[step])
+			elif step == "deck_pick":
+				self.gripper_open()
+
+		return self.run_transfer_steps()
 
 if __name__ == "__main__":
  
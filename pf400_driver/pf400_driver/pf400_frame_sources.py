@@ -0,0 +1,159 @@
+import os
+
+import cv2
+import numpy as np
+
+
+image_extensions = (".png", ".jpg", ".jpeg", ".bmp", ".tif", ".tiff")
+video_extensions = (".avi", ".mp4", ".mkv", ".mov", ".webm")
+
+
+class FrameSource():
+    """
+    Description: Base class of the frame sources used by PF400_CAMERA.
+                 A frame source behaves like cv2.VideoCapture: read() returns (ret, frame), grab() skips a frame and release() closes the source.
+    """
+
+    def read(self):
+        return False, None
+
+    def grab(self):
+        ret, frame = self.read()
+        return ret
+
+    def release(self):
+        pass
+
+
+class VideoFileSource(FrameSource):
+    """
+    Description: Replays a recorded video file.
+    Parameters:
+        - path: Path to the video file
+        - loop: If True, starts from the first frame when the video ends
+    """
+
+    def __init__(self, path:str, loop:bool = True):
+        self.path = path
+        self.loop = loop
+        self.capture = cv2.VideoCapture(path)
+
+    def read(self):
+        ret, frame = self.capture.read()
+        if not ret and self.loop:
+            self.capture.set(cv2.CAP_PROP_POS_FRAMES, 0)
+            ret, frame = self.capture.read()
+        return ret, frame
+
+    def release(self):
+        self.capture.release()
+
+
+class ImageDirectorySource(FrameSource):
+    """
+    Description: Replays the images of a directory (or a single image) in file name order. Images are decoded once and kept in memory.
+    Parameters:
+        - path: Path to the image directory or to a single image
+        - loop: If True, starts from the first image when all images were read
+    """
+
+    def __init__(self, path:str, loop:bool = True):
+        self.path = path
+        self.loop = loop
+        self.index = 0
+
+        if os.path.isdir(path):
+            image_files = [os.path.join(path, file_name) for file_name in sorted(os.listdir(path)) if file_name.lower().endswith(image_extensions)]
+        else:
+            image_files = [path]
+
+        self.frames = [cv2.imread(image_file) for image_file in image_files]
+        self.frames = [frame for frame in self.frames if frame is not None]
+
+    def read(self):
+        if self.index >= len(self.frames):
+            if not self.loop or not self.frames:
+                return False, None
+            self.index = 0
+        frame = self.frames[self.index]
+        self.index += 1
+        return True, frame.copy()
+
+
+class SyntheticQRSource(FrameSource):
+    """
+    Description: Generates frames with a QR code on a blank background. Encoded frames are cached per name.
+    Parameters:
+        - names: List of QR code names shown in turn, or a function that returns the name to show for the next frame.
+                 An empty name gives a frame without a QR code.
+        - frames_per_name: Number of frames each name of the list is shown
+        - frame_size: (height, width) of the frames. Default is the C920 resolution used on the workcell.
+        - noise: Standard deviation of the gaussian noise added to each frame. 0 returns the cached frame as is.
+    """
+
+    def __init__(self, names, frames_per_name:int = 1, frame_size:tuple = (480, 640), noise:float = 0.0):
+        self.names = names
+        self.frames_per_name = frames_per_name
+        self.frame_size = frame_size
+        self.noise = noise
+        self.index = 0
+        self.encoder = cv2.QRCodeEncoder.create()
+        self.frame_cache = {}
+
+    def next_name(self):
+        if callable(self.names):
+            return self.names()
+        if not self.names:
+            return ""
+        name = self.names[(self.index // self.frames_per_name) % len(self.names)]
+        self.index += 1
+        return name
+
+    def render(self, name:str):
+        """
+        Description: Draws the QR code of the name in the middle of a white frame.
+        """
+        height, width = self.frame_size
+        frame = np.full((height, width, 3), 255, dtype = np.uint8)
+        if name:
+            qr_code = self.encoder.encode(name)
+            size = min(height, width) // 2
+            qr_code = cv2.resize(qr_code, (size, size), interpolation = cv2.INTER_NEAREST)
+            top = (height - size) // 2
+            left = (width - size) // 2
+            frame[top:top + size, left:left + size] = cv2.cvtColor(qr_code, cv2.COLOR_GRAY2BGR)
+        return frame
+
+    def read(self):
+        name = self.next_name()
+        if name not in self.frame_cache:
+            self.frame_cache[name] = self.render(name)
+        frame = self.frame_cache[name]
+
+        if self.noise > 0:
+            noisy = frame.astype(np.int16) + np.random.normal(0, self.noise, frame.shape).astype(np.int16)
+            return True, np.clip(noisy, 0, 255).astype(np.uint8)
+        return True, frame.copy()
+
+
+def open_frame_source(source):
+    """
+    Description: Opens a frame source from a source description.
+    Parameters:
+        - source: - int: V4L device index of a camera (cv2.VideoCapture)
+                  - "qr:Name1,Name2": Synthetic QR codes
+                  - Path to an image directory, an image or a video file
+                  - An object that already has a read() function is returned as is
+    Return: Frame source
+    """
+    if hasattr(source, "read"):
+        return source
+    if isinstance(source, int):
+        return cv2.VideoCapture(source)
+    if source.startswith("qr:"):
+        return SyntheticQRSource([name for name in source[3:].split(",")])
+    if os.path.isdir(source) or source.lower().endswith(image_extensions):
+        return ImageDirectorySource(source)
+    if source.lower().endswith(video_extensions):
+        return VideoFileSource(source)
+    raise ValueError("Unknown frame source: {}".format(source))
@@ -0,0 +1,165 @@
+import json
+import math
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager, nullcontext
+from functools import wraps
+
+
+class Histogram():
+    """
+    Description: Distribution of a measured value. Keeps the totals and the most recent values to calculate percentiles.
+    Parameters:
+        - reservoir: Number of recent values kept for the percentiles
+        - bucket_scale: Scale of the values for the power of two buckets (1e6 puts seconds into microsecond buckets)
+    """
+
+    def __init__(self, reservoir:int = 10000, bucket_scale:float = 1e6):
+        self.bucket_scale = bucket_scale
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.values = deque(maxlen = reservoir)
+
+    def add(self, value:float):
+        self.count += 1
+        self.total += value
+        if value > self.max:
+            self.max = value
+        self.values.append(value)
+
+    def percentile(self, sorted_values:list, percent:float):
+        if not sorted_values:
+            return 0.0
+        index = min(int(math.ceil(percent / 100 * len(sorted_values))) - 1, len(sorted_values) - 1)
+        return sorted_values[max(index, 0)]
+
+    def summary(self):
+        sorted_values = sorted(self.values)
+        # Power of two upper bounds of the recent values
+        buckets = {}
+        for value in sorted_values:
+            bucket = 2 ** math.ceil(math.log2(max(value * self.bucket_scale, 1)))
+            buckets[bucket] = buckets.get(bucket, 0) + 1
+
+        return {"count": self.count,
+                "mean": self.total / self.count if self.count else 0.0,
+                "p50": self.percentile(sorted_values, 50),
+                "p90": self.percentile(sorted_values, 90),
+                "p99": self.percentile(sorted_values, 99),
+                "max": self.max,
+                "buckets": buckets}
+
+
+class Instrumentation():
+    """
+    Description: Low-overhead metrics of the driver hot paths.
+                 - Round trip time per command verb and the time a command waited in the I/O actor queue
+                 - Number of state polls before each command
+                 - Spans of the high-level phases (pick_plate, rotate_plate_on_deck, place_plate, transfer)
+                 Everything is skipped while disabled. The metrics can be exported as a snapshot or as a Chrome trace file (chrome://tracing, Perfetto).
+    Parameters:
+        - enabled: Start collecting immediately
+        - max_events: Number of trace events kept for the Chrome trace
+    """
+
+    def __init__(self, enabled:bool = False, max_events:int = 100000):
+        self.enabled = enabled
+        self.lock = threading.Lock()
+        self.histograms = {}
+        self.counters = {}
+        self.events = deque(maxlen = max_events)
+        self.pid = os.getpid()
+
+    def observe(self, name:str, value:float, bucket_scale:float = 1e6):
+        """
+        Description: Adds a value into the named histogram. Durations are in seconds, other values should pass bucket_scale = 1.
+        """
+        with self.lock:
+            histogram = self.histograms.get(name)
+            if histogram is None:
+                histogram = self.histograms[name] = Histogram(bucket_scale = bucket_scale)
+            histogram.add(value)
+
+    def count(self, name:str, amount:int = 1):
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + amount
+
+    def add_event(self, name:str, category:str, start:float, duration:float, args:dict = None):
+        """
+        Description: Saves a complete event for the Chrome trace. Times are perf_counter seconds.
+        """
+        self.events.append((name, category, start, duration, threading.get_ident(), args))
+
+    def record_command(self, command:str, queued:float, start:float, end:float):
+        """
+        Description: Records one command round trip of the I/O actor.
+        Parameters:
+            - command: Command that was sent
+            - queued, start, end: perf_counter times when the command was queued, written and answered
+        """
+        verb = command.split(" ", 1)[0].lower()
+        self.observe("command." + verb, end - start)
+        self.observe("queue_wait", start - queued)
+        self.add_event(verb, "io", start, end - start, {"command": command})
+
+    def span(self, name:str, **args):
+        """
+        Description: Context manager that measures a phase. Returns a shared no-op context while disabled.
+        """
+        if not self.enabled:
+            return nullcontext()
+        return self.measure_span(name, args)
+
+    @contextmanager
+    def measure_span(self, name:str, args:dict):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            end = time.perf_counter()
+            self.observe("span." + name, end - start)
+            self.add_event(name, "phase", start, end - start, args)
+
+    def snapshot(self):
+        """
+        Description: Current metrics as a dictionary.
+        """
+        with self.lock:
+            return {"histograms": {name: histogram.summary() for name, histogram in self.histograms.items()},
+                    "counters": dict(self.counters)}
+
+    def write_chrome_trace(self, path:str):
+        """
+        Description: Writes the recorded commands and spans in the Chrome trace event format.
+        """
+        trace_events = []
+        for name, category, start, duration, thread_id, args in list(self.events):
+            trace_events.append({"name": name, "cat": category, "ph": "X",
+                                 "ts": start * 1e6, "dur": duration * 1e6,
+                                 "pid": self.pid, "tid": thread_id, "args": args or {}})
+        with open(path, "w") as f:
+            json.dump({"traceEvents": trace_events, "displayTimeUnit": "ms"}, f)
+
+    def reset(self):
+        with self.lock:
+            self.histograms = {}
+            self.counters = {}
+            self.events.clear()
+
+
+def instrumented(span_name:str):
+    """
+    Description: Decorator that measures a PF400 method as a span of the robot's instrumentation.
+    """
+    def decorator(function):
+        @wraps(function)
+        def wrapper(self, *args, **kwargs):
+            if not self.metrics.enabled:
+                return function(self, *args, **kwargs)
+            with self.metrics.span(span_name):
+                return function(self, *args, **kwargs)
+        return wrapper
+    return decorator
@@ -0,0 +1,168 @@
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from concurrent.futures import TimeoutError as FutureTimeoutError
+
+from pf400_driver.errors import CommandException, TimeoutException
+
+
+class IOActor():
+    """
+    Description:
+        - Owns the connection of one PF400 and runs every request on a single thread, so that a command and its response are never interleaved with another one.
+        - Requests are queued with submit() which returns a future of the response.
+        - Read-only queries that are already waiting in the queue are coalesced: a second "state" request gets the future of the first one.
+        - Every request has a response timeout that the transport enforces. It starts when the actor writes the command, so a query that waits
+          in the queue behind a long motion command (home, GraspPlate) is not timed out. The caller waits for the timeout plus queue_allowance
+          once the command is written, and a request that is still queued when the running one overran its own timeout finds a hung actor thread.
+    Parameters:
+        - connection: Connected transport of the robot (see pf400_transport)
+        - name: Name of the actor thread
+        - metrics: Optional Instrumentation that records the round trip and queue wait of every command
+    """
+
+    # Queries without side effects. Identical pending queries share one round trip.
+    coalesced_commands = ("state", "wherej", "wherec", "hp", "attach", "pd 2800", "sysstate")
+
+    # Seconds a response may take over its timeout to reach the caller, and the interval of the hung actor checks
+    queue_allowance = 1.0
+
+    def __init__(self, connection, name:str = "pf400_io", metrics = None):
+        self.connection = connection
+        self.metrics = metrics
+        self.requests = queue.Queue()
+        self.pending_reads = {}
+        self.pending_lock = threading.Lock()
+        self.running = True
+        self.discarding = False
+        self.active_deadline = None # Time (perf_counter) by which the request on the wire must be answered, None if it has no timeout
+
+        self.thread = threading.Thread(target = self.run, name = name, daemon = True)
+        self.thread.start()
+
+    def submit(self, command:str, timeout:float = None):
+        """
+        Description: Queues a command for the actor thread.
+        Parameters:
+            - command: Command itself in string format
+            - timeout: Seconds to wait for the response once the command is sent, None waits forever
+        Return: Future of the response string
+        """
+        if not self.running:
+            raise CommandException(err_message = "Connection closed")
+
+        key = command.strip().lower()
+
+        if key in self.coalesced_commands:
+            with self.pending_lock:
+                future = self.pending_reads.get(key)
+                if future is None:
+                    future = self.new_future()
+                    self.pending_reads[key] = future
+                    self.requests.put((command, future, time.perf_counter(), timeout))
+            return future
+
+        future = self.new_future()
+        self.requests.put((command, future, time.perf_counter(), timeout))
+        return future
+
+    def new_future(self):
+        future = Future()
+        future.sent = threading.Event() # Set when the actor takes the request from the queue
+        return future
+
+    def stalled(self):
+        """
+        Description: Checks if the request on the wire overran its timeout by more than queue_allowance, i.e. the actor thread hangs.
+        """
+        deadline = self.active_deadline
+        return deadline is not None and time.perf_counter() > deadline + self.queue_allowance
+
+    def wait(self, future:Future, timeout:float = None):
+        """
+        Description: Waits for the response of a submitted request.
+        Parameters:
+            - future: Future returned by submit()
+            - timeout: Response timeout of the request from the time it is written. The wait adds queue_allowance to it, None waits forever.
+        Return: Response string. Raises TimeoutException if there is none in time.
+        """
+        if timeout is not None:
+            # The time in the queue is not counted, the requests ahead have their own timeouts
+            while not future.sent.wait(self.queue_allowance):
+                if future.done():
+                    break
+                if self.stalled():
+                    raise TimeoutException(err_message="I/O thread did not answer the previous request in time")
+        try:
+            return future.result(None if timeout is None else timeout + self.queue_allowance)
+        except TimeoutException:
+            raise # Response timeout of the transport
+        except FutureTimeoutError:
+            raise TimeoutException(err_message="No response from the I/O thread in " + str(timeout + self.queue_allowance) + "s")
+
+    def request(self, command:str, timeout:float = None):
+        """
+        Description: Sends the command through the actor and waits for the response.
+                     Exceptions of the connection are raised in the calling thread.
+        """
+        return self.wait(self.submit(command, timeout), timeout)
+
+    def run(self):
+        while True:
+            command, future, queued, timeout = self.requests.get()
+            if future is None:
+                break
+
+            # Later identical queries need a new round trip once this one is on the wire
+            key = command.strip().lower()
+            if key in self.coalesced_commands:
+                with self.pending_lock:
+                    if self.pending_reads.get(key) is future:
+                        del self.pending_reads[key]
+
+            future.sent.set()
+            if not future.set_running_or_notify_cancel():
+                continue
+
+            if self.discarding:
+                future.set_exception(CommandException(err_message = "Connection closed"))
+                continue
+
+            measured = self.metrics is not None and self.metrics.enabled
+            if measured:
+                start = time.perf_counter()
+
+            self.active_deadline = None if timeout is None else time.perf_counter() + timeout
+            try:
+                response = self.connection.exchange(command, timeout)
+            except Exception as err:
+                future.set_exception(err)
+            else:
+                future.set_result(response)
+            self.active_deadline = None
+
+            if measured:
+                self.metrics.record_command(command, queued, start, time.perf_counter())
+
+        # Requests queued after stop() will never be sent
+        while not self.requests.empty():
+            command, future, queued, timeout = self.requests.get()
+            if future is not None:
+                future.sent.set()
+            if future is not None and future.set_running_or_notify_cancel():
+                future.set_exception(CommandException(err_message = "Connection closed"))
+
+    def stop(self, wait:bool = True, discard:bool = False):
+        """
+        Description: Stops the actor thread after the queued requests are sent.
+        Parameters:
+            - wait: If True, waits for the actor thread to end
+            - discard: If True, the queued requests fail instead of being sent. Used when the connection is replaced,
+                       so that an actor that was blocked on the old link does not write to the new one.
+        """
+        self.running = False
+        self.discarding = discard
+        self.requests.put((None, None, 0.0, None))
+        if wait and threading.current_thread() is not self.thread:
+            self.thread.join()
@@ -0,0 +1,135 @@
+import json
+import os
+import threading
+import time
+
+
+class StepJournal():
+    """
+    Description: Write-ahead journal of the steps of the running job, so that an interrupted job can be resumed after a re-initialization or a restart.
+                 - begin() saves the job with its steps before the first motion.
+                 - Every step is saved as started before it runs and as completed after it, with the plate state (where the plate is).
+                 - A step that fails is saved as interrupted. The job stays pending until finish() is called.
+                 - The file is replaced atomically (write, fsync, rename), so a crash leaves the previous version.
+    Parameters:
+        - path: JSON file of the journal. None keeps the journal in memory only.
+    """
+
+    def __init__(self, path:str = None):
+        self.path = path
+        self.lock = threading.Lock()
+        self.job = None
+        self.recovery_times = [] # Seconds from the interruption to the end of the resumed job
+        if path and os.path.exists(path):
+            self.load()
+
+    def begin(self, action:str, parameters:dict, steps:list, plate:str = "source"):
+        """
+        Description: Saves a new job.
+        Parameters:
+            - action: Name of the job (e.g. transfer)
+            - parameters: Plan of the job, everything needed to run the steps again (JSON serializable)
+            - steps: List of [step name, joint states of the step location]
+            - plate: Plate state before the first step
+        """
+        with self.lock:
+            self.job = {"action": action,
+                        "parameters": parameters,
+                        "steps": [list(step) for step in steps],
+                        "completed": 0,
+                        "current": None,
+                        "plate": plate,
+                        "interrupted": None,
+                        "started": time.time()}
+            self.save()
+
+    def start_step(self, step:str):
+        with self.lock:
+            self.job["current"] = step
+            self.save()
+
+    def complete_step(self, step:str, plate:str):
+        with self.lock:
+            self.job["completed"] += 1
+            self.job["current"] = None
+            self.job["plate"] = plate
+            self.save()
+
+    def interrupt(self, reason:str = "", error_code:str = None):
+        """
+        Description: Saves that the current step failed. The first interruption time is kept for the recovery time.
+        Parameters:
+            - reason: Error message
+            - error_code: Controller error code of the failure, used to choose the recovery
+        """
+        with self.lock:
+            if self.job is None:
+                return
+            if self.job["interrupted"] is None:
+                self.job["interrupted"] = time.time()
+            self.job["reason"] = reason
+            self.job["error_code"] = error_code
+            self.save()
+
+    def finish(self, completed:bool = True):
+        """
+        Description: Removes the job. Records the recovery time if the job was interrupted and then completed.
+        Parameters:
+            - completed: False if the job failed or was discarded
+        Return: Recovery time in seconds, None if the job was not interrupted
+        """
+        with self.lock:
+            recovery_time = None
+            if completed and self.job is not None and self.job["interrupted"] is not None:
+                recovery_time = time.time() - self.job["interrupted"]
+                self.recovery_times.append(recovery_time)
+            self.job = None
+            self.save()
+            return recovery_time
+
+    def pending(self):
+        """
+        Description: Job that was started and not finished, None if there is none.
+        """
+        with self.lock:
+            return self.job
+
+    def remaining_steps(self):
+        with self.lock:
+            if self.job is None:
+                return []
+            return self.job["steps"][self.job["completed"]:]
+
+    def report(self):
+        """
+        Description: Number of resumed jobs and their mean and maximum recovery time in seconds.
+        """
+        with self.lock:
+            count = len(self.recovery_times)
+            return {"recoveries": count,
+                    "mean_recovery_time": sum(self.recovery_times) / count if count else 0.0,
+                    "max_recovery_time": max(self.recovery_times) if count else 0.0}
+
+    def save(self):
+        if not self.path:
+            return
+        try:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok = True)
+            temporary = self.path + ".tmp"
+            with open(temporary, "w") as f:
+                json.dump({"job": self.job}, f)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(temporary, self.path)
+        except OSError as err:
+            print("Journal could not be saved: " + str(err))
+
+    def load(self):
+        try:
+            with open(self.path) as f:
+                self.job = json.load(f)["job"]
+        except (OSError, ValueError, KeyError) as err:
+            print("Journal could not be loaded: " + str(err))
+            self.job = None
@@ -1,7 +1,18 @@
 
 import math
 import numpy as np
- 
+
+from pf400_driver.pf400_motion_model import MotionModel
+
+
+# Joint limits in degrees used to enumerate the inverse kinematics solutions. Joint 3 is 10 to 350 instead of -180 to 180.
+shoulder_limits = (-93.0, 93.0)
+elbow_limits = (10.0, 349.5)
+wrist_limits = (-960.0, 960.0)
+# Vertical and linear rail limits in mm
+vertical_limits = (2.0, 1160.0)
+rail_limits = (-1000.0, 1000.0)
+
 
 class KINEMATICS():
     def __init__(self):
@@ -10,6 +21,9 @@ class KINEMATICS():
         self.elbow_length = 289
         self.end_effector_length = 162
 
+        # Predicts the move durations to choose between the inverse kinematics solutions
+        self.motion_model = MotionModel()
+
 
     def forward_kinematics(self, joint_states:list):
         """
@@ -60,7 +74,7 @@ class KINEMATICS():
 
         return cartesian_coordinates, round(phi,3), joint_states[5] 
 
-    def inverse_kinematics(self, cartesian_coordinates:list, phi:float, rail:float = 0.0, get_gripper_length:float = 123.0):
+    def inverse_kinematics(self, cartesian_coordinates:list, phi:float, rail:float = 0.0, get_gripper_length:float = 123.0, reference_joints:list = None):
 
         """
         Desciption: Calculates the inverse kinematics for a given array of cartesian coordinates. 
@@ -69,9 +83,16 @@ class KINEMATICS():
                                         X axis has to be substracted from the rail length before feeding into this function!
             - Phi: Phi angle. Phi = Joint_2_angle + Joint_3_angle + Joint_4_angle
             - Rail: Rail length (optional). If provided it will be substracted from X axis.
+            - reference_joints: Current or previous joint states (optional). If provided, the solution with the shortest predicted move 
+                                from the reference is chosen among all the elbow branches and wrist wraps (see closest_inverse_kinematics).
         Return:
             - Joint angles: Calculated 6 new joint angles.
         """
+
+        if reference_joints is not None:
+            solution = self.closest_inverse_kinematics(cartesian_coordinates, reference_joints, rail, get_gripper_length)
+            if solution is not None:
+                return solution
             
         Joint_1 = cartesian_coordinates[2]
         xe = cartesian_coordinates[0] - rail
@@ -121,4 +142,186 @@ class KINEMATICS():
 
         return [Joint_1, Joint_2, Joint_3, Joint_4, get_gripper_length, rail]
 
+    def within_joint_limits(self, joint_states:list):
+        """
+        Desciption: Checks the joint states against the joint limits of the PF400 (the gripper is not checked).
+        """
+        for joint, (lower, upper) in ((0, vertical_limits), (1, shoulder_limits), (2, elbow_limits), (3, wrist_limits), (5, rail_limits)):
+            if not lower <= joint_states[joint] <= upper:
+                return False
+        return True
+
+    def inverse_kinematics_solutions(self, cartesian_coordinates:list, rail:float = 0.0, get_gripper_length:float = 123.0):
+        """
+        Desciption: Enumerates all the joint solutions of the cartesian coordinates within the joint limits.
+                    Both elbow branches are tried, and every 360 degree wrap of Joint 4 that keeps phi in the range forward_kinematics supports.
+        Paramiters:
+            - cartesian_coordinates: X/Y/Z Yaw cartesian coordinates
+            - rail: Rail length. It will be substracted from X axis.
+        Return:
+            - List of 6 joint angles, empty if the coordinates are out of reach
+        """
+        xe = cartesian_coordinates[0] - rail
+        ye = cartesian_coordinates[1]
+        yaw = cartesian_coordinates[3]
+        phie = math.radians(yaw)
+
+        x_second_joint = xe - self.end_effector_length * math.cos(phie)
+        y_second_joint = ye - self.end_effector_length * math.sin(phie)
+        radius = math.sqrt(x_second_joint**2 + y_second_joint**2)
+        if radius == 0:
+            return []
+
+        cos_gamma = (radius * radius + self.shoulder_length * self.shoulder_length - self.elbow_length * self.elbow_length)/(2 * radius * self.shoulder_length)
+        cos_elbow = (self.shoulder_length * self.shoulder_length + self.elbow_length * self.elbow_length - radius*radius)/(2 * self.shoulder_length * self.elbow_length)
+        if abs(cos_gamma) > 1 or abs(cos_elbow) > 1:
+            return []
+
+        gamma = math.acos(cos_gamma)
+        theta2 = math.pi - math.acos(cos_elbow)
+        theta1 = math.atan2(y_second_joint, x_second_joint) - gamma
+
+        solutions = []
+        for shoulder, elbow in ((theta1, theta2), (theta1 + 2 * gamma, -theta2)):
+            joint_2 = (math.degrees(shoulder) + 180) % 360 - 180
+            joint_3 = math.degrees(elbow) % 360
+            if not (shoulder_limits[0] <= joint_2 <= shoulder_limits[1] and elbow_limits[0] <= joint_3 <= elbow_limits[1]):
+                continue
+            adjusted_angle_j3 = joint_3 - 360 if joint_3 > 180 else joint_3
+
+            # Joint 4 wraps that give the same yaw
+            joint_4 = (yaw - joint_2 - joint_3) % 360 + 360 * math.floor(wrist_limits[0] / 360)
+            while joint_4 <= wrist_limits[1]:
+                phi = joint_2 + adjusted_angle_j3 + joint_4
+                if joint_4 >= wrist_limits[0] and 0 < phi < 1080 and phi not in (540, 720, 900):
+                    solutions.append([cartesian_coordinates[2], joint_2, joint_3, joint_4, get_gripper_length, rail])
+                joint_4 += 360
+        return solutions
+
+    def closest_inverse_kinematics(self, cartesian_coordinates:list, reference_joints:list, rail:float = 0.0, get_gripper_length:float = 123.0, profile:int = 1):
+        """
+        Desciption: Chooses the inverse kinematics solution with the shortest predicted move from the reference joint states,
+                    so the arm does not take the long way around or unwind the wrist.
+        Paramiters:
+            - cartesian_coordinates: X/Y/Z Yaw cartesian coordinates
+            - reference_joints: Current or previous joint states of the arm
+            - rail: Rail length
+            - profile: Motion profile of the move
+        Return:
+            - 6 joint angles, None if there is no solution within the joint limits
+        """
+        solutions = self.inverse_kinematics_solutions(cartesian_coordinates, rail, get_gripper_length)
+        if not solutions:
+            return None
+        return min(solutions, key = lambda solution: (self.motion_model.move_time(reference_joints, solution, profile),
+                                                        abs(solution[3] - reference_joints[3])))
+
+    def reverse_module_location(self, location:list, rail_loc:float, module_lenght:float = 685.8):
+        """
+        Desciption: Moves a module location taken on the left side of the PF400 to the right side of the bay at rail_loc.
+                    The target is mirrored on the y axis and along the module lenght on the x axis.
+        Paramiters:
+            - location: Joint states of the module on the left side
+            - rail_loc: Rail location of the bay
+            - module_lenght: Lenght of a module cart
+        Return:
+            - Joint states of the module on the right side
+        """
+        cartesian, phi, rail = self.forward_kinematics(location)
+        target_on_x_without_rail = cartesian[0] - rail
+        reverse_target_on_x_axis = module_lenght - target_on_x_without_rail
+
+        if rail_loc == -990:
+            # TODO: Need to calculate the new location considering the rail location will be at the middle of the module cart. Meaning rail cannot move.
+            joint_states = list(location)
+        elif rail_loc == 990:
+            # Robot rail at the maximum reach, therefore keep the rail at the same location and calculate the new location with the robot arm only
+            cartesian[0] = reverse_target_on_x_axis + rail_loc
+            cartesian[1] = -cartesian[1] #Switch arm from left to right on y axis
+            cartesian[3] -= 180
+            joint_states = self.inverse_kinematics(cartesian_coordinates = cartesian, phi = phi, rail = rail_loc)
+        else:
+            rail_travel = reverse_target_on_x_axis - target_on_x_without_rail # Find the lenght in between new target location and old target location
+            #Only the rail location will change to move the new target location. Isolated rail location at origin is considered 0. Robot can move to new location by only changing rail location.
+            total_rail_travel = rail_travel + rail_loc
+
+            cartesian[0] = target_on_x_without_rail + total_rail_travel # Keeping the same x axis value while setting a new value to rail to move to the new location.
+            cartesian[1] = -cartesian[1] #Switch arm from left to right on y axis
+            cartesian[3] -= 180
+            joint_states = self.inverse_kinematics(cartesian_coordinates = cartesian, phi = phi, rail = total_rail_travel)
+
+        joint_states[5] = rail_loc
+        return joint_states
+
+    def forward_kinematics_batch(self, joint_states):
+        """
+        Desciption: Vectorized forward_kinematics for many joint states at once. Results match the scalar function.
+        Paramiters:
+            - joint_states : Array of shape (N, 6)
+        Return:
+            - cartesian_coordinates: Array of shape (N, 4) with X/Y/Z and yaw. Yaw is NaN where the scalar function has no solution.
+            - phi: Phi angles in degrees, shape (N,)
+            - rail: Rail lengths, shape (N,)
+        """
+        joint_states = np.asarray(joint_states, dtype = float)
+
+        adjusted_angle_j3 = np.where(joint_states[:, 2] > 180, joint_states[:, 2] - 360, joint_states[:, 2])
+
+        shoulder_angle = np.radians(joint_states[:, 1])
+        elbow_angle = np.radians(joint_states[:, 2])
+        gripper_angle = np.radians(joint_states[:, 3])
+
+        x = self.shoulder_length*np.cos(shoulder_angle) + self.elbow_length*np.cos(shoulder_angle+elbow_angle) + self.end_effector_length*np.cos(shoulder_angle+elbow_angle+gripper_angle)
+        y = self.shoulder_length*np.sin(shoulder_angle) + self.elbow_length*np.sin(shoulder_angle+elbow_angle) + self.end_effector_length*np.sin(shoulder_angle+elbow_angle+gripper_angle)
+
+        phi = np.degrees(shoulder_angle) + adjusted_angle_j3 + np.degrees(gripper_angle)
+
+        yaw = np.select([(phi > 0) & (phi < 540), (phi > 540) & (phi < 720), (phi > 720) & (phi < 900), (phi > 900) & (phi < 1080)],
+                        [phi % 360, phi % 360 - 360, phi % 720, phi % 720 - 720], np.nan)
+
+        cartesian_coordinates = np.stack([np.round(x, 3) + joint_states[:, 5], np.round(y, 3), np.round(joint_states[:, 0], 3), np.round(yaw, 3)], axis = 1)
+
+        return cartesian_coordinates, np.round(phi, 3), joint_states[:, 5]
+
+    def inverse_kinematics_batch(self, cartesian_coordinates, phi, rail = 0.0, get_gripper_length:float = 123.0):
+        """
+        Desciption: Vectorized inverse_kinematics for many cartesian coordinates at once. Results match the scalar function.
+        Paramiters:
+            - cartesian_coordinates: Array of shape (N, 4 or more) with X/Y/Z and yaw
+            - phi: Phi angles, shape (N,)
+            - rail: Rail lengths, shape (N,) or a single value
+        Return:
+            - Joint angles: Array of shape (N, 6). Rows without a solution are NaN.
+        """
+        cartesian_coordinates = np.asarray(cartesian_coordinates, dtype = float)
+        phi = np.asarray(phi, dtype = float)
+        rail = np.broadcast_to(np.asarray(rail, dtype = float), phi.shape)
+
+        xe = cartesian_coordinates[:, 0] - rail
+        ye = cartesian_coordinates[:, 1]
+        yaw = cartesian_coordinates[:, 3]
+
+        phi = np.select([phi < 360, (phi > 360) & (phi < 540), (phi > 540) & (phi < 720), (phi > 720) & (phi < 900), (phi > 900) & (phi < 1080)],
+                        [yaw, yaw + 360, yaw + 720, yaw + 720, yaw + 1440], phi)
+        phie = np.radians(phi)
+
+        x_second_joint = xe - self.end_effector_length * np.cos(phie)
+        y_second_joint = ye - self.end_effector_length * np.sin(phie)
+
+        with np.errstate(invalid = "ignore", divide = "ignore"):
+            radius = np.sqrt(x_second_joint**2 + y_second_joint**2)
+            gamma = np.arccos((radius * radius + self.shoulder_length * self.shoulder_length - self.elbow_length * self.elbow_length)/(2 * radius * self.shoulder_length))
+            theta2 = np.pi - np.arccos((self.shoulder_length * self.shoulder_length + self.elbow_length * self.elbow_length - radius*radius)/(2 * self.shoulder_length * self.elbow_length))
+        theta1 = np.arctan2(y_second_joint, x_second_joint) - gamma
+        theta3 = phie - theta1 - theta2
+
+        # Same quadrant selection as inverse_kinematics
+        first_quadrant = (ye > 0) | ((ye < 0) & (np.degrees(theta1) < 0) & (np.abs(np.degrees(theta1)) < np.abs(np.degrees(theta1 + 2 * gamma))))
+        forth_quadrant = ~first_quadrant & (ye < 0)
+
+        joint_2 = np.where(first_quadrant, np.degrees(theta1), np.where(forth_quadrant, np.degrees(theta1 + 2 * gamma), np.nan))
+        joint_3 = np.where(first_quadrant, np.degrees(theta2), np.where(forth_quadrant, np.degrees(-theta2) + 360, np.nan))
+        joint_4 = np.where(first_quadrant, np.degrees(theta3), np.where(forth_quadrant, np.degrees(theta3 + 2 * (theta2 - gamma)), np.nan))
+
+        return np.stack([cartesian_coordinates[:, 2], joint_2, joint_3, joint_4, np.full(phi.shape, get_gripper_length), rail], axis = 1)
 
@@ -0,0 +1,121 @@
+import json
+import math
+import os
+import threading
+from collections import OrderedDict
+
+
+def freeze(value):
+    """
+    Description: Converts the nested lists of a JSON key back into tuples.
+    """
+    if isinstance(value, list):
+        return tuple(freeze(item) for item in value)
+    return value
+
+
+class KinematicsCache():
+    """
+    Description: LRU cache of the kinematics results of the fixed locations (forward kinematics poses, inverse kinematics solutions and rotated grasps).
+                 - Keys are the kind of result, the arm geometry (link lengths) and the joint states or coordinates rounded to the quantum,
+                   so a change of the geometry never returns a stale result.
+                 - Hits and misses are counted per kind.
+                 - The entries can be saved into a JSON file and loaded at startup, so the deck locations are not recalculated after a restart.
+                 Failed calculations (e.g. a math domain error of an unreachable rotation) are not cached.
+    Parameters:
+        - maxsize: Maximum number of entries. The least recently used entries are dropped.
+        - quantum: Rounding of the joint states and coordinates in the keys
+        - path: JSON file of the persistent entries. Loaded when the cache is created if it exists.
+    """
+
+    def __init__(self, maxsize:int = 4096, quantum:float = 0.001, path:str = None):
+        self.maxsize = maxsize
+        self.digits = max(0, round(-math.log10(quantum)))
+        self.path = path
+        self.enabled = True
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()
+        self.hits = {}
+        self.misses = {}
+        if path and os.path.exists(path):
+            self.load(path)
+
+    def key(self, kind:str, geometry:tuple, values:list, *extras):
+        return (kind, geometry, tuple(round(float(value), self.digits) for value in values)) + extras
+
+    def get(self, key:tuple, calculate):
+        """
+        Description: Returns the cached result of the key, or calculates and caches it.
+                     The cached object is returned, so callers that change the result have to copy it.
+        """
+        if not self.enabled:
+            return calculate()
+
+        kind = key[0]
+        with self.lock:
+            if key in self.entries:
+                self.entries.move_to_end(key)
+                self.hits[kind] = self.hits.get(kind, 0) + 1
+                return self.entries[key]
+            self.misses[kind] = self.misses.get(kind, 0) + 1
+
+        result = calculate()
+
+        with self.lock:
+            self.entries[key] = result
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.maxsize:
+                self.entries.popitem(last = False)
+        return result
+
+    def stats(self):
+        """
+        Description: Hits, misses and hit rate per kind of result.
+        """
+        with self.lock:
+            stats = {}
+            for kind in sorted(set(self.hits) | set(self.misses)):
+                hits = self.hits.get(kind, 0)
+                misses = self.misses.get(kind, 0)
+                stats[kind] = {"hits": hits, "misses": misses, "hit_rate": round(hits / (hits + misses), 4)}
+            stats["entries"] = len(self.entries)
+            return stats
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.hits = {}
+            self.misses = {}
+
+    def save(self, path:str = None):
+        """
+        Description: Saves the entries into a JSON file.
+        """
+        path = path or self.path
+        with self.lock:
+            entries = [[list(key), value] for key, value in self.entries.items()]
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok = True)
+        with open(path, "w") as f:
+            json.dump({"entries": entries}, f)
+
+    def load(self, path:str = None):
+        """
+        Description: Loads the entries of a JSON file saved by save.
+        Return: Number of loaded entries
+        """
+        path = path or self.path
+        try:
+            with open(path) as f:
+                entries = json.load(f)["entries"]
+        except (OSError, ValueError, KeyError) as err:
+            print("Kinematics cache could not be loaded: " + str(err))
+            return 0
+
+        with self.lock:
+            for key, value in entries:
+                self.entries[freeze(key)] = value
+            while len(self.entries) > self.maxsize:
+                self.entries.popitem(last = False)
+        return len(entries)
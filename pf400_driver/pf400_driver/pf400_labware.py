@@ -0,0 +1,113 @@
+import copy
+import json
+
+# Plate types of the workcell. Widths, offsets and heights are in mm, forces in Nt.
+#   - footprint: Length and width of the plate base
+#   - grasp_width: Width of the plate grasp (narrow side)
+#   - grasp_force: Maximum gripper squeeze force of the grasp
+#   - grasp_speed: Percent speed of the fingers, 1 to 100
+#   - grasp_tolerance: How far below grasp_width the grasp searches if the plate is not found, 0 grasps once at grasp_width
+#   - release_width: Open width of the release, larger than the widest corners of the plate
+#   - lid_width: Width of the lid grasp
+#   - lid_height: Height of the lid grasp above the plate grasp
+#   - above_height: Height of the approach pose above the plate
+# Every type grasps once at its width. The uncalibrated type keeps the 1 mm width search of the earlier driver down to 80 mm,
+# select it (or set grasp_tolerance in a labware file) for plates whose width is not known.
+labware_types = {
+    "default": {
+        "footprint": [127.76, 85.48],
+        "grasp_width": 123,
+        "grasp_force": 10,
+        "grasp_speed": 100,
+        "grasp_tolerance": 0,
+        "release_width": 130,
+        "lid_width": 123,
+        "lid_height": 7.0,
+        "above_height": 100.0
+    },
+    "uncalibrated": {
+        "footprint": [127.76, 85.48],
+        "grasp_width": 123,
+        "grasp_force": 10,
+        "grasp_speed": 100,
+        "grasp_tolerance": 43,
+        "release_width": 130,
+        "lid_width": 123,
+        "lid_height": 7.0,
+        "above_height": 100.0
+    },
+    "96_well": {
+        "footprint": [127.76, 85.48],
+        "grasp_width": 123,
+        "grasp_force": 10,
+        "grasp_speed": 100,
+        "grasp_tolerance": 0,
+        "release_width": 130,
+        "lid_width": 124,
+        "lid_height": 7.0,
+        "above_height": 100.0
+    },
+    "384_well": {
+        "footprint": [127.76, 85.48],
+        "grasp_width": 123,
+        "grasp_force": 10,
+        "grasp_speed": 100,
+        "grasp_tolerance": 0,
+        "release_width": 130,
+        "lid_width": 124,
+        "lid_height": 7.5,
+        "above_height": 100.0
+    },
+    "pcr_96": {
+        "footprint": [127.76, 85.48],
+        "grasp_width": 122,
+        "grasp_force": 8,
+        "grasp_speed": 50,
+        "grasp_tolerance": 0,
+        "release_width": 130,
+        "lid_width": 123,
+        "lid_height": 5.0,
+        "above_height": 100.0
+    },
+    "deep_well_96": {
+        "footprint": [127.76, 85.48],
+        "grasp_width": 124,
+        "grasp_force": 15,
+        "grasp_speed": 50,
+        "grasp_tolerance": 0,
+        "release_width": 131,
+        "lid_width": 125,
+        "lid_height": 10.0,
+        "above_height": 120.0
+    }}
+
+
+def get_labware(name:str, catalog:dict = None):
+    """
+    Description: Parameters of a plate type. Missing parameters are taken from the default type.
+    Parameters:
+        - name: Plate type
+        - catalog: Plate types, labware_types if not given
+    Return: Copy of the plate type parameters, None if the type is not in the catalog
+    """
+    catalog = labware_types if catalog is None else catalog
+    if name not in catalog:
+        return None
+    labware = copy.deepcopy(catalog.get("default", labware_types["default"]))
+    labware.update(copy.deepcopy(catalog[name]))
+    labware["name"] = name
+    return labware
+
+
+def load_labware(path:str, catalog:dict = None):
+    """
+    Description: Adds the plate types of a JSON file ({type: {parameter: value}}) to the catalog. Existing types are replaced.
+    Parameters:
+        - path: JSON file of the plate types
+        - catalog: Plate types to update, a copy of labware_types if not given
+    Return: Updated catalog
+    """
+    catalog = copy.deepcopy(labware_types) if catalog is None else catalog
+    with open(path) as f:
+        catalog.update(json.load(f))
+    return catalog
@@ -0,0 +1,406 @@
+#!/usr/bin/env python3
+
+import argparse
+import itertools
+import json
+import math
+import random
+
+from pf400_driver.pf400_kinematics import KINEMATICS
+from pf400_driver.pf400_motion_model import MotionModel
+from pf400_driver.pf400_throughput_simulator import ThroughputSimulator, default_layout, load_layout
+from pf400_driver.pf400_trace import load_records
+
+
+# Joint limits of the PF400 SXL (J5 gripper is not checked)
+joint_limits = {0: (2.0, 1160.0), 1: (-93.0, 93.0), 2: (10.0, 349.5), 3: (-960.0, 960.0), 5: (-1000.0, 1000.0)}
+
+
+class LayoutKinematics(KINEMATICS):
+    """
+    Description: KINEMATICS without a robot. Pitch and roll of the gripper are fixed, so forward_kinematics has no round trip.
+    """
+
+    def get_cartesian_coordinates(self):
+        return [0.0, 0.0, 0.0, 0.0, 90.0, 180.0]
+
+
+def parse_leg(leg:str):
+    source, target = leg.split("->")
+    return source.strip(), target.strip()
+
+
+def load_frequencies(path:str):
+    """
+    Description: Transfer counts between modules from a {"Source -> Target": count} file (the "legs" of a throughput simulator report).
+    """
+    with open(path) as f:
+        data = json.load(f)
+    return {parse_leg(leg): count for leg, count in data.get("legs", data).items()}
+
+
+def workflow_frequencies(workflow:dict):
+    """
+    Description: Transfer counts of one plate through the workflow steps.
+    """
+    frequencies = {}
+    steps = workflow["steps"]
+    for source, target in zip(steps, steps[1:]):
+        leg = (source["module"], target["module"])
+        frequencies[leg] = frequencies.get(leg, 0) + 1
+    return frequencies
+
+
+def nearest_module(joint_states:list, locations:dict, tolerance:float):
+    best, best_distance = None, tolerance
+    for module, location in locations.items():
+        distance = max(abs(joint - reference) for joint, reference in zip(joint_states, location))
+        if distance <= best_distance:
+            best, best_distance = module, distance
+    return best
+
+
+def trace_frequencies(records:list, locations:dict, tolerance:float = 5.0):
+    """
+    Description: Transfer counts from the trace records of PF400.transfer. Source and target joint states are matched to the nearest module location.
+    Return: Dictionary of (source, target) to count, number of transfers that could not be matched
+    """
+    frequencies = {}
+    unmatched = 0
+    for record in records:
+        if record.get("action") != "transfer":
+            continue
+        args = record.get("args", {})
+        source = nearest_module(args.get("source_loc") or [], locations, tolerance)
+        target = nearest_module(args.get("target_loc") or [], locations, tolerance)
+        if source is None or target is None:
+            unmatched += 1
+            continue
+        frequencies[(source, target)] = frequencies.get((source, target), 0) + 1
+    return frequencies, unmatched
+
+
+class LayoutOptimizer():
+    """
+    Description: Proposes the order of the module carts along the rail and their side that minimize the expected transfer time.
+                 - Slots follow PF400_CAMERA.module_list: slots 1-4 are the left side of the start_location bays, slots 5-8 the right side.
+                 - Module locations are the left side default locations moved to the bay, and mirrored to the right side like PF400_CAMERA.register_module.
+                 - A module can only go to a slot where its location is within the joint limits and the reach of the arm.
+                 - The cost of a layout is the expected duration of a transfer: the loaded move (pick and place) of every leg weighted by its frequency,
+                   plus the empty move from the previous target to the next source, with targets and sources drawn from the same frequencies.
+                 Layouts are searched exhaustively when there are few of them, otherwise with a random restart swap search.
+    Parameters:
+        - frequencies: Dictionary of (source module, target module) to transfer count
+        - default_locations: Left side joint states of the modules (PF400_CAMERA default locations)
+        - start_location: Rail locations of the bays
+        - motion_model: Model that predicts the transfer durations
+        - robot_reach: Reach of the arm without the rail in mm
+        - module_lenght: Lenght of a module cart in mm
+        - fixed: Dictionary of module to slot for the carts that cannot be moved
+    """
+
+    def __init__(self, frequencies:dict, default_locations:dict = None, start_location:list = None, motion_model:MotionModel = None,
+                 robot_reach:float = 753.0, module_lenght:float = 685.8, fixed:dict = None):
+        self.frequencies = {leg: count for leg, count in frequencies.items() if count > 0}
+        self.default_locations = default_locations or default_layout
+        self.start_location = start_location or [-990, -330, 400, 990]
+        self.motion_model = motion_model or MotionModel()
+        self.robot_reach = robot_reach
+        self.module_lenght = module_lenght
+        self.fixed = fixed or {}
+        self.kinematics = LayoutKinematics()
+
+        self.modules = sorted({module for leg in self.frequencies for module in leg} | set(self.fixed))
+        missing = [module for module in self.modules if module not in self.default_locations]
+        if missing:
+            raise ValueError("Modules without a default location: " + ", ".join(missing))
+        if len(self.modules) > 2 * len(self.start_location):
+            raise ValueError("More modules than slots")
+
+        self.slots = list(range(1, 2 * len(self.start_location) + 1))
+        self.locations = {} # (module, slot) -> joint states, None if the slot is out of reach
+        self.leg_times = {}
+        self.empty_times = {}
+
+        total = sum(self.frequencies.values())
+        self.source_weights = {}
+        self.target_weights = {}
+        for (source, target), count in self.frequencies.items():
+            self.source_weights[source] = self.source_weights.get(source, 0.0) + count / total
+            self.target_weights[target] = self.target_weights.get(target, 0.0) + count / total
+        self.leg_weights = {leg: count / total for leg, count in self.frequencies.items()}
+
+    def slot_side(self, slot:int):
+        """
+        Description: Bay index and side of a module_list slot.
+        """
+        bays = len(self.start_location)
+        return (slot - 1) % bays, "left" if slot <= bays else "right"
+
+    def reachable(self, joint_states:list):
+        for joint, (lower, upper) in joint_limits.items():
+            if not lower <= joint_states[joint] <= upper:
+                return False
+        cartesian, phi, rail = self.kinematics.forward_kinematics(joint_states)
+        return math.hypot(cartesian[0] - rail, cartesian[1]) <= self.robot_reach
+
+    def module_location(self, module:str, slot:int):
+        """
+        Description: Joint states of the module placed in the slot, or None if the arm cannot reach it there.
+        """
+        key = (module, slot)
+        if key not in self.locations:
+            bay, side = self.slot_side(slot)
+            rail_loc = self.start_location[bay]
+            location = list(self.default_locations[module])
+            try:
+                if side == "left":
+                    location[5] = rail_loc
+                else:
+                    location = self.kinematics.reverse_module_location(location, rail_loc, self.module_lenght)
+                if not self.reachable(location):
+                    location = None
+            except (ValueError, ZeroDivisionError, UnboundLocalError):
+                location = None
+            self.locations[key] = location
+        return self.locations[key]
+
+    def allowed(self, module:str, slot:int):
+        if module in self.fixed:
+            return self.fixed[module] == slot
+        return self.module_location(module, slot) is not None
+
+    def leg_time(self, source:tuple, target:tuple):
+        """
+        Description: Loaded duration of a transfer between two placed modules, starting at the neutral pose of the source.
+        """
+        key = (source, target)
+        if key not in self.leg_times:
+            source_location = self.module_location(*source)
+            target_location = self.module_location(*target)
+            start = self.motion_model.neutral_pose(source_location)
+            self.leg_times[key] = self.motion_model.transfer_time(start, source_location, target_location)
+        return self.leg_times[key]
+
+    def empty_time(self, previous:tuple, source:tuple):
+        """
+        Description: Duration of the empty move from the neutral pose of the previous target to the neutral pose of the next source.
+        """
+        key = (previous, source)
+        if key not in self.empty_times:
+            start = self.motion_model.neutral_pose(self.module_location(*previous))
+            self.empty_times[key] = self.motion_model.neutral_time(start, self.module_location(*source))
+        return self.empty_times[key]
+
+    def expected_time(self, layout:dict):
+        """
+        Description: Expected duration of a transfer in seconds with the modules in the slots of layout ({module: slot}).
+        """
+        loaded = sum(weight * self.leg_time((source, layout[source]), (target, layout[target])) for (source, target), weight in self.leg_weights.items())
+        empty = 0.0
+        for target, target_weight in self.target_weights.items():
+            for source, source_weight in self.source_weights.items():
+                empty += target_weight * source_weight * self.empty_time((target, layout[target]), (source, layout[source]))
+        return loaded + empty
+
+    def candidate_slots(self):
+        return {module: [slot for slot in self.slots if self.allowed(module, slot)] for module in self.modules}
+
+    def layouts(self, candidates:dict):
+        """
+        Description: All the layouts that put every module into a different allowed slot.
+        """
+        for slots in itertools.product(*(candidates[module] for module in self.modules)):
+            if len(set(slots)) == len(slots):
+                yield dict(zip(self.modules, slots))
+
+    def search(self, candidates:dict, restarts:int, seed:int):
+        """
+        Description: Swap search with random restarts for the layouts that are too many to enumerate.
+        """
+        generator = random.Random(seed)
+        best, best_time = None, float("inf")
+        for restart in range(restarts):
+            layout = {}
+            for module in sorted(self.modules, key = lambda module: len(candidates[module])):
+                free = [slot for slot in candidates[module] if slot not in layout.values()]
+                if not free:
+                    break
+                layout[module] = generator.choice(free)
+            if len(layout) != len(self.modules):
+                continue
+
+            layout_time = self.expected_time(layout)
+            improved = True
+            while improved:
+                improved = False
+                for module in self.modules:
+                    for slot in candidates[module]:
+                        other = next((name for name, used in layout.items() if used == slot), None)
+                        if other == module or (other is not None and layout[module] not in candidates[other]):
+                            continue
+                        trial = dict(layout)
+                        trial[module] = slot
+                        if other is not None:
+                            trial[other] = layout[module]
+                        trial_time = self.expected_time(trial)
+                        if trial_time < layout_time - 1e-9:
+                            layout, layout_time, improved = trial, trial_time, True
+            if layout_time < best_time:
+                best, best_time = layout, layout_time
+        return best, best_time
+
+    def optimize(self, current:dict = None, proposals:int = 3, exhaustive_limit:int = 50000, restarts:int = 200, seed:int = 0):
+        """
+        Description: Finds the layouts with the shortest expected transfer time.
+        Parameters:
+            - current: Current layout ({module: slot}) to calculate the throughput gain of the proposals
+            - proposals: Number of proposed layouts
+            - exhaustive_limit: Largest number of layouts that is enumerated
+            - restarts: Restarts of the swap search
+            - seed: Seed of the swap search
+        Return: Report dictionary with the proposals and their predicted gain
+        """
+        candidates = self.candidate_slots()
+        unplaceable = [module for module, slots in candidates.items() if not slots]
+        if unplaceable:
+            raise ValueError("Modules that cannot be placed in any slot: " + ", ".join(unplaceable))
+
+        layout_count = 1
+        for module in self.modules:
+            layout_count *= len(candidates[module])
+
+        evaluated = 0
+        if layout_count <= exhaustive_limit:
+            ranked = []
+            total_time = 0.0
+            for layout in self.layouts(candidates):
+                layout_time = self.expected_time(layout)
+                ranked.append((layout_time, layout))
+                total_time += layout_time
+                evaluated += 1
+            ranked.sort(key = lambda item: item[0])
+            ranked = ranked[:proposals]
+            average_time = total_time / evaluated if evaluated else 0.0
+        else:
+            found = {}
+            for index in range(proposals):
+                layout, layout_time = self.search(candidates, restarts, seed + index)
+                if layout is not None:
+                    found[tuple(sorted(layout.items()))] = (layout_time, layout)
+            ranked = sorted(found.values(), key = lambda item: item[0])
+            evaluated = None
+            average_time = None
+
+        if not ranked:
+            raise ValueError("No layout places every module in an allowed slot")
+
+        current_time = None
+        if current:
+            current_time = self.expected_time(current) if all(self.module_location(module, slot) for module, slot in current.items()) else None
+        reference = current_time or average_time
+
+        report_proposals = []
+        for layout_time, layout in ranked:
+            proposal = {"module_list": {slot: next((module for module, used in layout.items() if used == slot), "None") for slot in self.slots},
+                        "expected_transfer_seconds": round(layout_time, 3),
+                        "transfers_per_hour": round(3600 / layout_time, 1)}
+            if reference:
+                # An arm-bound workcell runs transfers back to back, so its throughput scales with the inverse of the transfer time
+                proposal["predicted_throughput_gain"] = round(reference / layout_time - 1, 4)
+            report_proposals.append(proposal)
+
+        return {"modules": self.modules,
+                "layouts": layout_count if evaluated is None else evaluated,
+                "search": "exhaustive" if evaluated is not None else "swap",
+                "current_transfer_seconds": round(current_time, 3) if current_time else None,
+                "average_transfer_seconds": round(average_time, 3) if average_time else None,
+                "proposals": report_proposals}
+
+    def placed_layout(self, module_list:dict):
+        """
+        Description: Module locations of a {slot: module} layout, e.g. for the ThroughputSimulator.
+        """
+        return {module: self.module_location(module, int(slot)) for slot, module in module_list.items() if module != "None"}
+
+
+def main():
+    parser = argparse.ArgumentParser(description = "Proposes the module cart order and sides along the PF400 rail")
+    parser.add_argument("--frequencies", help = "{\"Source -> Target\": count} file or a throughput simulator report")
+    parser.add_argument("--trace", nargs = "*", default = [], help = "Trace files of PF400.transfer (TraceRecorder)")
+    parser.add_argument("--workflow", help = "Workflow file of the throughput simulator, used for the frequencies and the simulated throughput")
+    parser.add_argument("--map", help = "Workcell map saved by PF400_CAMERA, used as the current layout")
+    parser.add_argument("--fixed", default = "", help = "Carts that cannot be moved, e.g. Sciclops:1,Hidex:8")
+    parser.add_argument("--proposals", type = int, default = 3)
+    parser.add_argument("--hours", type = float, default = 1000.0, help = "Simulated hours of the workflow throughput comparison")
+    parser.add_argument("--json", help = "Write the report into this file")
+    args = parser.parse_args()
+
+    current = None
+    current_locations = default_layout
+    if args.map:
+        with open(args.map) as f:
+            workcell_map = json.load(f)
+        current = {module: int(slot) for slot, module in workcell_map["module_list"].items() if module != "None"}
+        current_locations = load_layout(args.map)
+
+    workflow = None
+    frequencies = {}
+    if args.frequencies:
+        frequencies.update(load_frequencies(args.frequencies))
+    if args.trace:
+        trace, unmatched = trace_frequencies(load_records(args.trace, "transfer"), current_locations)
+        if unmatched:
+            print("{} transfers did not match a module location".format(unmatched))
+        for leg, count in trace.items():
+            frequencies[leg] = frequencies.get(leg, 0) + count
+    if args.workflow:
+        with open(args.workflow) as f:
+            workflow = json.load(f)
+        if not frequencies:
+            frequencies = workflow_frequencies(workflow)
+    if not frequencies:
+        parser.error("Transfer frequencies are needed (--frequencies, --trace or --workflow)")
+
+    fixed = {}
+    for item in filter(None, args.fixed.split(",")):
+        module, slot = item.split(":")
+        fixed[module.strip()] = int(slot)
+
+    optimizer = LayoutOptimizer(frequencies, fixed = fixed)
+    if current:
+        current = {module: slot for module, slot in current.items() if module in optimizer.modules}
+    report = optimizer.optimize(current, args.proposals)
+
+    if workflow:
+        # Simulated workflow throughput of the current and the proposed layouts
+        layouts = list(report["proposals"])
+        if current:
+            report["current"] = {"module_list": {slot: module for module, slot in current.items()}}
+            layouts.append(report["current"])
+        for proposal in layouts:
+            simulation = ThroughputSimulator(workflow, optimizer.placed_layout(proposal["module_list"]), seed = 0).run(args.hours)
+            proposal["simulated_plates_per_hour"] = simulation["plates_per_hour"]
+            proposal["simulated_arm_utilization"] = simulation["arm_utilization"]
+
+    def simulated(proposal):
+        if "simulated_plates_per_hour" not in proposal:
+            return ""
+        return ", simulated {} plates/hour, arm utilization {:.1%}".format(proposal["simulated_plates_per_hour"], proposal["simulated_arm_utilization"])
+
+    print("Modules: {}, {} layouts ({})".format(", ".join(report["modules"]), report["layouts"], report["search"]))
+    if report["current_transfer_seconds"]:
+        print("Current layout: {} s per transfer{}".format(report["current_transfer_seconds"], simulated(report.get("current", {}))))
+    for index, proposal in enumerate(report["proposals"]):
+        slots = ", ".join("{}:{}".format(slot, module) for slot, module in proposal["module_list"].items() if module != "None")
+        gain = proposal.get("predicted_throughput_gain")
+        print("Proposal {}: {} s per transfer{}{} [{}]".format(index + 1, proposal["expected_transfer_seconds"],
+                                                               ", {:+.1%} throughput".format(gain) if gain is not None else "", simulated(proposal), slots))
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent = 4)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,142 @@
+import json
+import os
+import threading
+
+
+def same_pose(joint_states:list, other:list, tolerance:float = 1.0):
+    """
+    Description: Compares two joint states without the gripper (joint 5).
+    """
+    return all(abs(joint_states[joint] - other[joint]) < tolerance for joint in (0, 1, 2, 3, 5))
+
+
+class LidBuffer():
+    """
+    Description: Parking slots of the lids removed by PF400.remove_lid, so that several plates can be de-lidded back to back and re-lidded in any order.
+                 - A slot is allocated to the plate ID when its lid is removed and freed when the lid is put back.
+                 - The free slot nearest to the plate on the linear rail is chosen.
+                 - Slots on a blocked pose (the rotation deck) are used last, since a lid parked there stops the plate rotations.
+                 - With a path, the parked lids are saved on every change (write, fsync, rename) and loaded again after a restart.
+    Parameters:
+        - slots: Joint states of the lid slots
+        - blocked: Joint states of the poses that a parked lid blocks for other uses
+        - path: JSON file of the parked lids. None keeps them in memory only.
+    """
+
+    def __init__(self, slots:list, blocked:list = None, path:str = None):
+        self.slots = [list(slot) for slot in slots]
+        self.blocked = [list(pose) for pose in blocked or []]
+        self.parked = {} # plate ID -> slot index
+        self.lock = threading.Lock()
+        self.path = path
+        if path and os.path.exists(path):
+            self.load()
+
+    def add_slot(self, joint_states:list):
+        with self.lock:
+            self.slots.append(list(joint_states))
+            return len(self.slots) - 1
+
+    def is_blocking(self, index:int):
+        return any(same_pose(self.slots[index], pose) for pose in self.blocked)
+
+    def free_slots(self):
+        with self.lock:
+            used = set(self.parked.values())
+            return [index for index in range(len(self.slots)) if index not in used]
+
+    def allocate(self, plate_id, rail:float = 0.0):
+        """
+        Description: Reserves the free slot nearest to the rail position for the lid of the plate.
+        Parameters:
+            - plate_id: ID of the plate. None is the plate of the actions without an ID.
+            - rail: Linear rail position of the plate
+        Return: Joint states of the slot, None if the plate already has a parked lid or all the slots are taken
+        """
+        with self.lock:
+            if plate_id in self.parked:
+                return None
+            used = set(self.parked.values())
+            free = [index for index in range(len(self.slots)) if index not in used]
+            if not free:
+                return None
+            index = min(free, key = lambda index: (self.is_blocking(index), abs(self.slots[index][5] - rail)))
+            self.parked[plate_id] = index
+            self.save()
+            return list(self.slots[index])
+
+    def resolve(self, plate_id):
+        """
+        Description: Plate ID of the parked lid to put back. Without an ID, the only parked lid is used.
+        """
+        with self.lock:
+            if plate_id is None and plate_id not in self.parked and len(self.parked) == 1:
+                return next(iter(self.parked))
+            return plate_id
+
+    def lookup(self, plate_id):
+        """
+        Description: Slot of the parked lid of the plate. Without an ID, the only parked lid is returned.
+        Return: Joint states of the slot, None if the plate has no parked lid
+        """
+        plate_id = self.resolve(plate_id)
+        with self.lock:
+            index = self.parked.get(plate_id)
+            if index is None or index >= len(self.slots):
+                return None
+            return list(self.slots[index])
+
+    def release(self, plate_id):
+        """
+        Description: Frees the slot of the plate after its lid was put back (or the lid could not be picked).
+        """
+        plate_id = self.resolve(plate_id)
+        with self.lock:
+            if self.parked.pop(plate_id, None) is not None:
+                self.save()
+
+    def blocks(self, pose:list, ignore = ()):
+        """
+        Description: Checks if a parked lid sits on the pose, e.g. on the rotation deck.
+        Parameters:
+            - pose: Joint states of the pose
+            - ignore: Plate IDs whose lids are not counted (a lid that is about to be picked)
+        """
+        with self.lock:
+            for plate_id, index in self.parked.items():
+                if plate_id in ignore:
+                    continue
+                if same_pose(self.slots[index], pose):
+                    return True
+            return False
+
+    def save(self):
+        if not self.path:
+            return
+        try:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok = True)
+            temporary = self.path + ".tmp"
+            with open(temporary, "w") as f:
+                json.dump({"parked": [[plate_id, index] for plate_id, index in self.parked.items()]}, f)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(temporary, self.path)
+        except OSError as err:
+            print("Lid buffer could not be saved: " + str(err))
+
+    def load(self):
+        """
+        Description: Reads the parked lids of the file. Slots added later with add_slot are matched by index.
+        """
+        try:
+            with open(self.path) as f:
+                self.parked = {plate_id: index for plate_id, index in json.load(f)["parked"]}
+        except (OSError, ValueError, KeyError, TypeError) as err:
+            print("Lid buffer could not be loaded: " + str(err))
+            self.parked = {}
+
+    def status(self):
+        with self.lock:
+            return {"slots": len(self.slots), "parked": {str(plate_id): index for plate_id, index in self.parked.items()}}
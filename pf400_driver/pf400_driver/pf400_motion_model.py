@@ -0,0 +1,129 @@
+import math
+
+from pf400_driver.pf400_motion_profiles import motion_profiles
+
+
+# 100% joint speeds in (mm or deg)/sec and joint accelerations in (mm or deg)/sec^2 of the PF400 SXL.
+# Joint order is the same as the joint states: J1 vertical rail, J2 shoulder, J3 elbow, J4 wrist, J5 gripper, J6 linear rail.
+# Taken from robot01.pac (DI 2700 and DI 2702) in resources/config_files.
+joint_speeds = [500.0, 360.0, 720.0, 720.0, 400.0, 750.0]
+joint_accels = [3500.0, 600.0, 920.0, 4000.0, 10000.0, 1000.0]
+
+
+class MotionModel():
+    """
+    Description: Predicts the duration of the PF400 movements from the joint speed and acceleration limits and the motion profiles.
+                 Joint moves are synchronized, so a move takes as long as its slowest joint with a trapezoidal velocity profile.
+                 The composite movements follow the sequences of PF400.pick_plate and PF400.place_plate.
+    Parameters:
+        - profiles: Motion profiles loaded on the robot. Profile 1 is profiles[0].
+        - neutral_joints: Neutral joint states of the arm. Rails are replaced by the target location's rails.
+        - above_height: Vertical distance between a location and its above position
+        - gripper_time: Duration of a grasp or release in seconds
+        - command_time: Round trip of a single command in seconds
+    """
+
+    def __init__(self, profiles:list = motion_profiles, neutral_joints:list = None, above_height:float = 100.0, gripper_time:float = 1.0, command_time:float = 0.02):
+        self.profiles = profiles
+        self.neutral_joints = neutral_joints or [400.0, 1.400, 177.101, 537.107, 77.0, 0.0]
+        self.above_height = above_height
+        self.gripper_time = gripper_time
+        self.command_time = command_time
+        self.joint_speeds = joint_speeds
+        self.joint_accels = joint_accels
+
+    def joint_time(self, distance:float, speed:float, accel:float):
+        """
+        Description: Duration of a single joint move with a trapezoidal (or triangular for short moves) velocity profile.
+        """
+        distance = abs(distance)
+        if distance == 0 or speed <= 0 or accel <= 0:
+            return 0.0
+        if distance < speed * speed / accel:
+            return 2 * math.sqrt(distance / accel)
+        return distance / speed + speed / accel
+
+    def move_time(self, start:list, target:list, profile:int = 1):
+        """
+        Description: Predicted duration of a movej from start to target joint states with the given motion profile.
+        """
+        speed_scale = self.profiles[profile - 1]["speed"] / 100
+        accel_scale = self.profiles[profile - 1]["acceleration"] / 100
+
+        slowest = 0.0
+        for joint in range(min(len(start), len(target), len(self.joint_speeds))):
+            if joint == 4:
+                continue # Gripper moves are not part of the arm motion
+            slowest = max(slowest, self.joint_time(target[joint] - start[joint], self.joint_speeds[joint] * speed_scale, self.joint_accels[joint] * accel_scale))
+        return slowest + self.command_time
+
+    def neutral_pose(self, location:list):
+        """
+        Description: Neutral pose above the location, as calculated by PF400.move_rails_neutral.
+        """
+        neutral = list(self.neutral_joints)
+        neutral[0] = location[0] + self.above_height
+        neutral[5] = location[5]
+        return neutral
+
+    def above_pose(self, location:list):
+        above = list(location)
+        above[0] += self.above_height
+        return above
+
+    def neutral_time(self, start:list, location:list):
+        """
+        Description: Predicted duration of PF400.move_all_joints_neutral from the start pose to the neutral pose of the location.
+        """
+        arm_neutral = list(self.neutral_joints)
+        arm_neutral[0] = start[0]
+        arm_neutral[5] = start[5]
+        return self.move_time(start, arm_neutral, 1) + self.move_time(arm_neutral, self.neutral_pose(location), 2)
+
+    def pick_time(self, start:list, source:list):
+        """
+        Description: Predicted duration of PF400.pick_plate. Ends at the neutral pose of the source.
+        """
+        neutral = self.neutral_pose(source)
+        above = self.above_pose(source)
+        return (self.neutral_time(start, source)
+                + self.move_time(neutral, above, 2)
+                + self.move_time(above, source, 2)
+                + self.gripper_time
+                + self.move_time(source, above, 1)
+                + self.move_time(above, neutral, 1))
+
+    def place_time(self, start:list, target:list):
+        """
+        Description: Predicted duration of PF400.place_plate. Ends at the neutral pose of the target.
+        """
+        neutral = self.neutral_pose(target)
+        above = self.above_pose(target)
+        return (self.neutral_time(start, target)
+                + self.move_time(neutral, above, 1)
+                + self.move_time(above, target, 1)
+                + self.gripper_time
+                + self.move_time(target, above, 1)
+                + self.move_time(above, neutral, 1))
+
+    def rotation_time(self, start:list, deck:list):
+        """
+        Description: Predicted duration of PF400.rotate_plate_on_deck. The plate is placed on the deck and grabbed again.
+        """
+        return self.place_time(start, deck) + self.pick_time(self.neutral_pose(deck), deck)
+
+    def transfer_time(self, start:list, source:list, target:list, deck:list = None):
+        """
+        Description: Predicted duration of PF400.transfer.
+        Parameters:
+            - start: Joint states of the arm before the transfer
+            - source, target: Joint states of the source and target locations
+            - deck: Joint states of the rotation deck if the plate has to be rotated
+        Return: Duration in seconds
+        """
+        duration = self.pick_time(start, source)
+        position = self.neutral_pose(source)
+        if deck:
+            duration += self.rotation_time(position, deck)
+            position = self.neutral_pose(deck)
+        return duration + self.place_time(position, target)
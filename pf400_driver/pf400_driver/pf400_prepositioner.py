@@ -0,0 +1,172 @@
+import threading
+import time
+
+from pf400_driver.pf400_motion_model import MotionModel
+
+
+def location_key(location:list):
+    """
+    Description: Location rounded to 1 mm or 1 degree, used to count the jobs per station.
+    """
+    return tuple(round(float(value)) for value in location)
+
+
+class Prepositioner():
+    """
+    Description: Moves the idle arm to the neutral pose of the likely next source, so that the next job starts without the neutral moves and the rail traverse.
+                 - The next source is a workflow hint, or the source that followed the last target in most of the earlier jobs.
+                 - The moves run on their own thread. A job for another station cancels them right away with a halt,
+                   a job for the same station waits for them to end.
+                 - The saved latency of a job is the predicted neutral move time from the pose before the pre-positioning
+                   minus the one from the pose at the job arrival, so a wrong prediction counts against it.
+    Parameters:
+        - robot: PF400 connection
+        - motion_model: Model that predicts the neutral move durations
+        - min_observations: Jobs that must have followed the last target before a prediction is made
+        - tolerance: Rail distance (mm) within which two locations have the same neutral pose
+    """
+
+    def __init__(self, robot, motion_model:MotionModel = None, min_observations:int = 2, tolerance:float = 1.0):
+        self.robot = robot
+        self.motion_model = motion_model or MotionModel()
+        self.min_observations = min_observations
+        self.tolerance = tolerance
+        self.enabled = True
+        self.lock = threading.Lock()
+        self.cancelled = threading.Event()
+        self.thread = None
+        self.target = None # Location of the current pre-positioning
+        self.start_pose = None
+        self.last_target = None
+        self.transitions = {} # target key -> {source key: jobs}
+        self.locations = {} # source key -> joint states
+        self.counts = {"started": 0, "completed": 0, "cancelled": 0, "hits": 0, "misses": 0}
+        self.saved_time = 0.0
+
+    def record(self, source:list, target:list):
+        """
+        Description: Adds a job to the history, as the source that followed the target of the previous job.
+        """
+        with self.lock:
+            if self.last_target is not None:
+                following = self.transitions.setdefault(location_key(self.last_target), {})
+                key = location_key(source)
+                following[key] = following.get(key, 0) + 1
+                self.locations[key] = list(source)
+            self.last_target = list(target)
+
+    def predict(self):
+        """
+        Description: Source that followed the last target in most of the earlier jobs.
+        Return: Joint states of the source, None without a clear majority of at least min_observations jobs
+        """
+        with self.lock:
+            if self.last_target is None:
+                return None
+            following = self.transitions.get(location_key(self.last_target))
+            if not following:
+                return None
+            key, jobs = max(following.items(), key = lambda item: item[1])
+            if jobs < self.min_observations or jobs * 2 <= sum(following.values()):
+                return None
+            return list(self.locations[key])
+
+    def same_station(self, location:list, other:list):
+        return abs(location[0] - other[0]) < self.tolerance and abs(location[5] - other[5]) < self.tolerance
+
+    def active(self):
+        return self.thread is not None and self.thread.is_alive()
+
+    def start(self, location:list = None):
+        """
+        Description: Starts moving the idle arm to the neutral pose of the next source.
+        Parameters:
+            - location: Next source given by the workflow. Predicted from the job history if not given.
+        Return: True if the arm is being pre-positioned
+        """
+        if not self.enabled:
+            return False
+        self.cancel()
+        location = location or self.predict()
+        if location is None:
+            return False
+
+        self.cancelled.clear()
+        self.start_pose = self.robot.get_joint_states()
+        self.target = list(location)
+        self.counts["started"] += 1
+        self.thread = threading.Thread(target = self.run, args = (self.target,), name = "pf400_preposition", daemon = True)
+        self.thread.start()
+        return True
+
+    def run(self, location:list):
+        # Same moves as PF400.move_all_joints_neutral(location), with a cancellation check between them
+        steps = (self.robot.move_gripper_neutral,
+                 self.robot.move_arm_neutral,
+                 lambda: self.robot.move_rails_neutral(location[0], location[5]))
+        try:
+            for step in steps:
+                if self.cancelled.is_set():
+                    return
+                step()
+
+            # Motion commands reply when the motion starts
+            while not self.cancelled.is_set():
+                self.robot.get_robot_movement_state()
+                if self.robot.movement_state <= 1:
+                    self.counts["completed"] += 1
+                    return
+                time.sleep(0.05)
+        except Exception as err:
+            print("Pre-positioning stopped: " + str(err))
+
+    def cancel(self):
+        """
+        Description: Stops the pre-positioning moves.
+        Return: True if moves were running
+        """
+        if not self.active():
+            return False
+        self.cancelled.set()
+        self.robot.halt()
+        self.thread.join()
+        self.robot.halt() # A move sent while the thread was checking the cancellation
+        self.counts["cancelled"] += 1
+        return True
+
+    def claim(self, location:list = None):
+        """
+        Description: Called when a job arrives. Keeps the pre-positioning to the station of the job and cancels any other one.
+        Parameters:
+            - location: First location of the job (transfer source, plate of a lid job). None cancels the pre-positioning.
+        Return: Saved latency of the job in seconds, None if the arm was not pre-positioned
+        """
+        target = self.target
+        self.target = None
+        if target is None:
+            return None
+
+        if location is not None and self.same_station(target, location):
+            if self.thread is not None:
+                self.thread.join()
+            self.counts["hits"] += 1
+        else:
+            self.cancel()
+            if location is None:
+                return None
+            self.counts["misses"] += 1
+
+        arrival_pose = self.robot.get_joint_states()
+        saved = self.motion_model.neutral_time(self.start_pose, location) - self.motion_model.neutral_time(arrival_pose, location)
+        self.saved_time += saved
+        return saved
+
+    def report(self):
+        """
+        Description: Pre-positioning counts, hit rate and saved latency (total and per pre-positioned job) in seconds.
+        """
+        jobs = self.counts["hits"] + self.counts["misses"]
+        return dict(self.counts,
+                    hit_rate = self.counts["hits"] / jobs if jobs else 0.0,
+                    saved_time = self.saved_time,
+                    mean_saved_time = self.saved_time / jobs if jobs else 0.0)
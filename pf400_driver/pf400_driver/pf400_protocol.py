@@ -0,0 +1,49 @@
+import numpy as np
+
+
+# Parsing of the TCS responses and building of the TCS commands.
+# Successful responses start with "0" followed by the values, e.g. "0 400.0 1.4 177.101 537.107 77.0 0.0" for wherej.
+
+
+def parse_values(response:str):
+    """
+    Description: Values of a successful response as floats, without the leading status.
+    """
+    return [float(value) for value in response.split(" ")[1:]]
+
+
+def parse_joint_states(response:str):
+    """
+    Description: Six joint states of a wherej response.
+    """
+    return parse_values(response)
+
+
+def parse_cartesian_coordinates(response:str):
+    """
+    Description: X/Y/Z Yaw/Pitch/Roll of a whereC response. The last value (robot configuration) is dropped.
+    """
+    return [float(value) for value in response.split(" ")[1:-1]]
+
+
+def parse_joint_states_batch(responses:list):
+    """
+    Description: Parses many wherej responses at once (telemetry, recordings).
+    Return: Array of shape (number of responses, 6)
+    """
+    values = " ".join(response.split(" ", 1)[1] for response in responses)
+    return np.array(values.split(), dtype = float).reshape(len(responses), -1)
+
+
+def move_joint_command(profile:int, joint_states:list):
+    """
+    Description: movej command to the joint states with the motion profile.
+    """
+    return "movej " + str(profile) + " " + " ".join(map(str, joint_states))
+
+
+def move_cartesian_command(profile:int, cartesian_coordinates:list):
+    """
+    Description: MoveC command to the X/Y/Z Yaw/Pitch/Roll coordinates with the motion profile.
+    """
+    return "MoveC " + str(profile) + " " + " ".join(map(str, cartesian_coordinates))
@@ -0,0 +1,52 @@
+import threading
+import time
+
+
+class ReadinessCache():
+    """
+    Description: Last known-good readiness of the robot (powered, attached, homed and in the ready system state), valid for a time window.
+                 - Only a get_overall_state that finds the robot ready (power, attach, home and system state) confirms it.
+                   The client state refresher polls it every 1.5 s while idle. A movement state poll cannot see a fault or an e-stop, so it never extends the window.
+                 - Any error response, a power off movement state, a power, attach or home command and a reconnect invalidate it.
+                 force_initialize_robot skips its state queries while the cache is valid.
+    Parameters:
+        - window: Seconds that a ready state stays valid without a new confirmation
+    """
+
+    def __init__(self, window:float = 5.0):
+        self.window = window
+        self.enabled = True
+        self.lock = threading.Lock()
+        self.confirmed = None # Time of the last confirmation, None when invalid
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = {} # reason -> count
+
+    def confirm(self):
+        with self.lock:
+            self.confirmed = time.monotonic()
+
+    def invalidate(self, reason:str):
+        with self.lock:
+            self.confirmed = None
+            self.invalidations[reason] = self.invalidations.get(reason, 0) + 1
+
+    def valid(self):
+        """
+        Description: Checks if the robot is known to be ready, and counts the hits and misses.
+        """
+        with self.lock:
+            valid = self.enabled and self.confirmed is not None and time.monotonic() - self.confirmed < self.window
+            if valid:
+                self.hits += 1
+            else:
+                self.misses += 1
+            return valid
+
+    def stats(self):
+        with self.lock:
+            checks = self.hits + self.misses
+            return {"hits": self.hits,
+                    "misses": self.misses,
+                    "hit_rate": round(self.hits / checks, 4) if checks else 0.0,
+                    "invalidations": dict(self.invalidations)}
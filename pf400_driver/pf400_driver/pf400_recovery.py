@@ -0,0 +1,136 @@
+import threading
+import time
+
+from pf400_driver.errors import CommandException, ConnectionException
+
+# Recovery policy of every controller error code (pf400_error_codes)
+#   - action: retry (repeat the work), reattach (attach the robot again), reinitialize (power, attach and home as needed),
+#             rehome (home the joints), replan (go back to the neutral pose and plan the moves again), abort (needs an operator or a code fix)
+#   - retries: Maximum recovery attempts
+#   - backoff: Wait before the first attempt in seconds, doubled for every next attempt
+recovery_policies = {
+    "-1009": {"action": "reattach", "retries": 3, "backoff": 1.0}, # No robot attached
+    "-1012": {"action": "replan", "retries": 1, "backoff": 0.5}, # Joint out-of-range
+    "-1039": {"action": "abort", "retries": 0, "backoff": 0.0}, # Position too close
+    "-1040": {"action": "abort", "retries": 0, "backoff": 0.0}, # Position too far
+    "-1042": {"action": "replan", "retries": 2, "backoff": 0.5}, # Can't change robot config
+    "-1046": {"action": "reinitialize", "retries": 3, "backoff": 2.0}, # Power not enabled
+    "-1600": {"action": "reinitialize", "retries": 3, "backoff": 5.0}, # Power off requested
+    "-2800": {"action": "abort", "retries": 0, "backoff": 0.0},
+    "-2801": {"action": "abort", "retries": 0, "backoff": 0.0},
+    "-2802": {"action": "abort", "retries": 0, "backoff": 0.0},
+    "-2803": {"action": "abort", "retries": 0, "backoff": 0.0},
+    "-2804": {"action": "abort", "retries": 0, "backoff": 0.0},
+    "-2805": {"action": "abort", "retries": 0, "backoff": 0.0},
+    "-2806": {"action": "retry", "retries": 3, "backoff": 0.5}, # Command exception
+    "-2807": {"action": "abort", "retries": 0, "backoff": 0.0},
+    "-2808": {"action": "retry", "retries": 3, "backoff": 0.5}, # Not allowed by this thread
+    "-2809": {"action": "abort", "retries": 0, "backoff": 0.0},
+    "-2810": {"action": "abort", "retries": 0, "backoff": 0.0},
+    "-2811": {"action": "abort", "retries": 0, "backoff": 0.0},
+    "-2812": {"action": "retry", "retries": 1, "backoff": 0.0}, # Robot already selected
+    "-2813": {"action": "reinitialize", "retries": 2, "backoff": 1.0}, # Module not initialized
+    "-2814": {"action": "abort", "retries": 0, "backoff": 0.0},
+    "-2816": {"action": "abort", "retries": 0, "backoff": 0.0},
+    "-2817": {"action": "abort", "retries": 0, "backoff": 0.0},
+    "-2818": {"action": "abort", "retries": 0, "backoff": 0.0},
+    "-2819": {"action": "abort", "retries": 0, "backoff": 0.0},
+    "-2820": {"action": "abort", "retries": 0, "backoff": 0.0},
+    "-2821": {"action": "abort", "retries": 0, "backoff": 0.0},
+    "-2822": {"action": "abort", "retries": 0, "backoff": 0.0},
+    "-2823": {"action": "abort", "retries": 0, "backoff": 0.0},
+    "-3122": {"action": "reinitialize", "retries": 2, "backoff": 2.0}, # Soft envelope error, the controller disables the power
+    "timeout": {"action": "reinitialize", "retries": 2, "backoff": 1.0}, # No response or a motion past its deadline, the link was replaced
+    "default": {"action": "abort", "retries": 0, "backoff": 0.0}
+}
+
+
+class RecoveryEngine():
+    """
+    Description: Clears the controller faults of a PF400 with the recovery policy of their error code (recovery_policies).
+                 - The recovery action of the policy is repeated until the robot is ready again and the failed work succeeds,
+                   up to the retries of the policy and with an exponential backoff.
+                 - Faults, recoveries, attempts and the mean time to recovery are counted per error code, for the faults that a policy ran for.
+                   Faults with an abort policy or found while the engine is disabled are only counted in unhandled.
+    Parameters:
+        - robot: PF400 connection
+        - policies: Policies that replace the default ones, keyed by error code
+    """
+
+    def __init__(self, robot, policies:dict = None):
+        self.robot = robot
+        self.policies = dict(recovery_policies)
+        self.policies.update(policies or {})
+        self.enabled = True
+        self.lock = threading.Lock()
+        self.stats = {} # error code -> counts and recovery time
+        self.unhandled = {} # error code -> faults that no recovery ran for
+
+    def policy(self, error_code:str):
+        return self.policies.get(str(error_code), self.policies["default"])
+
+    def run_action(self, action:str):
+        if action == "reattach":
+            self.robot.attach_robot()
+        elif action == "reinitialize":
+            self.robot.initialize_robot()
+        elif action == "rehome":
+            self.robot.home_robot()
+        elif action == "replan":
+            self.robot.move_all_joints_neutral()
+
+    def recover(self, error_code:str, operation = None, since:float = None):
+        """
+        Description: Runs the recovery policy of the error code.
+        Parameters:
+            - error_code: Error code of the fault
+            - operation: Function that repeats the failed work once the robot is ready (e.g. resume_transfer), True on success.
+                         Without it, the fault is cleared when the robot is ready again.
+            - since: Time of the fault (time.time()), now if not given. The time to recovery is counted from it.
+        Return: True if the fault was cleared
+        """
+        policy = self.policy(error_code)
+        start = since or time.time()
+        recovered = False
+        attempts = 0
+
+        if not self.enabled or policy["action"] == "abort" or policy["retries"] == 0:
+            with self.lock:
+                self.unhandled[str(error_code)] = self.unhandled.get(str(error_code), 0) + 1
+            print("Fault " + str(error_code) + " has no recovery (" + policy["action"] + "), operator intervention needed.")
+            return False
+
+        while attempts < policy["retries"] and not recovered:
+            self.robot.settle(policy["backoff"] * 2 ** attempts)
+            attempts += 1
+            try:
+                self.run_action(policy["action"])
+                if self.robot.get_overall_state() != 0:
+                    continue # Robot is not ready, the next attempt runs the action again
+                recovered = operation() is True if operation else True
+            except (CommandException, ConnectionException, OSError) as err:
+                print("Recovery attempt " + str(attempts) + " of " + str(error_code) + " failed: " + str(err))
+
+        with self.lock:
+            stats = self.stats.setdefault(str(error_code), {"faults": 0, "recovered": 0, "aborted": 0, "attempts": 0, "recovery_time": 0.0})
+            stats["faults"] += 1
+            stats["attempts"] += attempts
+            if recovered:
+                stats["recovered"] += 1
+                stats["recovery_time"] += time.time() - start
+            else:
+                stats["aborted"] += 1
+
+        if not recovered:
+            print("Fault " + str(error_code) + " was not recovered (" + policy["action"] + "), operator intervention needed.")
+        return recovered
+
+    def report(self):
+        """
+        Description: Faults, recoveries, aborts, attempts and mean time to recovery (seconds) per error code.
+        """
+        with self.lock:
+            report = {}
+            for error_code, stats in self.stats.items():
+                report[error_code] = dict(stats, mttr = stats["recovery_time"] / stats["recovered"] if stats["recovered"] else None)
+            return report
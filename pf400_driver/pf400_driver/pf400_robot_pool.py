@@ -0,0 +1,185 @@
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+from pf400_driver.errors import CommandException
+from pf400_driver.pf400_motion_model import MotionModel
+
+
+class PooledArm():
+    """
+    Description: One PF400 of a RobotPool with its own job queue and worker thread.
+    """
+
+    def __init__(self, name:str, robot):
+        self.name = name
+        self.robot = robot
+        self.jobs = queue.Queue()
+        self.available_at = time.time() # Predicted time when all queued jobs are done
+        self.last_pose = None # Predicted pose after the queued jobs
+        self.time_scale = 1.0 # Measured duration / predicted duration, smoothed
+        self.completed = 0
+        self.failed = 0
+        self.busy_time = 0.0
+        self.worker = None
+
+
+class RobotPool():
+    """
+    Description: Drives several PF400 arms from one process.
+                 - Every arm has its own connection (and I/O actor), job queue and worker thread, so arms move in parallel.
+                 - Locations are kept in a shared store, per arm, because each arm reaches a station with its own joint states.
+                 - A transfer is dispatched to the arm that can reach both endpoints and is predicted to finish it first.
+                 - A transfer that ends with a robot warning (missing plate, interrupted, ...) fails its future with CommandException.
+    Parameters:
+        - robots: Dictionary of arm name to PF400 connection
+        - motion_model: Model that predicts the transfer durations
+    """
+
+    def __init__(self, robots:dict = None, motion_model:MotionModel = None):
+        self.motion_model = motion_model or MotionModel()
+        self.arms = {}
+        self.locations = {} # location name -> {arm name: joint states}
+        self.locations_lock = threading.Lock()
+        self.dispatch_lock = threading.Lock()
+        self.start_time = time.time()
+
+        for name, robot in (robots or {}).items():
+            self.add_robot(name, robot)
+
+    @classmethod
+    def from_hosts(cls, hosts:dict, motion_model:MotionModel = None):
+        """
+        Description: Connects to every arm and creates the pool.
+        Parameters:
+            - hosts: Dictionary of arm name to (host, port)
+        """
+        from pf400_driver.pf400_driver import PF400
+        return cls({name: PF400(host, port) for name, (host, port) in hosts.items()}, motion_model)
+
+    def add_robot(self, name:str, robot):
+        """
+        Description: Adds an arm to the pool and starts its worker thread.
+        """
+        arm = PooledArm(name, robot)
+        arm.worker = threading.Thread(target = self.run_jobs, args = (arm,), name = "pf400_pool_" + name, daemon = True)
+        self.arms[name] = arm
+        arm.worker.start()
+
+    def add_location(self, location_name:str, arm_name:str, joint_states:list):
+        """
+        Description: Saves the joint states an arm uses to reach a location.
+        """
+        with self.locations_lock:
+            self.locations.setdefault(location_name, {})[arm_name] = list(joint_states)
+
+    def get_location(self, location_name:str, arm_name:str):
+        with self.locations_lock:
+            return list(self.locations[location_name][arm_name])
+
+    def can_reach(self, arm_name:str, location_name:str):
+        with self.locations_lock:
+            return arm_name in self.locations.get(location_name, {})
+
+    def predicted_finish(self, arm:PooledArm, source:list, target:list, rotation:bool):
+        """
+        Description: Predicted time when the arm would finish the transfer if it was queued now.
+        Return: Finish time and the model duration, before the time scale of the arm
+        """
+        start_pose = arm.last_pose or source
+        deck = arm.robot.plate_ratation_deck if rotation else None
+        duration = self.motion_model.transfer_time(start_pose, source, target, deck)
+        return max(time.time(), arm.available_at) + duration * arm.time_scale, duration
+
+    def submit_transfer(self, source:str, target:str, source_plate_rotation:str = "", target_plate_rotation:str = ""):
+        """
+        Description: Queues a transfer between two named locations on the arm that can do it soonest.
+        Parameters:
+            - source: Name of the source location
+            - target: Name of the target location
+            - source_plate_rotation: narrow or wide
+            - target_plate_rotation: narrow or wide
+        Return: Future that is completed with the name of the arm when the transfer is done
+        """
+        rotation = (source_plate_rotation.lower() == "wide") != (target_plate_rotation.lower() == "wide")
+
+        with self.dispatch_lock:
+            best = None
+            for arm in self.arms.values():
+                if not (self.can_reach(arm.name, source) and self.can_reach(arm.name, target)):
+                    continue
+                source_joints = self.get_location(source, arm.name)
+                target_joints = self.get_location(target, arm.name)
+                finish, duration = self.predicted_finish(arm, source_joints, target_joints, rotation)
+                if best is None or finish < best[0]:
+                    best = (finish, duration, arm, source_joints, target_joints)
+
+            if best is None:
+                raise ValueError("No arm can reach both {} and {}".format(source, target))
+
+            finish, duration, arm, source_joints, target_joints = best
+            arm.available_at = finish
+            arm.last_pose = self.motion_model.neutral_pose(target_joints)
+
+            future = Future()
+            arm.jobs.put((future, duration, (source_joints, target_joints, source_plate_rotation, target_plate_rotation)))
+            return future
+
+    def run_jobs(self, arm:PooledArm):
+        while True:
+            future, predicted, transfer_args = arm.jobs.get()
+            if future is None:
+                break
+            if not future.set_running_or_notify_cancel():
+                continue
+
+            start = time.time()
+            failed = True
+            try:
+                arm.robot.transfer(*transfer_args)
+            except Exception as err:
+                future.set_exception(err)
+            else:
+                warning = arm.robot.robot_warning
+                if warning and warning.upper() != "CLEAR":
+                    future.set_exception(CommandException(err_message = "Transfer failed on " + arm.name + ": " + warning))
+                else:
+                    future.set_result(arm.name)
+                    failed = False
+            finally:
+                duration = time.time() - start
+                arm.busy_time += duration
+                if failed:
+                    arm.failed += 1
+                else:
+                    arm.completed += 1
+                # predicted is the unscaled model duration, so the scale converges to the measured / predicted ratio
+                if predicted > 0 and not failed:
+                    arm.time_scale = 0.8 * arm.time_scale + 0.2 * duration / predicted
+                if arm.jobs.empty():
+                    arm.available_at = time.time()
+
+    def stats(self):
+        """
+        Description: Completed transfers, utilization of each arm and the aggregate plate moves per hour since the pool was created.
+        """
+        elapsed = max(time.time() - self.start_time, 1e-9)
+        arms = {arm.name: {"completed": arm.completed,
+                           "failed": arm.failed,
+                           "queued": arm.jobs.qsize(),
+                           "utilization": round(arm.busy_time / elapsed, 3),
+                           "time_scale": round(arm.time_scale, 3)} for arm in self.arms.values()}
+        completed = sum(arm.completed for arm in self.arms.values())
+        return {"arms": arms, "completed": completed, "plates_per_hour": round(completed * 3600 / elapsed, 1)}
+
+    def shutdown(self, wait:bool = True):
+        """
+        Description: Stops the workers after their queued jobs and disconnects the arms.
+        """
+        for arm in self.arms.values():
+            arm.jobs.put((None, 0, None))
+        if wait:
+            for arm in self.arms.values():
+                arm.worker.join()
+                arm.robot.disconnect()
@@ -0,0 +1,372 @@
+#!/usr/bin/env python3
+
+import argparse
+import random
+import socketserver
+import threading
+import time
+
+from pf400_driver.pf400_kinematics import KINEMATICS
+from pf400_driver.pf400_motion_model import MotionModel
+from pf400_driver.pf400_motion_profiles import motion_profiles
+from pf400_driver.errors import TimeoutException
+from pf400_driver.pf400_transport import Transport
+
+
+class PF400Simulator(KINEMATICS):
+    """
+    Description: In-memory model of the PF400 TCS command server.
+                 - Answers the commands used by PF400 with the same response formats as the robot ("0 ..." or a negative error code).
+                 - Motion commands reply when the motion starts. A second motion command waits for the first one to end, like on the robot.
+                 - Motion durations come from the MotionModel with the profiles that were sent to the simulator.
+                   time_scale = 0 completes every motion instantly, 1 is real time, 0.1 is ten times faster.
+                 - Faults can be injected to exercise the error handling: power_off(), detach(), inject_error(), hang() and a random fault_rate.
+    Parameters:
+        - time_scale: Scale of the simulated motion durations. 0 for zero-time motion.
+        - grasp_success: Probability that GraspPlate finds a plate
+        - fault_rate: Probability that a command is answered with a random error code of faults
+        - faults: Error codes used by the random faults
+        - seed: Seed of the random plate and fault generator
+    """
+
+    motion_commands = ("movej", "movec", "moveoneaxis", "moveextraaxis", "graspplate", "releaseplate", "gripper", "home")
+
+    def __init__(self, time_scale:float = 0.0, grasp_success:float = 1.0, fault_rate:float = 0.0, faults:list = None, seed:int = None):
+        super().__init__()
+        self.time_scale = time_scale
+        self.grasp_success = grasp_success
+        self.fault_rate = fault_rate
+        self.faults = faults or ["-1046", "-1012", "-3100"]
+        self.random = random.Random(seed)
+        self.lock = threading.RLock()
+
+        self.power = True
+        self.attached = True
+        self.homed = True
+        self.profiles = [dict(profile) for profile in motion_profiles] + [dict(motion_profiles[0])]
+        self.motion_model = MotionModel(self.profiles)
+        self.gripper_open_position = 130.0
+        self.gripper_closed_position = 77.0
+        self.holding_plate = False
+        self.pending_errors = []
+        self.hang_until = 0.0 # Commands are not answered before this time
+
+        self.joints = [400.0, 1.400, 177.101, 537.107, 77.0, 0.0]
+        self.motion_start = 0.0
+        self.motion_end = 0.0
+        self.start_joints = list(self.joints)
+        self.target_joints = list(self.joints)
+
+        self.commands = 0
+        self.motion_time = 0.0 # Unscaled duration of all the simulated motions, in seconds
+
+    # Faults
+
+    def power_off(self):
+        with self.lock:
+            self.halt_motion()
+            self.power = False
+            self.attached = False
+
+    def detach(self):
+        with self.lock:
+            self.attached = False
+
+    def inject_error(self, error_code:str, count:int = 1):
+        """
+        Description: Answers the next commands with the error code instead of running them.
+        """
+        with self.lock:
+            self.pending_errors.extend([error_code] * count)
+
+    def hang(self, seconds:float):
+        """
+        Description: Stops answering for the given seconds, like a controller behind a half-open connection. Responses are sent when it ends.
+        """
+        with self.lock:
+            self.hang_until = time.time() + seconds
+
+    def hang_time(self):
+        return max(self.hang_until - time.time(), 0.0)
+
+    # Motion
+
+    def current_joints(self, now:float = None):
+        now = time.time() if now is None else now
+        if now >= self.motion_end:
+            return list(self.target_joints)
+        progress = (now - self.motion_start) / (self.motion_end - self.motion_start)
+        return [start + (target - start) * progress for start, target in zip(self.start_joints, self.target_joints)]
+
+    def movement_state(self):
+        """
+        Description: 0 = Power off, 1 = Stopped, 2 = Acceleration, 3 = Deceleration
+        """
+        if not self.power:
+            return 0
+        now = time.time()
+        if now >= self.motion_end:
+            return 1
+        return 2 if now < (self.motion_start + self.motion_end) / 2 else 3
+
+    def wait_for_motion(self):
+        """
+        Description: Blocks the next motion command until the current one ends.
+        """
+        delay = self.motion_end - time.time()
+        if delay > 0:
+            time.sleep(delay)
+
+    def start_motion(self, target:list, profile:int, duration:float = None):
+        self.joints = self.current_joints()
+        if duration is None:
+            duration = self.motion_model.move_time(self.joints, target, profile) - self.motion_model.command_time
+
+        self.motion_time += max(duration, 0.0)
+        self.start_joints = list(self.joints)
+        self.target_joints = list(target)
+        self.motion_start = time.time()
+        self.motion_end = self.motion_start + max(duration, 0.0) * self.time_scale
+        if self.time_scale == 0:
+            self.joints = list(target)
+
+    def halt_motion(self):
+        self.joints = self.current_joints()
+        self.start_joints = list(self.joints)
+        self.target_joints = list(self.joints)
+        self.motion_end = time.time()
+
+    def get_cartesian_coordinates(self):
+        """
+        Description: KINEMATICS replaces x, y, z and yaw. Pitch and roll of the PF400 gripper are fixed.
+        """
+        return [0.0, 0.0, 0.0, 0.0, 90.0, 180.0]
+
+    # Command handling
+
+    def handle(self, command:str):
+        """
+        Description: Runs a command and returns the response line without the line ending.
+        """
+        words = command.strip().split()
+        if not words:
+            return "-2805"
+        verb = words[0].lower()
+
+        if self.hang_time() > 0:
+            time.sleep(self.hang_time())
+
+        if verb in self.motion_commands:
+            # Waits outside the lock, so the status queries of other connections are still answered
+            self.wait_for_motion()
+
+        with self.lock:
+            self.commands += 1
+
+            if self.pending_errors:
+                return self.pending_errors.pop(0)
+            if self.fault_rate and verb not in ("state", "wherej", "wherec") and self.random.random() < self.fault_rate:
+                return self.random.choice(self.faults)
+
+            handler = getattr(self, "command_" + verb, None)
+            if handler is None:
+                return "-2805"
+
+            if verb in self.motion_commands and not (self.power and self.attached):
+                return "-1046" if not self.power else "-1009"
+
+            try:
+                return handler(words[1:])
+            except (ValueError, IndexError, UnboundLocalError):
+                return "-2800"
+
+    def command_mode(self, args):
+        return "0"
+
+    def command_selectrobot(self, args):
+        return "0"
+
+    def command_hp(self, args):
+        if args:
+            self.power = args[0] != "0"
+            if not self.power:
+                self.halt_motion()
+            return "0"
+        return "0 " + ("1" if self.power else "0")
+
+    def command_attach(self, args):
+        if args:
+            if not self.power:
+                return "-1046"
+            self.attached = args[0] != "0"
+            return "0"
+        return "0 " + ("1" if self.attached else "0")
+
+    def command_pd(self, args):
+        if args and args[0] == "2800":
+            return "0 " + ("1" if self.homed else "0")
+        return "-2800"
+
+    def command_home(self, args):
+        self.homed = True
+        return "0"
+
+    def command_sysstate(self, args):
+        return "0 21" if self.power and self.attached and self.homed else "0 7"
+
+    def command_state(self, args):
+        return "0 " + str(self.movement_state())
+
+    def command_wherej(self, args):
+        return "0 " + " ".join("{:.3f}".format(joint) for joint in self.current_joints())
+
+    def command_wherec(self, args):
+        joints = self.current_joints()
+        cartesian, phi, rail = self.forward_kinematics(joints)
+        config = 1 if joints[2] < 180 else 2
+        return "0 " + " ".join("{:.3f}".format(value) for value in cartesian) + " " + str(config)
+
+    def command_profile(self, args):
+        index = int(args[0])
+        values = [float(value) for value in args[1:]]
+        keys = ["speed", "speed2", "acceleration", "deceleration", "accelramp", "decelramp", "inrange", "straight"]
+        if len(values) != len(keys):
+            return "-2800"
+        while len(self.profiles) < index:
+            self.profiles.append(dict(motion_profiles[0]))
+        self.profiles[index - 1] = dict(zip(keys, values))
+        return "0"
+
+    def command_gripopenpos(self, args):
+        self.gripper_open_position = float(args[0])
+        return "0"
+
+    def command_gripclosepos(self, args):
+        self.gripper_closed_position = float(args[0])
+        return "0"
+
+    def command_movej(self, args):
+        profile = int(args[0])
+        target = [float(value) for value in args[1:7]]
+        if len(target) != 6:
+            return "-2800"
+        self.start_motion(target, profile)
+        return "0"
+
+    def command_movec(self, args):
+        profile = int(args[0])
+        cartesian = [float(value) for value in args[1:7]]
+        if len(cartesian) < 4:
+            return "-2800"
+        joints = self.current_joints()
+        current_cartesian, phi, rail = self.forward_kinematics(joints)
+        try:
+            target = self.inverse_kinematics(cartesian, phi, rail, joints[4])
+        except (ValueError, ZeroDivisionError):
+            return "-1040" # Position too far
+        self.start_motion(target, profile)
+        return "0"
+
+    def command_moveoneaxis(self, args):
+        axis = int(args[0])
+        target = self.current_joints()
+        target[axis - 1] = float(args[1])
+        self.start_motion(target, int(args[2]) if len(args) > 2 else 1)
+        return "0"
+
+    def command_moveextraaxis(self, args):
+        return "0"
+
+    def move_gripper(self, position:float):
+        target = self.current_joints()
+        target[4] = position
+        self.start_motion(target, 1, duration = 0.2)
+
+    def command_gripper(self, args):
+        self.move_gripper(self.gripper_open_position if args[0] == "1" else self.gripper_closed_position)
+        if args[0] == "1":
+            self.holding_plate = False
+        return "0"
+
+    def command_graspplate(self, args):
+        width = float(args[0])
+        self.move_gripper(width)
+        self.holding_plate = self.random.random() < self.grasp_success
+        return "0 -1" if self.holding_plate else "0 0"
+
+    def command_releaseplate(self, args):
+        self.move_gripper(float(args[0]))
+        self.holding_plate = False
+        return "0"
+
+    def command_halt(self, args):
+        self.halt_motion()
+        return "0"
+
+
+class SimulatorTransport(Transport):
+    """
+    Description: In-process transport to a PF400Simulator. No sockets, so a command costs a function call.
+    Parameters:
+        - simulator: Simulated controller. A zero-time simulator is created if None.
+    """
+
+    def __init__(self, simulator:PF400Simulator = None):
+        super().__init__()
+        self.simulator = simulator or PF400Simulator()
+
+    def exchange(self, command:str, timeout:float = None):
+        self.count(command)
+        if timeout is not None and self.simulator.hang_time() > timeout:
+            time.sleep(timeout)
+            raise TimeoutException(err_message="No response to " + command.split(" ", 1)[0] + " in " + str(timeout) + "s")
+        return self.simulator.handle(command)
+
+
+class SimulatorRequestHandler(socketserver.StreamRequestHandler):
+
+    def handle(self):
+        for line in self.rfile:
+            command = line.decode("ascii").strip()
+            if command:
+                self.wfile.write(self.server.simulator.handle(command).encode("ascii") + b"\r\n")
+
+
+class SimulatorServer(socketserver.ThreadingTCPServer):
+    """
+    Description: TCP server of a PF400Simulator that can stand in for the robot (TelnetTransport or SocketTransport).
+    """
+
+    allow_reuse_address = True
+    daemon_threads = True
+
+    def __init__(self, simulator:PF400Simulator, host:str = "127.0.0.1", port:int = 10100):
+        self.simulator = simulator
+        super().__init__((host, port), SimulatorRequestHandler)
+
+    def start(self):
+        """
+        Description: Serves in a background thread. Use port 0 to get a free port (server_address).
+        """
+        thread = threading.Thread(target = self.serve_forever, name = "pf400_simulator", daemon = True)
+        thread.start()
+        return thread
+
+
+def main():
+    parser = argparse.ArgumentParser(description = "PF400 controller simulator on a TCP port")
+    parser.add_argument("--host", default = "127.0.0.1")
+    parser.add_argument("--port", type = int, default = 10100)
+    parser.add_argument("--time-scale", type = float, default = 1.0, help = "Scale of the motion durations, 0 for instant motion")
+    parser.add_argument("--grasp-success", type = float, default = 1.0, help = "Probability of finding a plate on GraspPlate")
+    parser.add_argument("--fault-rate", type = float, default = 0.0, help = "Probability of answering a command with an error code")
+    args = parser.parse_args()
+
+    simulator = PF400Simulator(args.time_scale, args.grasp_success, args.fault_rate)
+    server = SimulatorServer(simulator, args.host, args.port)
+    print("PF400 simulator listening on {}:{}".format(*server.server_address))
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
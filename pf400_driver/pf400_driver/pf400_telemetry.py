@@ -0,0 +1,171 @@
+import os
+import threading
+import time
+
+import numpy as np
+
+
+# One telemetry sample: timestamp, the six joint states returned by wherej (mm or deg) and the movement state
+sample_dtype = np.dtype([("time", "<f8"), ("joints", "<f8", (6,)), ("movement_state", "<i4")])
+header_size = 8 # Number of samples written so far, int64 at the beginning of the file
+
+
+class TelemetryRingBuffer():
+    """
+    Description: Fixed-size ring buffer of telemetry samples in a NumPy structured array. Memory use does not grow with uptime.
+                 If a path is given the buffer is a memory-mapped file, so the samples survive a restart and other processes can map the same file.
+    Parameters:
+        - capacity: Number of samples kept
+        - path: Optional path of the memory-mapped file
+    """
+
+    def __init__(self, capacity:int = 60000, path:str = None):
+        self.capacity = capacity
+        self.path = path
+
+        if path is None:
+            self.count = np.zeros(1, dtype = "<i8")
+            self.samples = np.zeros(capacity, dtype = sample_dtype)
+        else:
+            file_size = header_size + capacity * sample_dtype.itemsize
+            mode = "r+" if os.path.exists(path) and os.path.getsize(path) == file_size else "w+"
+            self.count = np.memmap(path, dtype = "<i8", mode = mode, shape = (1,))
+            self.samples = np.memmap(path, dtype = sample_dtype, mode = "r+", offset = header_size, shape = (capacity,))
+
+    def __len__(self):
+        return int(min(self.count[0], self.capacity))
+
+    def append(self, timestamp:float, joints:list, movement_state:int):
+        """
+        Description: Writes a sample over the oldest one. The sample counter is updated after the data, so readers never see a partial sample.
+        """
+        index = self.count[0] % self.capacity
+        sample = self.samples[index]
+        sample["time"] = timestamp
+        sample["joints"] = joints
+        sample["movement_state"] = movement_state
+        self.count[0] += 1
+
+    def latest(self):
+        """
+        Description: Latest sample or None if the buffer is empty.
+        """
+        if self.count[0] == 0:
+            return None
+        return self.samples[(self.count[0] - 1) % self.capacity].copy()
+
+    def views(self):
+        """
+        Description: Zero-copy views of the samples in chronological order.
+                     The ring wraps around, so the samples are returned as two arrays (older part, newer part). Either part can be empty.
+        """
+        count = int(self.count[0])
+        if count <= self.capacity:
+            return self.samples[:count], self.samples[:0]
+        start = count % self.capacity
+        return self.samples[start:], self.samples[:start]
+
+    def snapshot(self):
+        """
+        Description: Copy of all the samples in chronological order as one array, for offline analysis.
+        """
+        older, newer = self.views()
+        return np.concatenate((older, newer))
+
+    def flush(self):
+        if isinstance(self.samples, np.memmap):
+            self.samples.flush()
+            self.count.flush()
+
+
+class TelemetryRecorder():
+    """
+    Description: Samples wherej and state on a PF400 connection (normally the status port) at a fixed rate into a TelemetryRingBuffer.
+    Parameters:
+        - robot: PF400 connection to sample
+        - rate: Sampling rate in Hz
+        - capacity: Number of samples kept in the ring buffer
+        - path: Optional path of the memory-mapped buffer file
+        - readiness: ReadinessCache of the command connection, invalidated by error and power off samples.
+                     The cache of robot if not given, pass the one of the command connection when robot is the status port.
+    """
+
+    def __init__(self, robot, rate:float = 50.0, capacity:int = 60000, path:str = None, readiness = None):
+        self.robot = robot
+        self.readiness = readiness if readiness is not None else getattr(robot, "readiness", None)
+        self.rate = rate
+        self.buffer = TelemetryRingBuffer(capacity, path)
+        self.errors = 0
+        self.running = False
+        self.thread = None
+
+    def start(self):
+        if self.running:
+            return
+        self.running = True
+        self.thread = threading.Thread(target = self.run, name = "pf400_telemetry", daemon = True)
+        self.thread.start()
+
+    def stop(self):
+        self.running = False
+        if self.thread:
+            self.thread.join()
+        self.buffer.flush()
+
+    def sample(self):
+        """
+        Description: Queries wherej and state together and appends the sample. Error responses are counted and skipped.
+        """
+        timeout = getattr(self.robot, "command_timeout", None)
+        requests = [self.robot.io.submit("wherej", timeout), self.robot.io.submit("state", timeout)]
+        joint_msg, state_msg = [self.robot.io.wait(request, timeout) for request in requests]
+        timestamp = time.time()
+
+        for response in (joint_msg, state_msg):
+            if response.startswith("-") and self.readiness is not None:
+                self.readiness.invalidate("error " + response.split(" ")[0])
+
+        try:
+            joints = [float(joint) for joint in joint_msg.split(" ")[1:7]]
+            movement_state = int(float(state_msg.split(" ")[1]))
+        except (ValueError, IndexError):
+            self.errors += 1
+            return
+
+        if len(joints) != 6 or joint_msg.startswith("-"):
+            self.errors += 1
+            return
+
+        self.buffer.append(timestamp, joints, movement_state)
+        self.robot.movement_state = movement_state
+
+        # A power off invalidates the known-good state of the command connection
+        if movement_state == 0 and self.readiness is not None:
+            self.readiness.invalidate("power off")
+
+    def run(self):
+        period = 1.0 / self.rate
+        next_sample = time.perf_counter()
+
+        while self.running:
+            try:
+                self.sample()
+            except Exception:
+                self.errors += 1
+
+            # Keep a fixed schedule. If sampling fell behind, skip the missed ticks instead of bursting.
+            next_sample += period
+            delay = next_sample - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            else:
+                next_sample = time.perf_counter()
+
+    def latest_joint_state(self):
+        """
+        Description: Latest sampled joint states converted for the ROS joint state publisher, or None if there are no samples yet.
+        """
+        sample = self.buffer.latest()
+        if sample is None:
+            return None
+        return self.robot.joint_state_to_ros(sample["joints"])
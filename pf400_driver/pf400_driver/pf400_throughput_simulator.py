@@ -0,0 +1,291 @@
+#!/usr/bin/env python3
+
+import argparse
+import heapq
+import json
+import random
+from collections import deque
+
+from pf400_driver.pf400_instrumentation import Histogram
+from pf400_driver.pf400_motion_model import MotionModel
+
+
+# Module locations of the PF400_CAMERA explorer before a workcell map is loaded
+default_layout = {"Sciclops": [222.0, -38.068, 335.876, 325.434, 79.923, 995.062],
+                  "OT2_Alpha": [243.034, -31.484, 276.021, 383.640, 124.807, -585.407],
+                  "OT2_Betha": [163.230, -59.032, 270.965, 415.013, 129.982, -951.510],
+                  "Sealer": [201.128, -2.814, 264.373, 365.863, 79.144, 411.553],
+                  "Peeler": [262.550, 20.608, 119.290, 662.570, 0.0, 0],
+                  "Azenta": [201.128, -2.814, 264.373, 365.863, 79.144, 411.553],
+                  "Hidex": [262.550, 20.608, 119.290, 662.570, 0.0, 0],
+                  "Biometra": [247.0, 40.698, 38.294, 728.332, 123.077, 301.082]}
+
+# PF400.plate_ratation_deck
+default_rotation_deck = [144.5, -26.352, 114.149, 629.002, 82.081, 995.105]
+
+# Example workflow: plates come from the Sciclops stack, get sealed, cycled, peeled, read and go back to the stack
+example_workflow = {"arrival_interval": 1800.0,
+                    "capacities": {"Biometra": 2},
+                    "steps": [{"module": "Sciclops", "dwell": 0.0},
+                              {"module": "Sealer", "dwell": 15.0},
+                              {"module": "Biometra", "dwell": [2400.0, 2700.0]},
+                              {"module": "Peeler", "dwell": 20.0},
+                              {"module": "Hidex", "dwell": 120.0, "rotation": True},
+                              {"module": "Sciclops", "dwell": 0.0}]}
+
+
+def load_layout(path:str):
+    """
+    Description: Module locations from a workcell map saved by PF400_CAMERA.save_workcell_map or from a plain {module: joint states} file.
+                 Only the modules found in the module_list are kept when the map has one.
+    """
+    with open(path) as f:
+        data = json.load(f)
+    if "locations" not in data:
+        return data
+
+    found = set(data.get("module_list", {}).values()) - {"None"}
+    return {module: joints for module, joints in data["locations"].items() if not found or module in found}
+
+
+class Plate():
+
+    def __init__(self, plate_id:int, arrival:float):
+        self.plate_id = plate_id
+        self.arrival = arrival
+        self.step = 0 # Index of the workflow step of the module that holds the plate
+        self.ready = arrival # Time the plate asked the arm for its next transfer
+        self.finished = None
+
+
+class ThroughputSimulator():
+    """
+    Description: Discrete-event model of a workcell with one PF400 serving the modules of a workflow.
+                 - Plates arrive at the first workflow step, either all at once (plates) or one every arrival_interval seconds.
+                 - Every step holds the plate for its dwell time, then the plate waits in a FIFO queue for the arm to move it to the next step.
+                 - A transfer is dispatched only when the target module has a free slot, otherwise the plate stays where it is and blocks its module.
+                 - Transfer durations come from the MotionModel (pick, optional rotation on the deck, place), starting from the arm's last position.
+                 Durations are cached per (arm position, source, target, rotation), so thousands of simulated hours take seconds.
+    Parameters:
+        - workflow: Dictionary with "steps" (module, dwell in seconds or [min, max], optional rotation) and either "plates" or "arrival_interval".
+                    "capacities" can set the number of plates a module holds, the first and the last module are unlimited stacks.
+        - layout: Dictionary of module name to joint states
+        - motion_model: Model that predicts the transfer durations
+        - rotation_deck: Joint states of the rotation deck, used by the steps with rotation
+        - seed: Seed of the random dwell times
+    """
+
+    def __init__(self, workflow:dict, layout:dict = None, motion_model:MotionModel = None, rotation_deck:list = None, seed:int = None):
+        self.workflow = workflow
+        self.steps = workflow["steps"]
+        self.layout = layout or default_layout
+        self.motion_model = motion_model or MotionModel()
+        self.rotation_deck = rotation_deck or default_rotation_deck
+        self.random = random.Random(seed)
+
+        if len(self.steps) < 2:
+            raise ValueError("Workflow needs at least two steps")
+        missing = sorted({step["module"] for step in self.steps} - set(self.layout))
+        if missing:
+            raise ValueError("Modules missing from the layout: " + ", ".join(missing))
+
+        stacks = {self.steps[0]["module"], self.steps[-1]["module"]}
+        capacities = workflow.get("capacities", {})
+        self.capacity = {step["module"]: capacities.get(step["module"], None if step["module"] in stacks else 1) for step in self.steps}
+        self.transfer_times = {}
+
+    def transfer_time(self, position:str, source:str, target:str, rotation:bool):
+        """
+        Description: Predicted duration of a transfer with the arm at the neutral pose of position (None before the first transfer).
+        """
+        key = (position, source, target, rotation)
+        duration = self.transfer_times.get(key)
+        if duration is None:
+            model = self.motion_model
+            start = model.neutral_pose(self.layout[position]) if position else list(model.neutral_joints)
+            duration = model.transfer_time(start, self.layout[source], self.layout[target], self.rotation_deck if rotation else None)
+            self.transfer_times[key] = duration
+        return duration
+
+    def dwell_time(self, step:dict):
+        dwell = step.get("dwell", 0.0)
+        if isinstance(dwell, (list, tuple)):
+            return self.random.uniform(dwell[0], dwell[1])
+        return float(dwell)
+
+    def run(self, hours:float = None):
+        """
+        Description: Runs the simulation until all plates are done, or until no plate arrives after the given hours.
+        Return: Report dictionary (see report)
+        """
+        interval = self.workflow.get("arrival_interval")
+        plates = self.workflow.get("plates")
+        if interval is None and plates is None:
+            raise ValueError("Workflow needs plates or arrival_interval")
+        horizon = hours * 3600 if hours is not None else None
+        if interval is None:
+            arrivals = [0.0] * plates
+        else:
+            count = plates if plates is not None else int(horizon // interval) + 1 if horizon is not None else 1
+            arrivals = [index * interval for index in range(count) if horizon is None or index * interval <= horizon]
+
+        events = [] # (time, sequence, kind, plate)
+        sequence = 0
+        for plate_id, arrival in enumerate(arrivals):
+            heapq.heappush(events, (arrival, sequence, "arrival", Plate(plate_id, arrival)))
+            sequence += 1
+
+        occupancy = {module: 0 for module in self.capacity}
+        module_busy = {module: 0.0 for module in self.capacity}
+        module_changed = {module: 0.0 for module in self.capacity}
+        waiting = deque()
+        arm_free = True
+        arm_position = None
+        arm_busy = 0.0
+        transfers = 0
+        legs = {}
+        queue_area = 0.0
+        queue_max = 0
+        queue_changed = 0.0
+        queue_wait = Histogram(reservoir = 100000, bucket_scale = 1)
+        cycle_time = Histogram(reservoir = 100000, bucket_scale = 1)
+        now = 0.0
+        makespan = 0.0
+        finished = 0
+
+        def update_module(module, change):
+            module_busy[module] += occupancy[module] * (now - module_changed[module])
+            module_changed[module] = now
+            occupancy[module] += change
+
+        while events:
+            now, _, kind, plate = heapq.heappop(events)
+            queue_area += len(waiting) * (now - queue_changed)
+            queue_changed = now
+
+            if kind == "arrival":
+                update_module(self.steps[0]["module"], 1)
+                kind = "ready"
+            if kind == "ready":
+                plate.ready = now
+                waiting.append(plate)
+            else:
+                # Transfer done: the plate is on the target and the arm is free
+                arm_free = True
+                plate.step += 1
+                step = self.steps[plate.step]
+                if plate.step == len(self.steps) - 1:
+                    plate.finished = now + self.dwell_time(step)
+                    makespan = max(makespan, plate.finished)
+                    cycle_time.add(plate.finished - plate.arrival)
+                    finished += 1
+                    update_module(step["module"], -1)
+                else:
+                    heapq.heappush(events, (now + self.dwell_time(step), sequence, "ready", plate))
+                    sequence += 1
+
+            # Dispatches the oldest waiting plate that has a free target
+            if arm_free:
+                for plate in waiting:
+                    target = self.steps[plate.step + 1]
+                    capacity = self.capacity[target["module"]]
+                    if capacity is None or occupancy[target["module"]] < capacity:
+                        break
+                else:
+                    plate = None
+                if plate is not None:
+                    waiting.remove(plate)
+                    source = self.steps[plate.step]["module"]
+                    duration = self.transfer_time(arm_position, source, target["module"], bool(target.get("rotation")))
+                    update_module(source, -1)
+                    update_module(target["module"], 1)
+                    queue_wait.add(now - plate.ready)
+                    arm_free = False
+                    arm_position = target["module"]
+                    arm_busy += duration
+                    transfers += 1
+                    leg = source + " -> " + target["module"]
+                    legs[leg] = legs.get(leg, 0) + 1
+                    heapq.heappush(events, (now + duration, sequence, "transfer", plate))
+                    sequence += 1
+            queue_max = max(queue_max, len(waiting))
+
+        makespan = max(makespan, now)
+        for module in module_busy:
+            update_module(module, 0)
+
+        return self.report(len(arrivals), finished, now, arm_busy, transfers, legs, queue_wait, cycle_time, queue_area, queue_max, module_busy)
+
+    def report(self, plates, finished, makespan, arm_busy, transfers, legs, queue_wait, cycle_time, queue_area, queue_max, module_busy):
+        """
+        Description: Arm utilization, plate queueing and makespan of a run.
+                     The arm is the bottleneck when its utilization is higher than the utilization of every module.
+        """
+        wait = queue_wait.summary()
+        cycle = cycle_time.summary()
+        module_utilization = {}
+        for module, busy in module_busy.items():
+            if self.capacity[module] is not None and makespan > 0:
+                module_utilization[module] = round(busy / (self.capacity[module] * makespan), 4)
+
+        arm_utilization = round(arm_busy / makespan, 4) if makespan > 0 else 0.0
+        busiest = max(module_utilization.items(), key = lambda item: item[1], default = (None, 0.0))
+        return {"plates": plates,
+                "finished": finished,
+                "transfers": transfers,
+                "makespan_hours": round(makespan / 3600, 3),
+                "plates_per_hour": round(finished / (makespan / 3600), 2) if makespan > 0 else 0.0,
+                "arm_utilization": arm_utilization,
+                "mean_transfer_seconds": round(arm_busy / transfers, 2) if transfers else 0.0,
+                "queue_wait_seconds": {"mean": round(wait["mean"], 2), "p50": round(wait["p50"], 2), "p90": round(wait["p90"], 2),
+                                       "p99": round(wait["p99"], 2), "max": round(wait["max"], 2)},
+                "mean_queue_length": round(queue_area / makespan, 3) if makespan > 0 else 0.0,
+                "max_queue_length": queue_max,
+                "cycle_time_hours": {"mean": round(cycle["mean"] / 3600, 3), "p90": round(cycle["p90"] / 3600, 3), "max": round(cycle["max"] / 3600, 3)},
+                "module_utilization": module_utilization,
+                "bottleneck": "arm" if arm_utilization >= busiest[1] else busiest[0],
+                "legs": legs}
+
+
+def print_report(report:dict):
+    print("Plates: {} finished of {}, {} transfers".format(report["finished"], report["plates"], report["transfers"]))
+    print("Makespan: {} h, {} plates/hour".format(report["makespan_hours"], report["plates_per_hour"]))
+    print("Arm utilization: {:.1%}, mean transfer {} s".format(report["arm_utilization"], report["mean_transfer_seconds"]))
+    wait = report["queue_wait_seconds"]
+    print("Queue wait: mean {} s, p90 {} s, p99 {} s, max {} s".format(wait["mean"], wait["p90"], wait["p99"], wait["max"]))
+    print("Queue length: mean {}, max {}".format(report["mean_queue_length"], report["max_queue_length"]))
+    cycle = report["cycle_time_hours"]
+    print("Cycle time: mean {} h, p90 {} h, max {} h".format(cycle["mean"], cycle["p90"], cycle["max"]))
+    for module, utilization in sorted(report["module_utilization"].items(), key = lambda item: -item[1]):
+        print("  {:<12}{:>8.1%}".format(module, utilization))
+    print("Bottleneck: " + str(report["bottleneck"]))
+
+
+def main():
+    parser = argparse.ArgumentParser(description = "Discrete-event throughput simulation of a PF400 workcell")
+    parser.add_argument("workflow", nargs = "?", help = "Workflow JSON file, the built-in example if omitted")
+    parser.add_argument("--layout", help = "Workcell map (PF400_CAMERA.save_workcell_map) or {module: joint states} JSON file")
+    parser.add_argument("--hours", type = float, help = "Simulated hours of plate arrivals")
+    parser.add_argument("--interval", type = float, help = "Override the arrival interval of the workflow in seconds")
+    parser.add_argument("--seed", type = int, default = 0)
+    parser.add_argument("--json", help = "Write the report into this file")
+    args = parser.parse_args()
+
+    workflow = example_workflow
+    if args.workflow:
+        with open(args.workflow) as f:
+            workflow = json.load(f)
+    if args.interval:
+        workflow = dict(workflow, arrival_interval = args.interval)
+    layout = load_layout(args.layout) if args.layout else None
+
+    report = ThroughputSimulator(workflow, layout, seed = args.seed).run(args.hours)
+    print_report(report)
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent = 4)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,312 @@
+#!/usr/bin/env python3
+
+import argparse
+import inspect
+import json
+import socket
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+from functools import wraps
+
+
+class TraceRecorder():
+    """
+    Description: Writes one compact JSON line for each high-level action of a PF400 (transfer, remove_lid, replace_lid, explore_workcell).
+                 A record holds the duration of the action, its arguments, the status and the timed steps with their joint targets and profiles.
+                 Steps are the decorated driver methods called while the action runs on the same thread. Nothing is recorded while the recorder is stopped.
+    Parameters:
+        - path: JSON lines file the records are appended to. If None the recorder starts stopped.
+        - robot_name: Name saved in every record to compare robots
+    """
+
+    def __init__(self, path:str = None, robot_name:str = None):
+        self.path = path
+        self.robot_name = robot_name or socket.gethostname()
+        self.local = threading.local()
+        self.write_lock = threading.Lock()
+
+    @property
+    def enabled(self):
+        return self.path is not None
+
+    def start(self, path:str):
+        self.path = path
+
+    def stop(self):
+        self.path = None
+
+    def current(self):
+        """
+        Description: Record of the action that runs on this thread, or None.
+        """
+        return getattr(self.local, "record", None)
+
+    def action(self, name:str, **args):
+        """
+        Description: Context manager that records an action. Yields the record so the caller can set the status.
+        """
+        if not self.enabled or self.current() is not None:
+            return nullcontext()
+        return self.record_action(name, args)
+
+    @contextmanager
+    def record_action(self, name:str, args:dict):
+        record = {"action": name, "robot": self.robot_name, "start": time.time(), "duration": 0.0,
+                  "status": "ok", "args": args, "grasp_attempts": 0, "wait": 0.0, "steps": []}
+        self.local.record = record
+        self.local.steps = []
+        start = time.perf_counter()
+        record["clock"] = start
+        try:
+            yield record
+        except Exception as err:
+            record["status"] = "error: " + str(err)
+            raise
+        finally:
+            record["duration"] = time.perf_counter() - start
+            del record["clock"]
+            self.local.record = None
+            self.write(record)
+
+    def step(self, name:str, **fields):
+        """
+        Description: Context manager that records a step of the current action.
+                     A step that calls itself again (grab_plate retries) is recorded once.
+        """
+        record = self.current()
+        if record is None or (self.local.steps and self.local.steps[-1]["name"] == name):
+            return nullcontext()
+        return self.record_step(record, name, fields)
+
+    @contextmanager
+    def record_step(self, record:dict, name:str, fields:dict):
+        step = {"name": name, "depth": len(self.local.steps), "start": 0.0, "duration": 0.0, "wait": 0.0}
+        step.update(fields)
+        record["steps"].append(step)
+        self.local.steps.append(step)
+        start = time.perf_counter()
+        step["start"] = start - record["clock"]
+        try:
+            yield step
+        finally:
+            step["duration"] = time.perf_counter() - start
+            self.local.steps.pop()
+
+    def add_wait(self, seconds:float):
+        """
+        Description: Adds the time spent waiting for the previous motion to end to the current step and action.
+        """
+        record = self.current()
+        if record is None:
+            return
+        record["wait"] += seconds
+        if self.local.steps:
+            self.local.steps[-1]["wait"] += seconds
+
+    def count(self, key:str, amount:int = 1):
+        record = self.current()
+        if record is not None:
+            record[key] = record.get(key, 0) + amount
+
+    def write(self, record:dict):
+        path = self.path
+        if path is None:
+            return
+        with self.write_lock:
+            with open(path, "a") as f:
+                f.write(json.dumps(record, separators = (",", ":"), default = str) + "\n")
+
+
+def copy_field(value):
+    """
+    Description: Copies an argument for a record. Joint lists are copied because the driver changes them in place, other objects are saved by type name.
+    """
+    if isinstance(value, (list, tuple)):
+        return [round(item, 3) if isinstance(item, float) else item for item in value]
+    if value is None or isinstance(value, (str, int, float, bool)):
+        return value
+    return type(value).__name__
+
+
+def traced(name:str, action:bool = False, fields:tuple = ()):
+    """
+    Description: Decorator that records a method as an action or a step of the object's trace recorder (self.trace).
+    Parameters:
+        - name: Name of the action or step
+        - action: If True the method starts a new trace record
+        - fields: Argument names that are saved in the step (joint targets, profiles). Actions save all their arguments.
+    """
+    def decorator(function):
+        signature = inspect.signature(function)
+
+        @wraps(function)
+        def wrapper(self, *args, **kwargs):
+            recorder = getattr(self, "trace", None)
+            if recorder is None or not recorder.enabled:
+                return function(self, *args, **kwargs)
+
+            bound = signature.bind(self, *args, **kwargs)
+            bound.apply_defaults()
+            arguments = bound.arguments
+
+            if action:
+                with recorder.action(name, **{key: copy_field(value) for key, value in arguments.items() if key != "self"}) as record:
+                    result = function(self, *args, **kwargs)
+                    warning = getattr(self, "robot_warning", "")
+                    if record is not None and warning not in ("", "CLEAR"):
+                        record["status"] = warning
+                    return result
+
+            with recorder.step(name) as step:
+                result = function(self, *args, **kwargs)
+                if step is not None:
+                    for key in fields:
+                        step[key] = copy_field(arguments[key])
+                return result
+        return wrapper
+    return decorator
+
+
+def load_records(paths:list, action:str = None):
+    records = []
+    for path in paths:
+        with open(path) as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                record = json.loads(line)
+                if action is None or record["action"] == action:
+                    records.append(record)
+    return records
+
+
+def percentile(values:list, percent:float):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    index = min(max(int(percent / 100 * len(values) + 0.5) - 1, 0), len(values) - 1)
+    return values[index]
+
+
+def analyze_records(records:list, top:int = 10, idle_limit:float = 600.0):
+    """
+    Description: Aggregates trace records.
+                 - Cycle time percentiles of every action
+                 - Pareto of the steps by total self time (time not spent in a nested step)
+                 - Time split into motion, waiting for the previous motion to end, driver overhead outside the steps and idle time between actions
+                   Gaps longer than idle_limit seconds are not counted as idle (robot off, next day).
+    Return: Dictionary of the results
+    """
+    actions = {}
+    for record in records:
+        actions.setdefault(record["action"], []).append(record)
+
+    cycle_times = {}
+    for name, action_records in actions.items():
+        durations = [record["duration"] for record in action_records]
+        failed = sum(1 for record in action_records if record["status"] != "ok")
+        cycle_times[name] = {"count": len(durations),
+                             "failed": failed,
+                             "mean": sum(durations) / len(durations),
+                             "p50": percentile(durations, 50),
+                             "p90": percentile(durations, 90),
+                             "p99": percentile(durations, 99),
+                             "max": max(durations),
+                             "grasp_attempts": sum(record.get("grasp_attempts", 0) for record in action_records) / len(action_records)}
+
+    step_times = {}
+    breakdown = {"motion": 0.0, "wait": 0.0, "overhead": 0.0, "idle": 0.0}
+    for record in records:
+        steps = record["steps"]
+        top_level = 0.0
+        for index, step in enumerate(steps):
+            nested = 0.0
+            for child in steps[index + 1:]:
+                if child["depth"] <= step["depth"]:
+                    break
+                if child["depth"] == step["depth"] + 1:
+                    nested += child["duration"]
+            self_time = max(step["duration"] - nested, 0.0)
+
+            entry = step_times.setdefault(step["name"], {"count": 0, "total": 0.0, "max": 0.0})
+            entry["count"] += 1
+            entry["total"] += self_time
+            entry["max"] = max(entry["max"], step["duration"])
+
+            if step["depth"] == 0:
+                top_level += step["duration"]
+        breakdown["wait"] += record.get("wait", 0.0)
+        breakdown["motion"] += max(top_level - record.get("wait", 0.0), 0.0)
+        breakdown["overhead"] += max(record["duration"] - top_level, 0.0)
+
+    # Idle time is the gap between the end of an action and the start of the next one on the same robot
+    by_robot = {}
+    for record in records:
+        by_robot.setdefault(record.get("robot"), []).append(record)
+    for robot_records in by_robot.values():
+        robot_records.sort(key = lambda record: record["start"])
+        for previous, current in zip(robot_records, robot_records[1:]):
+            gap = current["start"] - previous["start"] - previous["duration"]
+            if 0.0 < gap <= idle_limit:
+                breakdown["idle"] += gap
+
+    total_self = sum(entry["total"] for entry in step_times.values()) or 1.0
+    pareto = []
+    cumulative = 0.0
+    for name, entry in sorted(step_times.items(), key = lambda item: item[1]["total"], reverse = True)[:top]:
+        cumulative += entry["total"]
+        pareto.append({"step": name, "count": entry["count"], "total": entry["total"],
+                       "mean": entry["total"] / entry["count"], "max": entry["max"],
+                       "share": entry["total"] / total_self, "cumulative": cumulative / total_self})
+
+    return {"records": len(records), "cycle_times": cycle_times, "pareto": pareto, "breakdown": breakdown}
+
+
+def print_analysis(title:str, analysis:dict):
+    print("== {} ({} records)".format(title, analysis["records"]))
+
+    print("\nCycle times (s)")
+    print("{:<20}{:>7}{:>7}{:>9}{:>9}{:>9}{:>9}{:>9}".format("action", "count", "failed", "mean", "p50", "p90", "p99", "grasps"))
+    for name, stats in analysis["cycle_times"].items():
+        print("{:<20}{:>7}{:>7}{:>9.2f}{:>9.2f}{:>9.2f}{:>9.2f}{:>9.2f}".format(name, stats["count"], stats["failed"], stats["mean"],
+                                                                              stats["p50"], stats["p90"], stats["p99"], stats["grasp_attempts"]))
+
+    print("\nSlowest steps by self time")
+    print("{:<26}{:>7}{:>10}{:>9}{:>9}{:>8}{:>8}".format("step", "count", "total", "mean", "max", "share", "cum"))
+    for entry in analysis["pareto"]:
+        print("{:<26}{:>7}{:>10.2f}{:>9.3f}{:>9.3f}{:>7.1f}%{:>7.1f}%".format(entry["step"], entry["count"], entry["total"], entry["mean"],
+                                                                             entry["max"], entry["share"] * 100, entry["cumulative"] * 100))
+
+    breakdown = analysis["breakdown"]
+    total = sum(breakdown.values()) or 1.0
+    print("\nTime breakdown")
+    for key, value in breakdown.items():
+        print("{:<12}{:>10.2f} s{:>7.1f}%".format(key, value, value / total * 100))
+    print()
+
+
+def main(args = None):
+    parser = argparse.ArgumentParser(description = "Analyze PF400 trace records")
+    parser.add_argument("files", nargs = "+", help = "JSON lines trace files")
+    parser.add_argument("--action", default = None, help = "Only analyze this action")
+    parser.add_argument("--top", type = int, default = 10, help = "Number of steps in the Pareto table")
+    parser.add_argument("--idle-limit", type = float, default = 600.0, help = "Longest gap between actions counted as idle time, in seconds")
+    parser.add_argument("--per-file", action = "store_true", help = "Analyze every file separately, e.g. before and after a change")
+    parser.add_argument("--json", action = "store_true", help = "Print the results as JSON")
+    options = parser.parse_args(args)
+
+    groups = [(path, [path]) for path in options.files] if options.per_file else [(", ".join(options.files), options.files)]
+    results = {title: analyze_records(load_records(paths, options.action), options.top, options.idle_limit) for title, paths in groups}
+
+    if options.json:
+        print(json.dumps(results, indent = 2))
+        return
+
+    for title, analysis in results.items():
+        print_analysis(title, analysis)
+
+
+if __name__ == "__main__":
+    main()
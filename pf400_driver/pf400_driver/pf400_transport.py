@@ -0,0 +1,270 @@
+import json
+import socket
+import telnetlib
+import threading
+import time
+from bisect import bisect_left
+
+from pf400_driver.errors import ConnectionException, CommandException, TimeoutException
+
+
+def enable_keepalive(sock, idle:int = 2, interval:int = 1, count:int = 3):
+    """
+    Description: Turns on TCP keepalive, so that a dead link (robot power cut, cable pulled) is found in about idle + interval * count seconds
+                 even when no command is waiting for a response. The timing options are only set where the OS has them.
+    """
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+    for option, value in (("TCP_KEEPIDLE", idle), ("TCP_KEEPINTVL", interval), ("TCP_KEEPCNT", count)):
+        if hasattr(socket, option):
+            sock.setsockopt(socket.IPPROTO_TCP, getattr(socket, option), value)
+
+
+class Transport():
+    """
+    Description: Carries the string commands of one PF400 connection. The I/O actor calls exchange() for every command, one at a time.
+                 Every transport counts its round trips per command verb.
+                 A transport that times out closes its connection, since a late response would be read as the response of the next command.
+    """
+
+    def __init__(self):
+        self.round_trips = 0
+        self.counts = {}
+
+    def count(self, command:str):
+        verb = command.split(" ", 1)[0].lower()
+        self.round_trips += 1
+        self.counts[verb] = self.counts.get(verb, 0) + 1
+
+    def connect(self):
+        pass
+
+    def exchange(self, command:str, timeout:float = None):
+        """
+        Description: Sends a command and returns the response line without the line ending.
+        Parameters:
+            - command: Command itself in string format
+            - timeout: Seconds to wait for the response, None waits forever. TimeoutException is raised when it runs out.
+        """
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+
+class TelnetTransport(Transport):
+    """
+    Description: Telnet connection to the TCS command server of a PF400.
+    Parameters:
+        - host: IP address of the robot
+        - port: 10100 for commands, 10000 for the status
+        - timeout: Connection timeout in seconds
+    """
+
+    def __init__(self, host:str, port:int, timeout:float = 5):
+        super().__init__()
+        self.host = host
+        self.port = port
+        self.timeout = timeout
+        self.connection = None
+
+    def connect(self):
+        try:
+            self.connection = telnetlib.Telnet(self.host, self.port, self.timeout)
+        except TimeoutError:
+            raise ConnectionException(err_message="Timed out error")
+        enable_keepalive(self.connection.get_socket())
+
+    def exchange(self, command:str, timeout:float = None):
+        if self.connection is None:
+            raise ConnectionException(err_message="Connection closed")
+        self.count(command)
+        try:
+            self.connection.write(command.encode("ascii") + b"\n")
+            line = self.connection.read_until(b"\r\n", timeout)
+        except (EOFError, OSError) as err:
+            # Closed by the robot, reset, broken pipe or a keepalive failure
+            self.close()
+            raise ConnectionException(err_message="Connection lost: " + (str(err) or "closed by the robot"))
+        if not line.endswith(b"\r\n"):
+            self.close()
+            raise TimeoutException(err_message="No response to " + command.split(" ", 1)[0] + " in " + str(timeout) + "s")
+        return line.rstrip().decode("ascii")
+
+    def close(self):
+        if self.connection:
+            self.connection.close()
+            self.connection = None
+
+
+class SocketTransport(Transport):
+    """
+    Description: Plain TCP connection without the telnet option handling, for simulators and for a lower overhead per command.
+    Parameters:
+        - host: IP address of the robot or simulator
+        - port: 10100 for commands, 10000 for the status
+        - timeout: Connection timeout in seconds
+    """
+
+    def __init__(self, host:str, port:int, timeout:float = 5):
+        super().__init__()
+        self.host = host
+        self.port = port
+        self.timeout = timeout
+        self.socket = None
+        self.buffer = b""
+
+    def connect(self):
+        try:
+            self.socket = socket.create_connection((self.host, self.port), self.timeout)
+        except (TimeoutError, socket.timeout):
+            raise ConnectionException(err_message="Timed out error")
+        self.socket.settimeout(None)
+        self.socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        enable_keepalive(self.socket)
+        self.buffer = b""
+
+    def exchange(self, command:str, timeout:float = None):
+        if self.socket is None:
+            raise ConnectionException(err_message="Connection closed")
+        self.count(command)
+        self.socket.settimeout(timeout)
+        try:
+            self.socket.sendall(command.encode("ascii") + b"\n")
+            while b"\r\n" not in self.buffer:
+                data = self.socket.recv(4096)
+                if not data:
+                    self.close()
+                    raise ConnectionException(err_message="Connection closed by the robot")
+                self.buffer += data
+        except socket.timeout:
+            self.close()
+            raise TimeoutException(err_message="No response to " + command.split(" ", 1)[0] + " in " + str(timeout) + "s")
+        except OSError as err:
+            # Reset, broken pipe or a keepalive failure
+            self.close()
+            raise ConnectionException(err_message="Connection lost: " + str(err))
+        line, self.buffer = self.buffer.split(b"\r\n", 1)
+        return line.rstrip().decode("ascii")
+
+    def close(self):
+        if self.socket:
+            self.socket.close()
+            self.socket = None
+
+
+class RecordingTransport(Transport):
+    """
+    Description: Records the timestamped request/response stream of another transport into a JSON lines file.
+                 Every line is {"time": seconds since connect, "rtt": round trip in seconds, "command": ..., "response": ...}.
+                 Lines are flushed as they are written, so a session that ends abruptly is still usable.
+    Parameters:
+        - transport: Transport that talks to the robot
+        - path: Recording file. Every session starts with a {"session": start time, "host": ..., "port": ...} line and is appended.
+    """
+
+    def __init__(self, transport:Transport, path:str):
+        super().__init__()
+        self.transport = transport
+        self.path = path
+        self.file = None
+        self.session_start = 0.0
+        self.file_lock = threading.Lock()
+
+    def connect(self):
+        self.transport.connect()
+        if self.file is None:
+            # A reconnect continues the same session
+            self.session_start = time.time()
+            self.file = open(self.path, "a", buffering = 1)
+            self.write_line({"session": self.session_start,
+                             "host": getattr(self.transport, "host", None),
+                             "port": getattr(self.transport, "port", None)})
+
+    def write_line(self, entry:dict):
+        with self.file_lock:
+            if self.file:
+                self.file.write(json.dumps(entry) + "\n")
+
+    def exchange(self, command:str, timeout:float = None):
+        self.count(command)
+        start = time.time()
+        response = self.transport.exchange(command, timeout)
+        self.write_line({"time": start - self.session_start, "rtt": time.time() - start,
+                         "command": command, "response": response})
+        return response
+
+    def close(self):
+        self.transport.close()
+        with self.file_lock:
+            if self.file:
+                self.file.close()
+                self.file = None
+
+
+class ReplayTransport(Transport):
+    """
+    Description: Serves the responses of a recording back to the driver without hardware.
+                 The driver does not repeat a session exactly (the number of state polls depends on timing), so each command is answered
+                 with the next recorded response of the same command after the replay position. A command that is not found again gets its
+                 last recorded response before the replay position, or "0" if it was never recorded. Those answers are counted as misses.
+                 With loop the recording is treated as a cycle instead, so one recorded transfer can be replayed many times.
+    Parameters:
+        - path: Recording file of a RecordingTransport
+        - realtime: If True every response is delayed by its recorded round trip, otherwise responses are served as fast as possible
+        - session: Index of the recorded session to replay (-1 is the last one)
+        - strict: If True a command that was never recorded raises a CommandException
+        - loop: If True a command that is not found after the replay position is searched from the beginning of the recording
+    """
+
+    def __init__(self, path:str, realtime:bool = False, session:int = -1, strict:bool = False, loop:bool = True):
+        super().__init__()
+        self.path = path
+        self.realtime = realtime
+        self.strict = strict
+        self.loop = loop
+        self.misses = 0
+        self.wraps = 0
+        self.position = 0
+
+        sessions = []
+        with open(path) as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                entry = json.loads(line)
+                if "session" in entry:
+                    sessions.append([])
+                elif sessions:
+                    sessions[-1].append(entry)
+        if not sessions:
+            raise ValueError("No recorded session in " + path)
+
+        self.entries = sessions[session]
+        self.next_index = {} # command -> sorted indexes of its entries
+        for index, entry in enumerate(self.entries):
+            self.next_index.setdefault(entry["command"], []).append(index)
+
+    def exchange(self, command:str, timeout:float = None):
+        self.count(command)
+        indexes = self.next_index.get(command)
+
+        if not indexes:
+            self.misses += 1
+            if self.strict:
+                raise CommandException(err_message = "Command was not recorded: " + command)
+            return "0"
+
+        found = bisect_left(indexes, self.position)
+        if found == len(indexes):
+            if not self.loop:
+                self.misses += 1
+                return self.entries[indexes[-1]]["response"]
+            found = 0
+            self.wraps += 1
+
+        entry = self.entries[indexes[found]]
+        self.position = indexes[found] + 1
+        if self.realtime:
+            time.sleep(entry["rtt"])
+        return entry["response"]
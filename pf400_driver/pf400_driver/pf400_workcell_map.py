@@ -0,0 +1,72 @@
+import copy
+import hashlib
+import json
+import os
+
+# Workcell defaults of the explorer (PF400_CAMERA) before any exploration
+#   - default_locations: Joint states of the module locations
+#   - default_start_location: Rail stops of the bays in mm
+#   - default_robot_reach, default_module_lenght: Arm reach and module cart length in mm
+default_locations = {"Sciclops": [222.0, -38.068, 335.876, 325.434, 79.923, 995.062],
+                     "OT2_Alpha": [243.034, -31.484, 276.021, 383.640, 124.807, -585.407],
+                     "OT2_Betha": [163.230, -59.032, 270.965, 415.013, 129.982, -951.510],
+                     "Sealer": [201.128, -2.814, 264.373, 365.863, 79.144, 411.553],
+                     "Peeler": [262.550, 20.608, 119.290, 662.570, 0.0, 0],
+                     "Azenta": [201.128, -2.814, 264.373, 365.863, 79.144, 411.553],
+                     "Hidex": [262.550, 20.608, 119.290, 662.570, 0.0, 0],
+                     "Biometra": [247.0, 40.698, 38.294, 728.332, 123.077, 301.082]}
+default_start_location = [- 990, -330, 400, 990]
+default_robot_reach = 753.0
+default_module_lenght = 685.8
+default_map_file = os.path.join(os.path.expanduser("~"), ".pf400", "workcell_map.json")
+
+
+def workcell_fingerprint(kinematics, start_location:list = None, module_lenght:float = default_module_lenght,
+                         robot_reach:float = default_robot_reach, locations:dict = None):
+    """
+    Description: Calculates a fingerprint of everything the derived locations depend on.
+                 A cached map is only valid if it was saved with the same fingerprint.
+    Parameters:
+        - kinematics: PF400 connection or KINEMATICS object with the arm lengths
+        - start_location, module_lenght, robot_reach, locations: Workcell of the explorer, the defaults if not given
+    """
+    fingerprint_data = {"start_location": default_start_location if start_location is None else start_location,
+                        "module_lenght": module_lenght,
+                        "robot_reach": robot_reach,
+                        "default_locations": default_locations if locations is None else locations,
+                        "arm_lengths": [kinematics.shoulder_length, kinematics.elbow_length, kinematics.end_effector_length]}
+    return hashlib.sha1(json.dumps(fingerprint_data, sort_keys = True).encode("ascii")).hexdigest()
+
+
+def save_workcell_map(path:str, fingerprint:str, module_list:dict, locations:dict):
+    """
+    Description: Saves the module list and the derived locations with the workcell fingerprint.
+    """
+    workcell_map = {"fingerprint": fingerprint,
+                    "module_list": module_list,
+                    "locations": locations}
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok = True)
+        with open(path, "w") as f:
+            json.dump(workcell_map, f, indent = 4)
+    except OSError as err:
+        print("Workcell map could not be saved: " + str(err))
+
+
+def load_workcell_map(path:str, fingerprint:str):
+    """
+    Description: Loads the cached workcell map if it exists and it was saved with the given fingerprint.
+    Return: Dictionary with the module_list (bay number -> module name) and the locations, None if there is no valid map
+    """
+    try:
+        with open(path) as f:
+            workcell_map = json.load(f)
+    except (OSError, ValueError):
+        return None
+
+    if workcell_map.get("fingerprint") != fingerprint:
+        print("Cached workcell map is outdated, full exploration is needed")
+        return None
+
+    return {"module_list": {int(bay): name for bay, name in workcell_map["module_list"].items()},
+            "locations": copy.deepcopy(workcell_map["locations"])}
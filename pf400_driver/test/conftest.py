@@ -0,0 +1,50 @@
+import pytest
+
+from pf400_driver.pf400_driver import PF400
+from pf400_driver.pf400_simulator import PF400Simulator, SimulatorServer, SimulatorTransport
+
+
+@pytest.fixture
+def simulator():
+    return PF400Simulator()
+
+
+@pytest.fixture
+def connect(simulator):
+    """
+    Connects a PF400 to the in-process simulator without the settle waits. Every call is a new connection to the same simulator (a restart).
+    """
+    def connect(transport = None, **kwargs):
+        return PF400(transport = transport or SimulatorTransport(simulator), settle_scale = 0, **kwargs)
+    return connect
+
+
+@pytest.fixture
+def robot(connect):
+    return connect()
+
+
+@pytest.fixture
+def server(simulator):
+    server = SimulatorServer(simulator, port = 0)
+    server.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def power_off_before(simulator):
+    """
+    Powers the simulator off before the first run of a transfer step, so the transfer is interrupted there.
+    """
+    def power_off_before(robot, fault_step:str):
+        run_transfer_step = robot.run_transfer_step
+
+        def run(step, location, rotation):
+            if step == fault_step and not robot.journal.pending()["interrupted"]:
+                simulator.power_off()
+            return run_transfer_step(step, location, rotation)
+
+        robot.run_transfer_step = run
+    return power_off_before
@@ -0,0 +1,64 @@
+import pytest
+
+sealer = [201.128, -2.814, 264.373, 365.863, 79.144, 411.553]
+peeler = [225.521, -24.846, 244.836, 406.623, 80.967, 398.778]
+
+
+def yaw_change(robot, location, other):
+    change = robot.forward_kinematics(other)[0][3] - robot.forward_kinematics(location)[0][3]
+    return (change + 180) % 360 - 180
+
+
+def record_steps(robot):
+    steps = []
+    run_transfer_step = robot.run_transfer_step
+
+    def recorded(step, location, rotation):
+        steps.append((step, location))
+        run_transfer_step(step, location, rotation)
+
+    robot.run_transfer_step = recorded
+    return steps
+
+
+def test_direct_place_turns_the_gripper_against_the_deck(robot):
+    deck_place, deck_grasp = robot.deck_rotation_poses(90)
+    rotated = robot.plan_direct_rotation(sealer, 90)
+
+    assert robot.within_joint_limits(rotated)
+    assert yaw_change(robot, sealer, rotated) == pytest.approx(-yaw_change(robot, deck_place, deck_grasp), abs = 1)
+    assert rotated[0] == sealer[0] and rotated[5] == sealer[5]
+
+
+def test_poses_without_a_valid_rotation_are_not_planned(robot):
+    assert robot.plan_direct_rotation(sealer, -90) is None # Past the joint limits
+    assert robot.plan_direct_rotation([1100.0, 10.0, 60.0, 100.0, 123.0, 0.0], 90) is None # Past the vertical limit
+
+
+def test_transfer_skips_the_rotation_deck(robot):
+    steps = record_steps(robot)
+    assert robot.transfer(peeler, sealer, "narrow", "wide") is True
+
+    assert [step for step, location in steps] == ["pick", "place"]
+    assert steps[1][1][:4] == pytest.approx(robot.plan_direct_rotation(sealer, 90)[:4]) # Placed with the rotated grasp
+    assert robot.rotation_report() == {"direct": 1, "deck": 0, "avoided": 1.0}
+
+
+def test_transfer_uses_the_deck_without_a_direct_pose(robot):
+    steps = record_steps(robot)
+    assert robot.transfer(peeler, sealer, "wide", "narrow") is True
+    robot.direct_rotation = False
+    assert robot.transfer(sealer, peeler, "narrow", "wide") is True
+
+    assert [step for step, location in steps] == ["pick", "deck_place", "deck_pick", "place"] * 2
+    assert robot.rotation_report() == {"direct": 0, "deck": 2, "avoided": 0.0}
+
+
+def test_parked_lid_on_the_deck_blocks_only_deck_rotations(robot):
+    robot.lid_buffer.add_slot(robot.plate_ratation_deck)
+    robot.lid_buffer.allocate("plate 1")
+    assert robot.lid_buffer.allocate("plate 2") == robot.plate_ratation_deck
+
+    assert robot.transfer(peeler, sealer, "wide", "narrow") is False
+    assert robot.robot_warning == "ROTATION DECK OCCUPIED"
+    assert robot.transfer(peeler, sealer, "narrow", "wide") is True
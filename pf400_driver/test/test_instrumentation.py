@@ -0,0 +1,51 @@
+import json
+
+import pytest
+
+from pf400_driver.pf400_instrumentation import Histogram
+
+sealer = [201.128, -2.814, 264.373, 365.863, 79.144, 411.553]
+peeler = [225.521, -24.846, 244.836, 406.623, 80.967, 398.778]
+
+
+def test_histogram_percentiles_and_buckets():
+    histogram = Histogram(bucket_scale = 1)
+    for value in range(1, 101):
+        histogram.add(float(value))
+    summary = histogram.summary()
+
+    assert summary["count"] == 100
+    assert summary["mean"] == pytest.approx(50.5)
+    assert (summary["p50"], summary["p90"], summary["p99"], summary["max"]) == (50.0, 90.0, 99.0, 100.0)
+    assert summary["buckets"] == {1: 1, 2: 1, 4: 2, 8: 4, 16: 8, 32: 16, 64: 32, 128: 36}
+
+
+def test_disabled_metrics_record_nothing(robot):
+    robot.transfer(sealer, peeler)
+
+    assert robot.metrics.snapshot() == {"histograms": {}, "counters": {}}
+    assert len(robot.metrics.events) == 0
+
+
+def test_transfer_records_commands_polls_and_spans(robot, tmp_path):
+    round_trips = robot.transport.round_trips
+    robot.metrics.enabled = True
+    robot.transfer(sealer, peeler)
+    histograms = robot.metrics.snapshot()["histograms"]
+
+    assert histograms["command.movej"]["count"] == robot.transport.counts["movej"]
+    assert histograms["queue_wait"]["count"] == robot.transport.round_trips - round_trips
+    assert histograms["span.transfer"]["count"] == 1
+    assert histograms["span.pick_plate"]["count"] == 1
+    assert histograms["span.place_plate"]["count"] == 1
+    assert histograms["state_polls_per_command"]["count"] > 0
+
+    path = tmp_path / "trace.json"
+    robot.metrics.write_chrome_trace(str(path))
+    events = json.loads(path.read_text())["traceEvents"]
+    assert {"io", "phase"} == {event["cat"] for event in events}
+    transfer = next(event for event in events if event["name"] == "transfer")
+    assert all(transfer["ts"] <= event["ts"] for event in events if event["cat"] == "phase")
+
+    robot.metrics.reset()
+    assert robot.metrics.snapshot() == {"histograms": {}, "counters": {}}
@@ -0,0 +1,58 @@
+import random
+
+import pytest
+
+from pf400_driver.pf400_kinematics import elbow_limits, shoulder_limits
+
+sealer = [201.128, -2.814, 264.373, 365.863, 79.144, 411.553]
+peeler = [225.521, -24.846, 244.836, 406.623, 80.967, 398.778]
+
+
+def sample_joints(count, seed = 7):
+    rng = random.Random(seed)
+    samples = []
+    while len(samples) < count:
+        joints = [rng.uniform(100, 400), rng.uniform(*shoulder_limits), rng.uniform(*elbow_limits), rng.uniform(-700, 700), 123.0, rng.uniform(-900, 900)]
+        if abs(joints[2] - 180) < 5:
+            continue # The folded arm is singular, the 3 decimals of the pose do not give the joints back
+        if 0 < joints[1] + (joints[2] - 360 if joints[2] > 180 else joints[2]) + joints[3] < 1080:
+            samples.append(joints)
+    return samples
+
+
+def test_forward_then_inverse_returns_the_reference_joints(robot):
+    for joints in sample_joints(300):
+        cartesian, phi, rail = robot.forward_kinematics(joints)
+        solution = robot.inverse_kinematics(cartesian, phi, rail, reference_joints = joints)
+        assert solution == pytest.approx(joints, abs = 0.01)
+
+
+def test_all_solutions_reach_the_same_pose(robot):
+    cartesian, phi, rail = robot.forward_kinematics([300.0, 10.0, 60.0, 100.0, 123.0, 0.0])
+    solutions = robot.inverse_kinematics_solutions(cartesian, rail)
+
+    assert len(solutions) == 6
+    assert len({(round(solution[1], 3), round(solution[2], 3)) for solution in solutions}) == 2 # Both elbow branches
+    assert len({round(solution[3], 3) for solution in solutions}) == 6 # Three wrist wraps each
+    for solution in solutions:
+        assert robot.within_joint_limits(solution)
+        assert robot.forward_kinematics(solution)[0][:4] == pytest.approx(cartesian[:4], abs = 0.01)
+
+
+def test_closest_solution_has_the_shortest_move(robot):
+    cartesian, phi, rail = robot.forward_kinematics(sealer)
+    reference = list(sealer)
+    reference[3] += 300
+    solutions = robot.inverse_kinematics_solutions(cartesian, rail)
+    closest = robot.inverse_kinematics(cartesian, phi, rail, reference_joints = reference)
+
+    assert closest in solutions
+    move_time = robot.motion_model.move_time
+    assert move_time(reference, closest) == min(move_time(reference, solution) for solution in solutions)
+    assert abs(closest[3] - reference[3]) <= 180 # The wrist is not unwound
+
+
+def test_unreachable_pose_falls_back_to_the_quadrant_solution(robot):
+    assert robot.inverse_kinematics_solutions([2000.0, 0.0, 300.0, 0.0], 0.0) == []
+    cartesian, phi, rail = robot.forward_kinematics(sealer)
+    assert robot.inverse_kinematics(cartesian, phi, rail) == pytest.approx(robot.inverse_kinematics(cartesian, phi, rail, reference_joints = sealer), abs = 0.01)
@@ -0,0 +1,122 @@
+import threading
+import time
+
+import pytest
+
+from pf400_driver.errors import CommandException, TimeoutException
+from pf400_driver.pf400_io_actor import IOActor
+from pf400_driver.pf400_simulator import SimulatorTransport
+from pf400_driver.pf400_transport import Transport
+
+
+class GatedTransport(Transport):
+    """
+    Records the commands and holds the first one until the gate is opened.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.commands = []
+        self.gate = threading.Event()
+        self.holding = threading.Event()
+
+    def exchange(self, command:str, timeout:float = None):
+        self.count(command)
+        self.commands.append(command)
+        if len(self.commands) == 1:
+            self.holding.set()
+            self.gate.wait()
+        return "0 " + command
+
+
+@pytest.fixture
+def transport():
+    return GatedTransport()
+
+
+@pytest.fixture
+def actor(transport):
+    actor = IOActor(transport)
+    yield actor
+    transport.gate.set()
+    actor.stop()
+
+
+def test_requests_are_sent_in_order(actor, transport):
+    transport.gate.set()
+    futures = [actor.submit(command) for command in ("movej 1", "state", "gripper 1", "wherej")]
+
+    assert [actor.wait(future) for future in futures] == ["0 movej 1", "0 state", "0 gripper 1", "0 wherej"]
+    assert transport.commands == ["movej 1", "state", "gripper 1", "wherej"]
+
+
+def test_queued_queries_share_one_round_trip(actor, transport):
+    actor.submit("home")
+    transport.holding.wait()
+
+    first = actor.submit("state")
+    second = actor.submit(" State ")
+    motions = [actor.submit("movej 1"), actor.submit("movej 1")]
+    assert first is second
+    assert motions[0] is not motions[1]
+
+    transport.gate.set()
+    assert actor.wait(second) == "0 state"
+    for future in motions:
+        actor.wait(future)
+    assert transport.counts == {"home": 1, "state": 1, "movej": 2}
+
+    # A query that is already on the wire is not shared with a later one
+    assert actor.submit("state") is not first
+
+
+def test_stop_with_discard_fails_the_queued_requests(actor, transport):
+    actor.submit("home")
+    transport.holding.wait()
+    queued = actor.submit("movej 1")
+
+    actor.stop(wait = False, discard = True)
+    transport.gate.set()
+
+    with pytest.raises(CommandException):
+        actor.wait(queued)
+    with pytest.raises(CommandException):
+        actor.submit("state")
+    assert transport.commands == ["home"]
+
+
+def test_hung_actor_thread_fails_the_queued_requests(actor, transport):
+    # The transport ignores the timeout of the first command, so the queued query finds a hung actor
+    actor.queue_allowance = 0.1
+    actor.submit("home", 0.1)
+    transport.holding.wait()
+
+    with pytest.raises(TimeoutException):
+        actor.request("state", 0.1)
+
+
+def test_threads_do_not_send_a_motion_while_the_robot_moves(connect, simulator):
+    simulator.time_scale = 0.2
+    robot = connect()
+    moving = []
+    exchange = SimulatorTransport.exchange
+
+    def checked_exchange(transport, command, timeout = None):
+        if command.startswith("moveoneaxis"):
+            moving.append(simulator.movement_state() > 1)
+        return exchange(transport, command, timeout)
+
+    robot.transport.exchange = checked_exchange.__get__(robot.transport)
+
+    def move(targets):
+        for target in targets:
+            robot.move_one_joint(6, target, 1)
+
+    threads = [threading.Thread(target = move, args = ([600.0, 0.0, 600.0],)), threading.Thread(target = move, args = ([300.0, 900.0, 300.0],))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(moving) == 6
+    assert not any(moving)
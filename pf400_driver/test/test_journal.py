@@ -0,0 +1,137 @@
+import json
+
+import pytest
+
+from pf400_driver.pf400_journal import StepJournal
+
+sealer = [201.128, -2.814, 264.373, 365.863, 79.144, 411.553]
+peeler = [225.521, -24.846, 244.836, 406.623, 80.967, 398.778]
+
+
+def test_journal_roundtrip(tmp_path):
+    path = str(tmp_path / "journal.json")
+    journal = StepJournal(path)
+    journal.begin("transfer", {"rotation": 0}, [["pick", sealer], ["place", peeler]])
+    journal.start_step("pick")
+    journal.complete_step("pick", "gripper")
+    journal.start_step("place")
+    journal.interrupt("Power not enabled", "-1046")
+
+    loaded = StepJournal(path)
+    assert loaded.pending()["completed"] == 1
+    assert loaded.pending()["current"] == "place"
+    assert loaded.pending()["plate"] == "gripper"
+    assert loaded.pending()["error_code"] == "-1046"
+    assert loaded.remaining_steps() == [["place", peeler]]
+    assert not (tmp_path / "journal.json.tmp").exists()
+
+    assert loaded.finish() is not None
+    assert loaded.report()["recoveries"] == 1
+    assert StepJournal(path).pending() is None
+
+
+def test_unreadable_journal_is_empty(tmp_path):
+    path = tmp_path / "journal.json"
+    path.write_text("{\"job\": ")
+    assert StepJournal(str(path)).pending() is None
+
+
+def test_completed_transfer_leaves_no_job(robot):
+    assert robot.transfer(sealer, peeler) is True
+
+    assert robot.robot_warning == "CLEAR"
+    assert robot.journal.pending() is None
+
+
+def test_interrupted_transfer_is_journaled_and_blocks_the_next_one(robot, simulator, power_off_before):
+    power_off_before(robot, "place")
+
+    assert robot.transfer(sealer, peeler) is False
+
+    job = robot.journal.pending()
+    assert robot.robot_warning == "TRANSFER INTERRUPTED"
+    assert job["completed"] == 1
+    assert job["plate"] == "gripper"
+    assert job["error_code"] == "-1046"
+    assert simulator.holding_plate
+
+    assert robot.transfer(sealer, peeler) is False
+    assert robot.robot_warning == "UNFINISHED TRANSFER"
+    assert robot.journal.pending()["interrupted"] == job["interrupted"]
+
+
+def test_resume_places_the_plate_after_a_restart(tmp_path, connect, simulator, power_off_before):
+    path = str(tmp_path / "journal.json")
+    robot = connect()
+    robot.journal = StepJournal(path)
+    power_off_before(robot, "place")
+    robot.transfer(sealer, peeler)
+    assert robot.robot_warning == "TRANSFER INTERRUPTED"
+
+    restarted = connect()
+    restarted.journal = StepJournal(path)
+    assert restarted.journal.remaining_steps() == [["place", robot.journal.remaining_steps()[0][1]]]
+
+    assert restarted.resume_transfer() is True
+    assert restarted.robot_warning == "CLEAR"
+    assert restarted.journal.pending() is None
+    assert not simulator.holding_plate
+    assert simulator.joints[5] == pytest.approx(peeler[5])
+    with open(path) as f:
+        assert json.load(f) == {"job": None}
+
+
+def test_resume_repeats_a_pick_that_did_not_take_place(robot, simulator, power_off_before):
+    power_off_before(robot, "pick")
+    robot.transfer(sealer, peeler)
+    assert robot.journal.pending()["completed"] == 0
+    assert not simulator.holding_plate
+
+    assert robot.resume_transfer() is True
+    assert robot.journal.pending() is None
+    assert simulator.joints[5] == pytest.approx(peeler[5])
+
+
+def test_discard_removes_the_job_without_moving(robot, simulator, power_off_before):
+    power_off_before(robot, "place")
+    robot.transfer(sealer, peeler)
+    joints = list(simulator.joints)
+    commands = simulator.commands
+
+    assert robot.resume_transfer(discard = True) is None
+    assert robot.journal.pending() is None
+    assert simulator.joints == joints
+    assert simulator.commands == commands
+    assert robot.journal.report()["recoveries"] == 0
+
+
+def test_resume_without_a_job(robot):
+    assert robot.resume_transfer() is None
+    assert robot.recover_transfer() is None
+
+
+def test_gripper_error_response_interrupts_the_transfer(robot, simulator):
+    run_transfer_step = robot.run_transfer_step
+
+    def run(step, location, rotation):
+        if step == "place":
+            simulator.inject_error("-1046", 2) # The state poll before the command gets the first one
+            robot.release_plate()
+        return run_transfer_step(step, location, rotation)
+
+    robot.run_transfer_step = run
+
+    assert robot.transfer(sealer, peeler) is False
+    assert robot.journal.pending()["error_code"] == "-1046"
+    assert "ReleasePlate" in robot.journal.pending()["reason"]
+
+
+def test_programming_error_in_a_step_is_not_journaled_as_an_interruption(robot):
+    def run(step, location, rotation):
+        raise AttributeError("bug")
+
+    robot.run_transfer_step = run
+
+    with pytest.raises(AttributeError):
+        robot.transfer(sealer, peeler)
+    assert robot.journal.pending()["interrupted"] is None
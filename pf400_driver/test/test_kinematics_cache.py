@@ -0,0 +1,85 @@
+import math
+
+import pytest
+
+from pf400_driver.pf400_kinematics_cache import KinematicsCache
+
+sealer = [201.128, -2.814, 264.373, 365.863, 79.144, 411.553]
+peeler = [225.521, -24.846, 244.836, 406.623, 80.967, 398.778]
+
+
+def test_hits_and_misses_are_counted_per_kind(robot):
+    first = robot.forward_kinematics(sealer)
+    round_trips = robot.transport.round_trips
+    assert robot.forward_kinematics(sealer) == first
+    assert robot.transport.round_trips == round_trips # The pose is not read again from the robot
+
+    robot.set_plate_rotation(sealer, 90)
+    robot.set_plate_rotation(sealer, 90)
+    stats = robot.kinematics_cache.stats()
+    assert stats["forward_kinematics"]["hits"] >= 1
+    assert stats["plate_rotation"] == {"hits": 1, "misses": 1, "hit_rate": 0.5}
+
+
+def test_callers_get_a_copy_of_the_cached_result(robot):
+    cartesian, phi, rail = robot.forward_kinematics(sealer)
+    cartesian[0] += 100
+    assert robot.forward_kinematics(sealer)[0][0] == pytest.approx(cartesian[0] - 100)
+
+
+def test_geometry_change_is_not_served_from_the_cache(robot):
+    before = robot.forward_kinematics(sealer)[0]
+    robot.shoulder_length += 10
+    after = robot.forward_kinematics(sealer)[0]
+
+    assert after[:2] != before[:2]
+    assert robot.kinematics_cache.stats()["forward_kinematics"]["misses"] == 2
+
+
+def test_failed_calculations_are_not_cached():
+    cache = KinematicsCache()
+    key = cache.key("inverse_kinematics", (302, 289, 162), [1.0, 2.0])
+
+    def unreachable():
+        return math.acos(2)
+
+    for _ in range(2):
+        with pytest.raises(ValueError):
+            cache.get(key, unreachable)
+    assert cache.stats() == {"inverse_kinematics": {"hits": 0, "misses": 2, "hit_rate": 0.0}, "entries": 0}
+
+
+def test_keys_round_to_the_quantum_and_old_entries_are_dropped():
+    cache = KinematicsCache(maxsize = 2, quantum = 0.01)
+    assert cache.key("kind", (), [1.0001]) == cache.key("kind", (), [1.0049])
+
+    for value in range(3):
+        cache.get(cache.key("kind", (), [value]), lambda: value)
+    assert cache.stats()["entries"] == 2
+    assert cache.get(cache.key("kind", (), [0]), lambda: "recalculated") == "recalculated"
+
+
+def test_disabled_cache_always_calculates():
+    cache = KinematicsCache()
+    cache.enabled = False
+    key = cache.key("kind", (), [1.0])
+
+    assert [cache.get(key, lambda: 1), cache.get(key, lambda: 2)] == [1, 2]
+    assert cache.stats() == {"entries": 0}
+
+
+def test_saved_entries_are_loaded_at_startup(robot, tmp_path):
+    path = str(tmp_path / "cache" / "kinematics.json")
+    robot.inverse_kinematics(*robot.forward_kinematics(peeler), reference_joints = peeler)
+    robot.kinematics_cache.save(path)
+
+    cache = KinematicsCache(path = path)
+    assert cache.stats()["entries"] == robot.kinematics_cache.stats()["entries"]
+    robot.kinematics_cache = cache
+    round_trips = robot.transport.round_trips
+    assert robot.forward_kinematics(peeler)[2] == peeler[5]
+    assert robot.transport.round_trips == round_trips
+    assert cache.stats()["forward_kinematics"] == {"hits": 1, "misses": 0, "hit_rate": 1.0}
+
+    (tmp_path / "broken.json").write_text("{")
+    assert KinematicsCache().load(str(tmp_path / "broken.json")) == 0
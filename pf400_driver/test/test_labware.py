@@ -0,0 +1,56 @@
+import json
+
+import pytest
+
+from pf400_driver.pf400_labware import get_labware, labware_types, load_labware
+
+sealer = [201.128, -2.814, 264.373, 365.863, 79.144, 411.553]
+peeler = [225.521, -24.846, 244.836, 406.623, 80.967, 398.778]
+
+
+def test_missing_parameters_come_from_the_default_type():
+    catalog = {"default": labware_types["default"], "short": {"lid_height": 3.0}}
+    labware = get_labware("short", catalog)
+
+    assert labware["name"] == "short"
+    assert labware["lid_height"] == 3.0
+    assert labware["grasp_width"] == labware_types["default"]["grasp_width"]
+    assert get_labware("unknown", catalog) is None
+
+
+def test_labware_file_extends_the_catalog(tmp_path):
+    path = tmp_path / "labware.json"
+    path.write_text(json.dumps({"reservoir": {"grasp_width": 120, "grasp_tolerance": 5}}))
+    catalog = load_labware(str(path))
+
+    assert catalog["reservoir"]["grasp_width"] == 120
+    assert "reservoir" not in labware_types
+
+
+def test_selected_type_sets_the_grasp(robot, simulator):
+    assert robot.set_labware("pcr_96")
+    assert robot.plate_width == 122
+    assert robot.sample_above_height == labware_types["pcr_96"]["above_height"]
+
+    robot.grasp_labware()
+    assert simulator.joints[4] == pytest.approx(122)
+    assert robot.plate_state == 1
+
+
+@pytest.mark.parametrize("labware, grasps", [("default", 1), ("96_well", 1), ("uncalibrated", 44)])
+def test_only_the_uncalibrated_type_searches_the_width(robot, simulator, labware, grasps):
+    simulator.grasp_success = 0.0
+    grasp_commands = robot.transport.counts.get("graspplate", 0)
+
+    assert robot.transfer(sealer, peeler, labware = labware) is False
+    assert robot.robot_warning == "MISSING PLATE"
+    assert robot.transport.counts["graspplate"] - grasp_commands == grasps
+
+
+def test_unknown_type_refuses_the_job(robot, simulator):
+    joints = list(simulator.joints)
+
+    assert robot.transfer(sealer, peeler, labware = "unknown") is False
+    assert robot.robot_warning == "UNKNOWN LABWARE"
+    assert robot.labware["name"] == "default"
+    assert simulator.joints == joints
@@ -0,0 +1,74 @@
+import pytest
+
+from pf400_driver.pf400_layout_optimizer import LayoutOptimizer, trace_frequencies, workflow_frequencies
+
+frequencies = {("Sealer", "Peeler"): 10, ("Peeler", "Hidex"): 5}
+
+
+def placed(proposal):
+    return {module: int(slot) for slot, module in proposal["module_list"].items() if module != "None"}
+
+
+def test_proposals_are_ranked_and_allowed():
+    optimizer = LayoutOptimizer(frequencies)
+    report = optimizer.optimize()
+
+    assert report["search"] == "exhaustive"
+    assert report["modules"] == ["Hidex", "Peeler", "Sealer"]
+    times = [proposal["expected_transfer_seconds"] for proposal in report["proposals"]]
+    assert times == sorted(times)
+    assert times[0] <= report["average_transfer_seconds"]
+    for proposal in report["proposals"]:
+        layout = placed(proposal)
+        assert sorted(layout) == report["modules"]
+        assert all(optimizer.allowed(module, slot) for module, slot in layout.items())
+        assert proposal["expected_transfer_seconds"] == pytest.approx(optimizer.expected_time(layout), abs = 1e-3)
+
+
+def test_best_layout_is_no_slower_than_the_current_one():
+    optimizer = LayoutOptimizer(frequencies)
+    current = {"Sealer": 4, "Peeler": 1, "Hidex": 3}
+    report = optimizer.optimize(current = current)
+
+    assert report["current_transfer_seconds"] == pytest.approx(optimizer.expected_time(current), abs = 1e-3)
+    assert report["proposals"][0]["predicted_throughput_gain"] >= 0.0
+
+
+def test_unreachable_current_layout_has_no_time():
+    optimizer = LayoutOptimizer(frequencies)
+    assert optimizer.module_location("Hidex", 8) is None
+
+    report = optimizer.optimize(current = {"Sealer": 1, "Peeler": 4, "Hidex": 8})
+    assert report["current_transfer_seconds"] is None
+
+
+def test_fixed_module_stays_in_its_slot():
+    report = LayoutOptimizer({("Sealer", "Peeler"): 10}, fixed = {"Sealer": 4}).optimize()
+
+    for proposal in report["proposals"]:
+        assert placed(proposal)["Sealer"] == 4
+
+
+def test_swap_search_finds_the_exhaustive_optimum():
+    optimizer = LayoutOptimizer(frequencies)
+    exhaustive = optimizer.optimize(proposals = 1)
+    swap = optimizer.optimize(proposals = 1, exhaustive_limit = 1, restarts = 50)
+
+    assert swap["search"] == "swap"
+    assert swap["proposals"][0]["expected_transfer_seconds"] == pytest.approx(exhaustive["proposals"][0]["expected_transfer_seconds"])
+
+
+def test_invalid_modules():
+    with pytest.raises(ValueError):
+        LayoutOptimizer({("Sealer", "Unknown"): 1})
+
+
+def test_frequencies():
+    workflow = {"steps": [{"module": "Sealer"}, {"module": "Peeler"}, {"module": "Sealer"}, {"module": "Peeler"}]}
+    assert workflow_frequencies(workflow) == {("Sealer", "Peeler"): 2, ("Peeler", "Sealer"): 1}
+
+    locations = {"Sealer": [0.0] * 6, "Peeler": [100.0] * 6}
+    records = [{"action": "transfer", "args": {"source_loc": [1.0] * 6, "target_loc": [99.0] * 6}},
+               {"action": "transfer", "args": {"source_loc": [50.0] * 6, "target_loc": [99.0] * 6}},
+               {"action": "remove_lid", "args": {}}]
+    assert trace_frequencies(records, locations) == ({("Sealer", "Peeler"): 1}, 1)
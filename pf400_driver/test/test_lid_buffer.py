@@ -0,0 +1,112 @@
+import json
+
+from pf400_driver.pf400_lid_buffer import LidBuffer
+
+deck = [150.0, 0.0, 180.0, 540.0, 77.0, 0.0]
+rotation_deck = [150.0, 10.0, 180.0, 540.0, 77.0, 100.0]
+left = [150.0, 0.0, 180.0, 540.0, 77.0, -600.0]
+right = [150.0, 0.0, 180.0, 540.0, 77.0, 600.0]
+
+
+def test_nearest_free_slot_is_allocated():
+    buffer = LidBuffer([left, deck, right])
+
+    assert buffer.allocate("plate 1", 500.0) == right
+    assert buffer.allocate("plate 2", 500.0) == deck
+    assert buffer.allocate("plate 3", 500.0) == left
+    assert buffer.allocate("plate 4", 500.0) is None
+    assert buffer.free_slots() == []
+
+
+def test_plate_with_a_parked_lid_is_refused():
+    buffer = LidBuffer([left, right])
+
+    assert buffer.allocate("plate 1") is not None
+    assert buffer.allocate("plate 1") is None
+    assert len(buffer.free_slots()) == 1
+
+
+def test_blocking_slot_is_used_last():
+    buffer = LidBuffer([rotation_deck, left], blocked = [rotation_deck])
+
+    assert buffer.allocate("plate 1", 100.0) == left
+    assert not buffer.blocks(rotation_deck)
+    assert buffer.allocate("plate 2", 100.0) == rotation_deck
+    assert buffer.blocks(rotation_deck)
+    assert not buffer.blocks(rotation_deck, ignore = ("plate 2",))
+
+
+def test_lookup_and_release():
+    buffer = LidBuffer([left, right])
+    buffer.allocate("plate 1", -600.0)
+    buffer.allocate("plate 2", -600.0)
+
+    assert buffer.lookup("plate 2") == right
+    assert buffer.lookup("plate 3") is None
+    buffer.release("plate 1")
+    assert buffer.lookup("plate 1") is None
+    assert buffer.free_slots() == [0]
+
+
+def test_plate_without_an_id():
+    buffer = LidBuffer([left, right])
+
+    assert buffer.resolve(None) is None
+    assert buffer.lookup(None) is None
+
+    buffer.allocate("plate 1")
+    assert buffer.resolve(None) == "plate 1"
+    assert buffer.lookup(None) == left
+
+    buffer.allocate("plate 2")
+    assert buffer.resolve(None) is None
+    assert buffer.lookup(None) is None
+
+    buffer.allocate(None)
+    assert buffer.resolve(None) is None
+    assert buffer.lookup(None) is None
+    buffer.release("plate 1")
+    buffer.release("plate 2")
+    buffer.allocate(None)
+    assert buffer.lookup(None) == left
+
+
+def test_parked_lids_are_persisted(tmp_path):
+    path = str(tmp_path / "lid_buffer.json")
+    buffer = LidBuffer([left, right], path = path)
+    buffer.allocate("plate 1", 600.0)
+    buffer.allocate(None, 600.0)
+
+    restarted = LidBuffer([left, right], path = path)
+    assert restarted.lookup("plate 1") == right
+    assert restarted.status()["parked"] == {"plate 1": 1, "None": 0}
+
+    restarted.release("plate 1")
+    with open(path) as f:
+        assert json.load(f) == {"parked": [[None, 0]]}
+    assert not (tmp_path / "lid_buffer.json.tmp").exists()
+
+
+def test_missing_slot_after_a_restart_is_not_guessed(tmp_path):
+    path = str(tmp_path / "lid_buffer.json")
+    LidBuffer([left, right], path = path).allocate("plate 1", 600.0)
+
+    assert LidBuffer([left], path = path).lookup("plate 1") is None
+
+
+def test_lid_jobs_report_their_result(robot, simulator):
+    plate = [201.128, -2.814, 264.373, 365.863, 79.144, 411.553]
+
+    assert robot.remove_lid(plate, plate_id = "plate 1") is True
+    assert robot.lid_buffer.lookup("plate 1") == robot.plate_lid_deck
+    assert robot.remove_lid(plate, plate_id = "plate 2") is False
+    assert robot.robot_warning == "LID BUFFER FULL"
+
+    joints = list(simulator.joints)
+    assert robot.replace_lid(plate, plate_id = "plate 2") is False
+    assert robot.robot_warning == "MISSING LID"
+    assert simulator.joints == joints
+
+    assert robot.replace_lid(plate, plate_id = "plate 1") is True
+    assert robot.robot_warning == "CLEAR"
+    assert robot.lid_buffer.lookup("plate 1") is None
@@ -0,0 +1,67 @@
+import time
+
+import pytest
+
+from pf400_driver.pf400_prepositioner import Prepositioner
+from pf400_driver.pf400_simulator import PF400Simulator, SimulatorTransport
+
+sealer = [201.128, -2.814, 264.373, 365.863, 79.144, 411.553]
+peeler = [225.521, -24.846, 244.836, 406.623, 80.967, 398.778]
+far = [225.521, -24.846, 244.836, 406.623, 80.967, 900.0]
+
+
+def test_prediction_needs_a_clear_majority():
+    prepositioner = Prepositioner(robot = None)
+    prepositioner.record(sealer, peeler)
+    prepositioner.record(sealer, peeler)
+    assert prepositioner.predict() is None # One job followed the peeler so far
+
+    prepositioner.record(sealer, peeler)
+    assert prepositioner.predict() == sealer
+
+    prepositioner.record(far, peeler)
+    prepositioner.record(far, peeler)
+    assert prepositioner.predict() is None # A tie is not a prediction
+
+
+def test_claimed_station_keeps_the_moves(robot, simulator):
+    prepositioner = Prepositioner(robot)
+    assert prepositioner.start(far)
+    prepositioner.thread.join()
+
+    assert simulator.joints[5] == pytest.approx(far[5])
+    assert prepositioner.claim(far) > 0
+    assert prepositioner.report()["hits"] == 1
+    assert prepositioner.report()["completed"] == 1
+    assert prepositioner.claim(far) is None # Claimed once
+
+
+def test_job_for_another_station_halts_the_moves(connect):
+    simulator = PF400Simulator(time_scale = 1.0)
+    robot = connect(transport = SimulatorTransport(simulator))
+    prepositioner = Prepositioner(robot)
+    assert prepositioner.start(far)
+    time.sleep(0.3)
+
+    start = time.time()
+    saved = prepositioner.claim(peeler)
+    assert time.time() - start < 1.0
+    assert not prepositioner.active()
+    assert simulator.handle("state") == "0 1"
+    assert simulator.joints[5] != pytest.approx(far[5])
+    assert saved is not None # A wrong prediction is counted even if it cost time
+    report = prepositioner.report()
+    assert (report["cancelled"], report["misses"], report["completed"]) == (1, 1, 0)
+    assert report["hit_rate"] == 0.0
+
+
+def test_job_without_a_location_only_cancels(robot):
+    prepositioner = Prepositioner(robot)
+    assert prepositioner.start(far)
+    assert prepositioner.claim(None) is None
+    assert not prepositioner.active()
+    assert prepositioner.report()["misses"] == 0
+
+    prepositioner.enabled = False
+    assert not prepositioner.start(far)
+    assert prepositioner.claim(far) is None
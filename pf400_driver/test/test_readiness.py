@@ -0,0 +1,73 @@
+import time
+
+from pf400_driver.pf400_readiness import ReadinessCache
+from pf400_driver.pf400_telemetry import TelemetryRecorder
+
+sealer = [201.128, -2.814, 264.373, 365.863, 79.144, 411.553]
+peeler = [225.521, -24.846, 244.836, 406.623, 80.967, 398.778]
+
+
+def test_known_good_state_skips_the_state_queries(robot):
+    queries = robot.transport.counts["hp"]
+    assert robot.transfer(sealer, peeler) is True
+    assert robot.transfer(peeler, sealer) is True
+
+    assert robot.transport.counts["hp"] == queries
+    assert robot.readiness.stats()["hits"] == 2
+
+
+def test_only_a_full_state_check_confirms(robot):
+    robot.readiness.invalidate("test")
+    robot.get_robot_movement_state()
+    assert robot.movement_state == 1
+    assert not robot.readiness.valid() # A movement state poll cannot see a fault
+
+    assert robot.get_overall_state() == 0
+    assert robot.readiness.valid()
+
+
+def test_window_expires():
+    readiness = ReadinessCache(window = 0.05)
+    readiness.confirm()
+    assert readiness.valid()
+    time.sleep(0.1)
+    assert not readiness.valid()
+
+    readiness.enabled = False
+    readiness.confirm()
+    assert not readiness.valid()
+    assert readiness.stats()["hit_rate"] == round(1 / 3, 4)
+
+
+def test_error_and_power_off_invalidate(robot, simulator):
+    simulator.inject_error("-1012")
+    robot.send_command("wherej")
+    assert not robot.readiness.valid()
+    assert robot.readiness.stats()["invalidations"]["error -1012"] == 1
+
+    robot.get_overall_state()
+    simulator.power_off()
+    robot.get_robot_movement_state()
+    assert robot.readiness.stats()["invalidations"]["power off"] == 1
+
+    queries = robot.transport.counts["hp"]
+    assert robot.transfer(sealer, peeler) is True # Initialized again before the transfer
+    assert robot.transport.counts["hp"] > queries
+    assert simulator.power
+
+
+def test_status_port_samples_invalidate_the_command_connection(robot, connect, simulator):
+    status = connect(initialize = False)
+    recorder = TelemetryRecorder(status, readiness = robot.readiness)
+    recorder.sample()
+    assert robot.readiness.valid()
+
+    simulator.inject_error("-1012")
+    recorder.sample()
+    assert not robot.readiness.valid()
+
+    robot.get_overall_state()
+    simulator.power_off()
+    recorder.sample()
+    assert not robot.readiness.valid()
+    assert robot.readiness.stats()["invalidations"] == {"connect": 1, "error -1012": 1, "power off": 1}
@@ -0,0 +1,72 @@
+from pf400_driver.pf400_recovery import RecoveryEngine, recovery_policies
+
+sealer = [201.128, -2.814, 264.373, 365.863, 79.144, 411.553]
+peeler = [225.521, -24.846, 244.836, 406.623, 80.967, 398.778]
+
+
+def test_policy_lookup():
+    engine = RecoveryEngine(None, {"-1039": {"action": "rehome", "retries": 1, "backoff": 0.0}})
+
+    assert engine.policy("-1046")["action"] == "reinitialize"
+    assert engine.policy(-1009)["action"] == "reattach"
+    assert engine.policy("timeout") == recovery_policies["timeout"]
+    assert engine.policy("-9999") == recovery_policies["default"]
+    assert engine.policy("-1039")["action"] == "rehome"
+    assert recovery_policies["-1039"]["action"] == "abort"
+
+
+def test_abort_policy_is_only_counted_as_unhandled(robot, simulator):
+    commands = simulator.commands
+
+    assert robot.recovery.recover("-1040") is False
+    assert robot.recovery.recover("-9999") is False
+    assert robot.recovery.unhandled == {"-1040": 1, "-9999": 1}
+    assert robot.recovery.report() == {}
+    assert simulator.commands == commands
+
+
+def test_disabled_engine_runs_no_policy(robot):
+    robot.recovery.enabled = False
+
+    assert robot.recovery.recover("-1009") is False
+    assert robot.recovery.unhandled == {"-1009": 1}
+    assert robot.recovery.report() == {}
+
+
+def test_reattach_after_detach(robot, simulator):
+    simulator.detach()
+
+    assert robot.recovery.recover("-1009") is True
+    assert simulator.attached
+    report = robot.recovery.report()["-1009"]
+    assert report["faults"] == 1
+    assert report["recovered"] == 1
+    assert report["attempts"] == 1
+    assert report["mttr"] >= 0.0
+
+
+def test_failed_operation_uses_every_retry(robot):
+    calls = []
+
+    def operation():
+        calls.append(True)
+        return False
+
+    assert robot.recovery.recover("-2806", operation) is False
+    assert len(calls) == recovery_policies["-2806"]["retries"]
+    report = robot.recovery.report()["-2806"]
+    assert report["aborted"] == 1
+    assert report["mttr"] is None
+
+
+def test_recover_transfer_after_power_off(robot, simulator, power_off_before):
+    power_off_before(robot, "place")
+    robot.transfer(sealer, peeler)
+    assert robot.robot_warning == "TRANSFER INTERRUPTED"
+
+    assert robot.recover_transfer() is True
+    assert robot.journal.pending() is None
+    assert simulator.power
+    assert not simulator.holding_plate
+    assert robot.recovery.report()["-1046"]["recovered"] == 1
+    assert robot.journal.report()["recoveries"] == 1
@@ -0,0 +1,78 @@
+import json
+
+import pytest
+
+from pf400_driver.errors import CommandException
+from pf400_driver.pf400_simulator import SimulatorTransport
+from pf400_driver.pf400_transport import RecordingTransport, ReplayTransport
+
+sealer = [201.128, -2.814, 264.373, 365.863, 79.144, 411.553]
+peeler = [225.521, -24.846, 244.836, 406.623, 80.967, 398.778]
+
+
+def write_recording(path, *sessions):
+    with open(path, "w") as f:
+        for index, entries in enumerate(sessions):
+            f.write(json.dumps({"session": float(index), "host": None, "port": None}) + "\n")
+            for command, response in entries:
+                f.write(json.dumps({"time": 0.0, "rtt": 0.0, "command": command, "response": response}) + "\n")
+
+
+def test_responses_follow_the_replay_position(tmp_path):
+    path = str(tmp_path / "recording.jsonl")
+    write_recording(path, [("state", "0 1"), ("movej 1", "0"), ("state", "0 2"), ("state", "0 1"), ("wherej", "0 1 2 3 4 5 6")])
+    replay = ReplayTransport(path)
+
+    assert replay.exchange("state") == "0 1"
+    assert replay.exchange("wherej") == "0 1 2 3 4 5 6" # Skips ahead to the next recorded wherej
+    assert replay.exchange("state") == "0 1" # Wraps to the start of the recording
+    assert replay.wraps == 1
+    assert replay.exchange("movej 1") == "0"
+    assert replay.exchange("state") == "0 2"
+    assert replay.misses == 0
+
+
+def test_unrecorded_commands_and_no_loop(tmp_path):
+    path = str(tmp_path / "recording.jsonl")
+    write_recording(path, [("state", "0 1"), ("state", "0 2")])
+    replay = ReplayTransport(path, loop = False)
+
+    assert replay.exchange("halt") == "0"
+    assert replay.exchange("state") == "0 1"
+    assert replay.exchange("state") == "0 2"
+    assert replay.exchange("state") == "0 2" # Last response before the replay position
+    assert replay.misses == 2
+
+    with pytest.raises(CommandException):
+        ReplayTransport(path, strict = True).exchange("halt")
+
+
+def test_session_selection(tmp_path):
+    path = str(tmp_path / "recording.jsonl")
+    write_recording(path, [("state", "0 1")], [("state", "0 2")])
+
+    assert ReplayTransport(path).exchange("state") == "0 2"
+    assert ReplayTransport(path, session = 0).exchange("state") == "0 1"
+
+    empty = tmp_path / "empty.jsonl"
+    empty.write_text("")
+    with pytest.raises(ValueError):
+        ReplayTransport(str(empty))
+
+
+def test_recorded_transfer_replays_without_the_robot(connect, simulator, tmp_path):
+    path = str(tmp_path / "recording.jsonl")
+    recording = RecordingTransport(SimulatorTransport(simulator), path)
+    robot = connect(transport = recording)
+    assert robot.transfer(sealer, peeler) is True
+    robot.disconnect()
+
+    replay = ReplayTransport(path)
+    replayed = connect(transport = replay)
+    commands = simulator.commands
+
+    assert replayed.transfer(sealer, peeler) is True
+    assert replayed.robot_warning == "CLEAR"
+    assert replay.misses == 0
+    assert replay.counts["movej"] == recording.counts["movej"]
+    assert simulator.commands == commands
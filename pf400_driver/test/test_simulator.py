@@ -0,0 +1,101 @@
+import time
+
+import pytest
+
+from pf400_driver.pf400_simulator import PF400Simulator
+
+
+def test_queries_use_the_robot_response_formats(simulator):
+    assert simulator.handle("state") == "0 1"
+    assert simulator.handle("hp") == "0 1"
+    assert simulator.handle("attach") == "0 1"
+    assert simulator.handle("pd 2800") == "0 1"
+    assert simulator.handle("sysState") == "0 21"
+    assert simulator.handle("wherej") == "0 400.000 1.400 177.101 537.107 77.000 0.000"
+    assert simulator.handle("jump") == "-2805"
+    assert simulator.handle("movej 1 1 2") == "-2800"
+
+
+def test_motions_need_power_and_attach(simulator):
+    target = "movej 1 300 1.4 177.101 537.107 77 0"
+    simulator.detach()
+    assert simulator.handle(target) == "-1009"
+    assert simulator.handle("sysState") == "0 7"
+
+    simulator.power_off()
+    assert simulator.handle("state") == "0 0"
+    assert simulator.handle(target) == "-1046"
+    assert simulator.handle("attach 1") == "-1046"
+
+    assert simulator.handle("hp 1") == "0"
+    assert simulator.handle("attach 1") == "0"
+    assert simulator.handle(target) == "0"
+    assert simulator.joints[0] == 300.0
+
+
+def test_motion_time_follows_the_sent_profile(simulator):
+    target = [300.0, 1.4, 177.101, 537.107, 77.0, 0.0]
+    expected = simulator.motion_model.move_time(simulator.joints, target, 1) - simulator.motion_model.command_time
+    simulator.handle("movej 1 " + " ".join(str(value) for value in target))
+    assert simulator.motion_time == pytest.approx(expected)
+
+    slow = "Profile 1 10 0 10 10 0.1 0.1 0 0"
+    assert simulator.handle(slow) == "0"
+    simulator.handle("movej 1 400 1.4 177.101 537.107 77 0")
+    assert simulator.motion_time - expected > expected
+
+
+def test_second_motion_waits_for_the_first():
+    simulator = PF400Simulator(time_scale = 1.0)
+    simulator.handle("moveoneaxis 6 200 1")
+    assert simulator.handle("state") in ("0 2", "0 3")
+    duration = simulator.motion_end - time.time()
+
+    start = time.time()
+    simulator.handle("moveoneaxis 6 0 1")
+    assert time.time() - start == pytest.approx(duration, abs = 0.1)
+    simulator.halt_motion()
+    assert simulator.handle("state") == "0 1"
+
+
+def test_cartesian_move_returns_to_the_reported_pose(simulator):
+    pose = simulator.handle("wherec").split(" ")[1:]
+    simulator.handle("movej 1 300 20 160 520 77 0")
+    assert simulator.handle("wherec").split(" ")[1:] != pose
+    assert simulator.handle("movec 1 " + " ".join(pose[:6])) == "0"
+    assert [float(value) for value in simulator.handle("wherec").split(" ")[1:]] == pytest.approx([float(value) for value in pose], abs = 2e-3)
+
+
+def test_grasp_and_injected_faults():
+    simulator = PF400Simulator(grasp_success = 0.0)
+    assert simulator.handle("GraspPlate 123 100 10") == "0 0"
+    simulator.grasp_success = 1.0
+    assert simulator.handle("GraspPlate 123 100 10") == "0 -1"
+    assert simulator.holding_plate
+    assert simulator.handle("ReleasePlate 130 100") == "0"
+    assert not simulator.holding_plate
+
+    simulator.inject_error("-3122", 2)
+    assert [simulator.handle("wherej") for _ in range(2)] == ["-3122", "-3122"]
+    assert simulator.handle("wherej").startswith("0 ")
+
+
+def test_random_faults_repeat_with_the_seed():
+    def responses(seed):
+        simulator = PF400Simulator(fault_rate = 0.5, seed = seed)
+        return [simulator.handle("hp") for _ in range(50)]
+
+    assert responses(3) == responses(3)
+    assert set(responses(3)) == {"0 1", "-1046", "-1012", "-3100"}
+    assert all(PF400Simulator(fault_rate = 0.5).handle("state") == "0 1" for _ in range(20)) # Queries of the state are never faulted
+
+
+def test_transfer_moves_the_plate(robot, simulator):
+    source = [201.128, -2.814, 264.373, 365.863, 79.144, 411.553]
+    target = [225.521, -24.846, 244.836, 406.623, 80.967, 398.778]
+
+    assert robot.transfer(source, target) is True
+    assert simulator.joints[5] == pytest.approx(target[5])
+    assert not simulator.holding_plate
+    assert robot.transport.counts["graspplate"] == 1
+    assert robot.transport.counts["releaseplate"] == 1
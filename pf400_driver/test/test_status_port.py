@@ -0,0 +1,21 @@
+from pf400_driver.pf400_driver import PF400
+from pf400_driver.pf400_simulator import SimulatorTransport
+
+
+def test_read_only_status_connection_keeps_the_power_off(simulator):
+    simulator.power_off()
+
+    status = PF400("127.0.0.1", 10000, transport = SimulatorTransport(simulator), settle_scale = 0, initialize = False)
+
+    assert not simulator.power
+    assert status.movement_state == 0
+    assert status.transport.counts.get("hp", 0) == 0
+    assert "gripopenpos" not in status.transport.counts
+
+
+def test_status_connection_enables_the_power_by_default(simulator):
+    simulator.power_off()
+
+    PF400("127.0.0.1", 10000, transport = SimulatorTransport(simulator), settle_scale = 0)
+
+    assert simulator.power
@@ -0,0 +1,61 @@
+import pytest
+
+from pf400_driver.pf400_trace import analyze_records, load_records
+
+sealer = [201.128, -2.814, 264.373, 365.863, 79.144, 411.553]
+peeler = [225.521, -24.846, 244.836, 406.623, 80.967, 398.778]
+
+
+def record(action, start, duration, steps, status = "ok", wait = 0.0):
+    return {"action": action, "robot": "pf400", "start": start, "duration": duration, "status": status,
+            "args": {}, "grasp_attempts": 1, "wait": wait, "steps": steps}
+
+
+def step(name, depth, duration):
+    return {"name": name, "depth": depth, "start": 0.0, "duration": duration, "wait": 0.0}
+
+
+def test_transfer_writes_one_record_with_its_steps(robot, tmp_path):
+    path = str(tmp_path / "trace.jsonl")
+    robot.trace.start(path)
+    robot.transfer(sealer, peeler)
+    robot.trace.stop()
+    robot.transfer(peeler, sealer)
+
+    records = load_records([path])
+    assert len(records) == 1
+    transfer = records[0]
+    assert transfer["action"] == "transfer"
+    assert transfer["status"] == "ok"
+    assert transfer["args"]["source_loc"] == sealer
+    assert transfer["grasp_attempts"] == 1
+    names = [entry["name"] for entry in transfer["steps"]]
+    assert "pick_plate" in names and "place_plate" in names
+    assert all(entry["duration"] <= transfer["duration"] for entry in transfer["steps"])
+
+
+def test_refused_action_records_its_warning(robot, tmp_path):
+    path = str(tmp_path / "trace.jsonl")
+    robot.trace.start(path)
+    robot.transfer(sealer, peeler, labware = "unknown")
+
+    assert load_records([path])[0]["status"] == "UNKNOWN LABWARE"
+
+
+def test_analysis_splits_self_time_and_idle_time():
+    records = [record("transfer", 100.0, 10.0, [step("pick_plate", 0, 4.0), step("grab_plate", 1, 1.0), step("place_plate", 0, 5.0)], wait = 2.0),
+               record("transfer", 120.0, 8.0, [step("pick_plate", 0, 8.0)], status = "MISSING PLATE"),
+               record("transfer", 5000.0, 8.0, [step("pick_plate", 0, 8.0)])]
+    analysis = analyze_records(records)
+
+    cycle = analysis["cycle_times"]["transfer"]
+    assert (cycle["count"], cycle["failed"], cycle["max"]) == (3, 1, 10.0)
+    pareto = {entry["step"]: entry for entry in analysis["pareto"]}
+    assert pareto["pick_plate"]["total"] == pytest.approx(3.0 + 8.0 + 8.0)
+    assert pareto["grab_plate"]["total"] == pytest.approx(1.0)
+    assert analysis["pareto"][-1]["cumulative"] == pytest.approx(1.0)
+    breakdown = analysis["breakdown"]
+    assert breakdown["wait"] == pytest.approx(2.0)
+    assert breakdown["motion"] == pytest.approx(9.0 - 2.0 + 8.0 + 8.0)
+    assert breakdown["overhead"] == pytest.approx(1.0)
+    assert breakdown["idle"] == pytest.approx(10.0) # The gap to the next day is not idle time
@@ -0,0 +1,139 @@
+import socket
+import threading
+import time
+
+import pytest
+
+from pf400_driver.errors import CommandException, TimeoutException
+from pf400_driver.pf400_driver import PF400
+from pf400_driver.pf400_simulator import SimulatorTransport
+from pf400_driver.pf400_transport import SocketTransport, TelnetTransport
+
+
+def connect_server(server, transport_class):
+    host, port = server.server_address
+    robot = PF400(host, 10100, transport = transport_class(host, port), settle_scale = 0)
+    robot.command_timeout = 0.3
+    return robot
+
+
+class SlowHomeTransport(SimulatorTransport):
+    """
+    Answers home after the given seconds, like a controller that homes the joints before it replies.
+    """
+
+    def __init__(self, simulator, home_time:float):
+        super().__init__(simulator)
+        self.home_time = home_time
+
+    def exchange(self, command:str, timeout:float = None):
+        if command.lower().startswith("home"):
+            time.sleep(self.home_time)
+        return super().exchange(command, timeout)
+
+
+def robot_socket(robot):
+    if isinstance(robot.transport, TelnetTransport):
+        return robot.transport.connection.get_socket()
+    return robot.transport.socket
+
+
+@pytest.mark.parametrize("transport_class", [TelnetTransport, SocketTransport])
+def test_dropped_link_reconnects_on_the_next_query(server, transport_class):
+    robot = connect_server(server, transport_class)
+    joints = robot.get_joint_states()
+
+    robot_socket(robot).shutdown(socket.SHUT_RDWR)
+
+    assert robot.get_joint_states() == joints
+    assert robot.reconnects == 1
+    assert robot.link_errors == 1
+    assert not robot.link_lost
+
+
+@pytest.mark.parametrize("transport_class", [TelnetTransport, SocketTransport])
+def test_hung_query_times_out_and_is_sent_again(server, transport_class):
+    robot = connect_server(server, transport_class)
+    server.simulator.hang(0.4) # Ends during the reconnect
+
+    start = time.monotonic()
+    robot.get_robot_movement_state()
+
+    assert robot.movement_state == 1
+    assert robot.command_timeouts == 1
+    assert robot.reconnects == 1
+    assert time.monotonic() - start < 2.0
+
+
+def test_query_behind_a_long_command_is_not_a_dead_link(connect, simulator):
+    robot = connect(transport = SlowHomeTransport(simulator, 2.5))
+    robot.command_timeout = 0.5
+
+    home = threading.Thread(target = robot.send_raw_command, args = ("home", 5.0))
+    home.start()
+    time.sleep(0.1)
+    robot.get_robot_movement_state()
+    home.join()
+
+    assert robot.movement_state == 1
+    assert robot.command_timeouts == 0
+    assert robot.reconnects == 0
+
+
+def test_hung_controller_raises_and_reconnects_after_the_hang(robot, simulator):
+    robot.command_timeout = 0.2
+    simulator.hang(1.0)
+
+    with pytest.raises(TimeoutException):
+        robot.get_robot_movement_state()
+    assert robot.link_lost
+
+    time.sleep(1.0)
+    robot.get_robot_movement_state()
+    assert robot.movement_state == 1
+    assert not robot.link_lost
+
+
+def test_motion_past_its_deadline_is_halted(connect, simulator):
+    simulator.time_scale = 1.0
+    robot = connect()
+    robot.command_timeout = 0.1
+    robot.default_motion_time = 0.1
+
+    robot.move_one_joint(6, 900.0, 1)
+    with pytest.raises(TimeoutException):
+        robot.move_one_joint(6, 0.0, 1)
+    assert simulator.movement_state() == 1
+
+
+def test_cancel_stops_the_waiting_command(connect, simulator):
+    simulator.time_scale = 1.0
+    robot = connect()
+
+    robot.move_one_joint(6, 900.0, 1)
+    robot.cancel()
+    with pytest.raises(CommandException):
+        robot.move_one_joint(6, 0.0, 1)
+    assert simulator.movement_state() == 1
+
+    robot.cancelled.clear()
+    robot.move_one_joint(6, 100.0, 1)
+
+
+def test_cancelled_transfer_does_not_block_the_next_one(connect, simulator):
+    simulator.time_scale = 0.05
+    robot = connect()
+    source = [222.0, -38.068, 335.876, 325.434, 79.923, 995.062]
+    target = [201.128, -2.814, 264.373, 365.863, 79.144, 411.553]
+
+    canceller = threading.Timer(0.3, robot.cancel)
+    canceller.start()
+    assert robot.transfer(source, target) is False
+    canceller.join()
+
+    assert robot.robot_warning == "TRANSFER CANCELLED"
+    assert robot.journal.pending() is None
+
+    robot.cancelled.clear()
+    assert robot.transfer(target, source) is True
+    assert robot.robot_warning == "CLEAR"